@@ -1,11 +1,19 @@
 """Manim 代码生成 Agent"""
+import os
 import json
+import aiofiles
+from typing import Optional
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from models.script_model import Script
-from config import OPENAI_API_KEY, OPENAI_MODEL, OPENAI_API_BASE_URL
+from config import (
+    OPENAI_API_KEY, OPENAI_MODEL, OPENAI_API_BASE_URL, LLM_REQUEST_TIMEOUT,
+    MANIM_STREAMING, MANIM_STREAM_MAX_ATTEMPTS
+)
 from utils.logger import get_logger
-from utils.file_utils import load_file_content
+from utils.rate_limiter import get_rate_limiter
+from utils.validation import StreamingCodeValidator
+from utils.file_utils import load_file_content, ensure_dir
 
 logger = get_logger(__name__)
 
@@ -22,6 +30,8 @@ class ManimAgent:
             temperature=0.1,  # 极低温度，确保严格遵循剧本坐标，提高精确性
             api_key=OPENAI_API_KEY,
             base_url=OPENAI_API_BASE_URL,
+            timeout=LLM_REQUEST_TIMEOUT,
+            max_retries=0,  # 重试由全局限流器统一处理
             extra_body=extra_body
         )
         self.prompt_template = self._load_prompt_template()
@@ -37,9 +47,17 @@ class ManimAgent:
     async def generate(
         self, 
         script: Script, 
-        audio_durations: dict
+        audio_durations: dict,
+        output_path: Optional[str] = None
     ) -> str:
-        """生成 Manim 代码"""
+        """
+        生成 Manim 代码
+        
+        Args:
+            script: 剧本
+            audio_durations: 各片段音频时长
+            output_path: 流式模式下边生成边写入的代码文件路径（可选）
+        """
         logger.info(f"开始生成 Manim 代码: {script.title}")
         
         # 将 script 转换为 JSON 字符串
@@ -57,16 +75,70 @@ class ManimAgent:
             audio_durations=audio_durations_text
         )
         
-        # 调用 LLM（异步）
-        response = await self.llm.ainvoke(messages)
-        code = response.content
-        
-        # 提取代码块（如果有 markdown 代码块）
-        code = self._extract_code(code)
+        if MANIM_STREAMING:
+            code = await self._generate_streaming(messages, output_path)
+        else:
+            # 调用 LLM（异步，经全局限流器）
+            response = await get_rate_limiter().ainvoke(self.llm, messages)
+            code = response.content
+            
+            # 提取代码块（如果有 markdown 代码块）
+            code = self._extract_code(code)
         
         logger.info(f"Manim 代码生成完成，代码长度: {len(code)} 字符")
         return code
     
+    async def _generate_streaming(self, messages: list, output_path: Optional[str] = None) -> str:
+        """
+        流式生成 Manim 代码：边接收边写入文件，并增量校验
+        
+        发现输出跑偏（错误导入、多个 Scene、缺少 AUDIO_DURATIONS、语法错误）时提前中止并重试；
+        最后一次尝试不提前中止，完整输出后交由后续的执行/修复流程处理。
+        """
+        if output_path:
+            ensure_dir(os.path.dirname(output_path))
+        
+        text = ""
+        for attempt in range(1, MANIM_STREAM_MAX_ATTEMPTS + 1):
+            is_last_attempt = attempt == MANIM_STREAM_MAX_ATTEMPTS
+            validator = StreamingCodeValidator()
+            errors = []
+            
+            file = await aiofiles.open(output_path, 'w', encoding='utf-8') if output_path else None
+            stream = get_rate_limiter().astream(self.llm, messages)
+            try:
+                async for chunk in stream:
+                    if not isinstance(chunk.content, str):
+                        continue
+                    new_code = validator.feed(chunk.content)
+                    if new_code and file:
+                        await file.write(new_code)
+                        await file.flush()
+                    if not is_last_attempt:
+                        errors = validator.check()
+                        if errors:
+                            break
+            finally:
+                await stream.aclose()
+                if file:
+                    await file.close()
+            
+            text = validator.text
+            if not errors:
+                errors = validator.check(final=True)
+            if not errors:
+                return self._extract_code(text)
+            
+            if is_last_attempt:
+                logger.warning(f"流式生成的 Manim 代码未通过校验: {errors}，交由执行/修复流程处理")
+            else:
+                logger.warning(
+                    f"流式生成的 Manim 代码跑偏，提前中止并重试 "
+                    f"(第 {attempt}/{MANIM_STREAM_MAX_ATTEMPTS} 次): {errors}"
+                )
+        
+        return self._extract_code(text)
+    
     def _extract_code(self, text: str) -> str:
         """从文本中提取代码"""
         import re
@@ -4,8 +4,9 @@ import inspect
 from typing import Optional, Dict, Any
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
-from config import OPENAI_API_KEY, OPENAI_MODEL, OPENAI_API_BASE_URL
+from config import OPENAI_API_KEY, OPENAI_MODEL, OPENAI_API_BASE_URL, LLM_REQUEST_TIMEOUT
 from utils.logger import get_logger
+from utils.rate_limiter import get_rate_limiter
 from utils.file_utils import load_file_content
 
 logger = get_logger(__name__)
@@ -23,6 +24,8 @@ class ManimFixAgent:
             temperature=0.2,  # 更低温度，确保修复准确性
             api_key=OPENAI_API_KEY,
             base_url=OPENAI_API_BASE_URL,
+            timeout=LLM_REQUEST_TIMEOUT,
+            max_retries=0,  # 重试由全局限流器统一处理
             extra_body=extra_body
         )
         self.prompt_template = self._load_prompt_template()
@@ -165,8 +168,8 @@ class ManimFixAgent:
             api_info=api_info_text
         )
         
-        # 调用 LLM（异步）
-        response = await self.llm.ainvoke(messages)
+        # 调用 LLM（异步，经全局限流器）
+        response = await get_rate_limiter().ainvoke(self.llm, messages)
         fixed_code = response.content
         
         # 提取代码块（如果有 markdown 代码块）
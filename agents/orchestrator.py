@@ -1,6 +1,8 @@
 """主编排器（音频先行流程）"""
 import os
-from typing import Optional
+import time
+import asyncio
+from typing import Callable, Optional
 from agents.script_agent import ScriptAgent
 from agents.tts_agent import TTSAgent
 from agents.manim_agent import ManimAgent
@@ -9,13 +11,18 @@ from tools.tts_generator import TTSGenerator
 from tools.manim_executor import ManimExecutor
 from tools.video_splitter import VideoSplitter
 from tools.video_merger import VideoMerger
-from models.script_model import Script
+from tools.video_packager import VideoPackager
+from models.script_model import Script, Segment
 from utils.logger import get_logger
-from utils.file_utils import save_json, cleanup_segment_files, cleanup_directory, sanitize_filename, async_save_json, async_write_file
-from config import OUTPUT_SCRIPTS_DIR, OUTPUT_MANIM_CODE_DIR, TTS_OUTPUT_DIR, OUTPUT_VIDEO_SEGMENTS_DIR
+from utils.render_predictor import RenderTimePredictor, extract_code_features
+from utils.file_utils import save_json, cleanup_segment_files, cleanup_directory, sanitize_filename, async_save_json, async_write_file, get_task_temp_dir
+from config import OUTPUT_SCRIPTS_DIR, OUTPUT_MANIM_CODE_DIR, TTS_OUTPUT_DIR, OUTPUT_VIDEO_SEGMENTS_DIR, SCRIPT_STREAMING, PACKAGE_FORMAT, ENDING_PATH, TEMP_BASE_DIR
 
 logger = get_logger(__name__)
 
+# 主流程步骤总数
+TOTAL_STAGES = 8
+
 
 class VideoOrchestrator:
     """主编排器，实现音频先行策略"""
@@ -30,16 +37,53 @@ class VideoOrchestrator:
         self.manim_executor = ManimExecutor(task_id=task_id)
         self.video_splitter = VideoSplitter(task_id=task_id)
         self.video_merger = VideoMerger(task_id=task_id)
+        self.render_predictor = RenderTimePredictor()
+        self._progress_callback: Optional[Callable[[int, str], None]] = None
+    
+    def _report_stage(self, stage: int, description: str, label: Optional[str] = None) -> None:
+        """记录进入第 stage 个步骤，并通知进度回调（回调异常不影响主流程）"""
+        logger.info(f"步骤 {label or stage}/{TOTAL_STAGES}: {description}")
+        if self._progress_callback is None:
+            return
+        try:
+            self._progress_callback(stage, description)
+        except Exception as e:
+            logger.warning(f"进度回调失败: {e}")
+    
+    def _cleanup_partial_outputs(self, output_path: Optional[str]) -> None:
+        """删除被中止的任务留下的不完整文件（写了一半的最终视频、分块编码目录、Manim 渲染输出）"""
+        if output_path:
+            root = os.path.splitext(output_path)[0]
+            for path in (output_path, root + ".video_only.mp4"):
+                if os.path.exists(path):
+                    os.remove(path)
+                    logger.info(f"已删除不完整的文件: {path}")
+            cleanup_directory(root + "_chunks", force=True)
+        if self.task_id:
+            cleanup_directory(os.path.join(get_task_temp_dir(self.task_id, TEMP_BASE_DIR), "manim_media"), force=True)
     
     async def generate_video(
         self,
         formula: str,
         duration: int = 60,
         style: str = "3Blue1Brown",
-        task_id: Optional[str] = None
+        task_id: Optional[str] = None,
+        package_format: Optional[str] = None,
+        ending_path: Optional[str] = None,
+        progress_callback: Optional[Callable[[int, str], None]] = None
     ) -> dict:
-        """生成视频的主流程"""
+        """
+        生成视频的主流程
+        
+        Args:
+            package_format: 额外输出多码率版本（mp4 / hls / dash），None 时读取 PACKAGE_FORMAT，空字符串表示不打包
+            ending_path: 片尾视频，在最终合并时与各片段一起编码，None 时读取 ENDING_PATH，空字符串表示不加片尾
+            progress_callback: 进度回调 callback(步骤序号, 步骤描述)，每进入一个步骤调用一次（如任务队列记录当前阶段）
+        """
         logger.info(f"开始生成视频: {formula}")
+        self._progress_callback = progress_callback
+        started_at = time.monotonic()
+        partial_output_path = None
         
         # 如果提供了 task_id，使用它；否则使用实例的 task_id
         current_task_id = task_id if task_id is not None else self.task_id
@@ -60,47 +104,70 @@ class VideoOrchestrator:
             # 任务专属目录的清理由各个工具类负责，这里不需要全局清理
         else:
             logger.info("清理旧的中间文件（全局目录）...")
-            cleanup_segment_files(TTS_OUTPUT_DIR, "segment_*.mp3")
+            cleanup_segment_files(TTS_OUTPUT_DIR, "segment_*")
             cleanup_segment_files(OUTPUT_VIDEO_SEGMENTS_DIR, "segment_*.mp4")
             # 清理 Manim 临时输出目录（projectscene_temp）
             manim_temp_dir = os.path.join("media", "videos", "projectscene_temp")
             cleanup_directory(manim_temp_dir, force=True)
         
         try:
-            # 1. 生成剧本
-            logger.info("步骤 1/8: 生成剧本")
-            script = await self.script_agent.generate(formula, duration, style)
-            
-            # 保存剧本（异步）
-            script_path = f"{OUTPUT_SCRIPTS_DIR}/{sanitize_filename(script.title)}.json"
-            await async_save_json(script.model_dump(), script_path)
-            logger.info(f"剧本已保存: {script_path}")
-            
-            # 2. 生成 TTS 文案
-            logger.info("步骤 2/8: 生成 TTS 文案")
-            script = await self.tts_agent.convert_script(script)
-            
-            # 3. 【音频先行】立即生成音频，获取精确时长
-            logger.info("步骤 3/8: 生成音频（音频先行策略）")
-            script = await self.tts_generator.generate_all_segments(script)
+            if SCRIPT_STREAMING:
+                # 1-3. 流式生成剧本，每个片段完整后立即转换 TTS 文案并生成音频
+                script, script_path = await self._generate_script_and_audio_streaming(formula, duration, style)
+            else:
+                # 1. 生成剧本
+                self._report_stage(1, "生成剧本")
+                script = await self.script_agent.generate(formula, duration, style)
+                
+                # 保存剧本（异步）
+                script_path = f"{OUTPUT_SCRIPTS_DIR}/{sanitize_filename(script.title)}.json"
+                await async_save_json(script.model_dump(), script_path)
+                logger.info(f"剧本已保存: {script_path}")
+                
+                # 2. 生成 TTS 文案（融合模式下只为缺失/无效的片段兜底转换）
+                self._report_stage(2, "生成 TTS 文案")
+                script = await self.tts_agent.convert_script(script, only_missing=self.script_agent.fused_tts)
+                
+                # 3. 【音频先行】立即生成音频，获取精确时长
+                self._report_stage(3, "生成音频（音频先行策略）")
+                script = await self.tts_generator.generate_all_segments(script)
             
             logger.info(f"音频生成完成，各片段时长: {[f'{seg.audio_duration:.2f}s' for seg in script.segments]}")
             
             # 4. 将音频时长传给 Manim Agent
-            logger.info("步骤 4/8: 生成 Manim 代码")
+            self._report_stage(4, "生成 Manim 代码")
             audio_durations = {
                 f"audio_duration_{i+1}": seg.audio_duration 
                 for i, seg in enumerate(script.segments)
             }
-            manim_code = await self.manim_agent.generate(script, audio_durations)
+            code_path = f"{OUTPUT_MANIM_CODE_DIR}/{sanitize_filename(script.title)}.py"
+            manim_code = await self.manim_agent.generate(script, audio_durations, output_path=code_path)
             
             # 保存 Manim 代码（异步）
-            code_path = f"{OUTPUT_MANIM_CODE_DIR}/{sanitize_filename(script.title)}.py"
             await async_write_file(code_path, manim_code)
             logger.info(f"Manim 代码已保存: {code_path}")
             
+            # 代码生成后特征已完整，给出更准确的剩余耗时估计
+            package_format = PACKAGE_FORMAT if package_format is None else package_format
+            ending_path = ENDING_PATH if ending_path is None else ending_path
+            features = {
+                "target_duration": duration,
+                "audio_duration": script.get_total_duration(),
+                "segments": len(script.segments),
+                "quality": self.manim_executor.quality,
+                "package": bool(package_format),
+                "ending": bool(ending_path),
+                **extract_code_features(manim_code),
+            }
+            estimate = self.render_predictor.predict(features)
+            logger.info(
+                f"预计渲染 {estimate['render_seconds']:.0f}s，编码 {estimate['encode_seconds']:.0f}s"
+                f"（play 调用 {features['play_calls']} 个，MathTex {features['mathtex_count']} 个）"
+            )
+            
             # 5. 执行 Manim 代码（带错误修复）
-            logger.info("步骤 5/8: 执行 Manim 代码")
+            self._report_stage(5, "执行 Manim 代码")
+            render_started_at = time.monotonic()
             max_fix_attempts = 3  # 最多修复 3 次
             fix_attempt = 0
             video_path = None
@@ -167,39 +234,118 @@ class VideoOrchestrator:
             
             if video_path is None:
                 raise RuntimeError(f"Manim 执行失败: {last_error}")
+            render_seconds = time.monotonic() - render_started_at
             
             # 6. 切割视频片段
-            logger.info("步骤 6/8: 切割视频片段")
+            self._report_stage(6, "切割视频片段")
+            encode_started_at = time.monotonic()
             video_segments = await self.video_splitter.split_by_segments(video_path, script)
             logger.info(f"视频切割完成，共 {len(video_segments)} 个片段")
             
             # 7. 准备音频片段
-            logger.info("步骤 7/8: 准备音频片段")
+            self._report_stage(7, "准备音频片段")
             audio_segments = [
                 (seg.segment_id, seg.audio_path, seg.audio_duration)
                 for seg in script.segments
             ]
             
             # 8. 合并视频和音频
-            logger.info("步骤 8/8: 合并视频和音频")
+            self._report_stage(8, "合并视频和音频")
+            partial_output_path = os.path.join(self.video_merger.output_dir, sanitize_filename(script.title) + ".mp4")
             output_path = await self.video_merger.merge_with_freeze_frame(
                 video_segments, 
                 audio_segments, 
                 script, 
-                output_filename=sanitize_filename(script.title) + ".mp4"
+                output_filename=sanitize_filename(script.title) + ".mp4",
+                ending_path=ending_path or None
             )
+            partial_output_path = None  # 最终视频已完整写出，之后中止也保留
+
+            # 可选：一次解码输出多码率版本
+            package = None
+            if package_format:
+                logger.info(f"打包多码率版本: {package_format}")
+                package = await VideoPackager().package(output_path, package_format)
             
             total_duration = script.get_total_duration()
             logger.info(f"视频生成完成: {output_path}, 总时长: {total_duration:.2f}秒")
             
+            # 记录各阶段实际耗时（使用最终执行成功的代码的特征），供后续任务预测
+            features.update(extract_code_features(manim_code))
+            timings = {
+                "render_seconds": render_seconds,
+                "encode_seconds": time.monotonic() - encode_started_at,
+                "total_seconds": time.monotonic() - started_at,
+            }
+            self.render_predictor.record(features, timings)
+            
             return {
                 "video_path": output_path,
                 "script": script,
                 "total_duration": total_duration,
                 "script_path": script_path,
-                "code_path": code_path
+                "code_path": code_path,
+                "package": package,
+                "timings": timings
             }
             
+        except (asyncio.CancelledError, asyncio.TimeoutError, TimeoutError):
+            # 超过截止时间或被取消：子进程已由各工具结束，这里清理写了一半的文件
+            logger.warning(f"视频生成被中止（超时或取消）: {formula}")
+            self._cleanup_partial_outputs(partial_output_path)
+            raise
         except Exception as e:
             logger.error(f"视频生成失败: {e}", exc_info=True)
             raise
+    
+    async def _generate_script_and_audio_streaming(
+        self,
+        formula: str,
+        duration: int,
+        style: str
+    ) -> tuple[Script, str]:
+        """
+        流式剧本 + 逐片段 TTS（步骤 1-3 流水线化）
+        
+        剧本的每个片段一完整到达，就立即进行 TTS 文案转换和语音合成，
+        剧本流式输出结束时大部分音频已经生成完毕。
+        
+        Returns:
+            (剧本, 剧本保存路径)
+        """
+        self._report_stage(1, "流式生成剧本，逐片段生成 TTS 文案和音频", label="1-3")
+        self.tts_generator.cleanup_segments()
+        segment_tasks: list[asyncio.Task] = []
+        
+        async def prepare_segment_audio(segment: Segment) -> None:
+            # 融合模式下已有有效 tts_text 的片段无需再调用 TTS Agent
+            if not segment.tts_text:
+                await self.tts_agent.convert_segment(segment)
+            await self.tts_generator.generate_segment_audio(segment)
+            logger.info(f"片段 {segment.segment_id} 音频已生成: {segment.audio_duration:.2f}s")
+        
+        def on_segment(segment: Segment) -> None:
+            segment_tasks.append(asyncio.create_task(prepare_segment_audio(segment)))
+        
+        try:
+            script = await self.script_agent.generate_streaming(
+                formula, duration, style, on_segment=on_segment
+            )
+            
+            # 保存剧本（异步）
+            script_path = f"{OUTPUT_SCRIPTS_DIR}/{sanitize_filename(script.title)}.json"
+            await async_save_json(script.model_dump(), script_path)
+            logger.info(f"剧本已保存: {script_path}")
+            
+            pending_count = sum(1 for task in segment_tasks if not task.done())
+            logger.info(f"剧本流式输出结束，等待剩余 {pending_count}/{len(segment_tasks)} 个片段的音频")
+            await asyncio.gather(*segment_tasks)
+            await self.tts_generator.finalize_audio(script)
+        except BaseException:
+            # 任一环节失败时取消尚未完成的片段任务
+            for task in segment_tasks:
+                task.cancel()
+            await asyncio.gather(*segment_tasks, return_exceptions=True)
+            raise
+        
+        return script, script_path
@@ -1,10 +1,14 @@
 """视听剧本生成 Agent"""
 import json
+from typing import Callable, Optional
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from models.script_model import Script, Segment
-from config import OPENAI_API_KEY, OPENAI_MODEL, OPENAI_API_BASE_URL
+from config import OPENAI_API_KEY, OPENAI_MODEL, OPENAI_API_BASE_URL, LLM_REQUEST_TIMEOUT, SCRIPT_FUSED_TTS
 from utils.logger import get_logger
+from utils.rate_limiter import get_rate_limiter
+from utils.json_stream import IncrementalJSONArrayParser
+from utils.validation import TTSTextValidator
 from utils.file_utils import load_file_content
 
 logger = get_logger(__name__)
@@ -13,7 +17,12 @@ logger = get_logger(__name__)
 class ScriptAgent:
     """剧本生成 Agent"""
     
-    def __init__(self):
+    def __init__(self, fused_tts: Optional[bool] = None):
+        """
+        Args:
+            fused_tts: 是否在生成剧本的同时生成 tts_text（融合模式），默认读取 SCRIPT_FUSED_TTS 配置
+        """
+        self.fused_tts = SCRIPT_FUSED_TTS if fused_tts is None else fused_tts
         extra_body = {
             "enable_thinking": False
         }
@@ -22,6 +31,8 @@ class ScriptAgent:
             temperature=0.5,  # 降低温度以提高坐标和边界信息的精确性和一致性
             api_key=OPENAI_API_KEY,
             base_url=OPENAI_API_BASE_URL,
+            timeout=LLM_REQUEST_TIMEOUT,
+            max_retries=0,  # 重试由全局限流器统一处理
             extra_body=extra_body
         )
         self.prompt_template = self._load_prompt_template()
@@ -29,6 +40,9 @@ class ScriptAgent:
     def _load_prompt_template(self) -> ChatPromptTemplate:
         """加载 prompt 模板"""
         prompt_text = load_file_content("prompts/script_prompt.txt")
+        if self.fused_tts:
+            # 融合模式：要求同时输出 tts_text，省去单独的 TTS 文案转换调用
+            prompt_text += "\n\n" + load_file_content("prompts/script_tts_prompt.txt")
         return ChatPromptTemplate.from_messages([
             ("system", "你是一个专业的数学教学视频编剧。"),
             ("user", prompt_text)
@@ -50,8 +64,8 @@ class ScriptAgent:
             style=style
         )
         
-        # 调用 LLM（异步）
-        response = await self.llm.ainvoke(messages)
+        # 调用 LLM（异步，经全局限流器）
+        response = await get_rate_limiter().ainvoke(self.llm, messages)
         content = response.content
         
         # 尝试从响应中提取 JSON
@@ -63,6 +77,64 @@ class ScriptAgent:
         logger.info(f"剧本生成完成: {script.title}, 共 {len(script.segments)} 个片段")
         return script
     
+    async def generate_streaming(
+        self,
+        formula: str,
+        duration: int = 60,
+        style: str = "3Blue1Brown",
+        on_segment: Optional[Callable[[Segment], None]] = None
+    ) -> Script:
+        """
+        流式生成剧本，每个片段完整到达时立即回调 on_segment
+        
+        回调收到的 Segment 对象会原样放入最终返回的 Script 中，
+        下游可以直接在其上写入 tts_text、音频路径等信息。
+        """
+        logger.info(f"开始流式生成剧本: {formula}, 时长: {duration}秒, 风格: {style}")
+        
+        # 构建 prompt
+        messages = self.prompt_template.format_messages(
+            formula=formula,
+            duration=duration,
+            style=style
+        )
+        
+        parser = IncrementalJSONArrayParser("segments")
+        streamed_segments: dict[int, Segment] = {}
+        content_parts = []
+        
+        # 调用 LLM（异步流式，经全局限流器）
+        async for chunk in get_rate_limiter().astream(self.llm, messages):
+            if not isinstance(chunk.content, str):
+                continue
+            content_parts.append(chunk.content)
+            for seg_data in parser.feed(chunk.content):
+                segment = self._parse_segment(seg_data, len(streamed_segments) + 1)
+                if segment.segment_id in streamed_segments:
+                    logger.warning(f"流式剧本中出现重复的片段 ID {segment.segment_id}，忽略")
+                    continue
+                streamed_segments[segment.segment_id] = segment
+                logger.info(f"剧本片段 {segment.segment_id} 已生成")
+                if on_segment:
+                    on_segment(segment)
+        
+        # 完整解析一遍，获取标题并补齐增量解析遗漏的片段
+        script_data = self._extract_json("".join(content_parts))
+        script = self._parse_script(script_data)
+        segments = []
+        for segment in script.segments:
+            if segment.segment_id in streamed_segments:
+                segments.append(streamed_segments[segment.segment_id])
+            else:
+                logger.warning(f"片段 {segment.segment_id} 未能增量解析，在流式结束后补充处理")
+                segments.append(segment)
+                if on_segment:
+                    on_segment(segment)
+        script.segments = segments
+        
+        logger.info(f"剧本生成完成: {script.title}, 共 {len(script.segments)} 个片段")
+        return script
+    
     def _extract_json(self, text: str) -> dict:
         """从文本中提取 JSON，支持 markdown 代码块格式"""
         import re
@@ -114,15 +186,29 @@ class ScriptAgent:
         """解析剧本数据"""
         segments = []
         for seg_data in data.get("segments", []):
-            segment = Segment(
-                segment_id=seg_data.get("segment_id", len(segments) + 1),
-                visual=seg_data.get("visual", ""),
-                narration=seg_data.get("narration", ""),
-                tts_text=""  # 稍后由 TTS Agent 填充
-            )
-            segments.append(segment)
+            segments.append(self._parse_segment(seg_data, len(segments) + 1))
         
         return Script(
             title=data.get("title", "未命名视频"),
             segments=segments
         )
+    
+    def _parse_segment(self, seg_data: dict, default_id: int) -> Segment:
+        """解析单个片段数据"""
+        segment = Segment(
+            segment_id=seg_data.get("segment_id", default_id),
+            visual=seg_data.get("visual", ""),
+            narration=seg_data.get("narration", ""),
+            tts_text=""  # 稍后由 TTS Agent 填充
+        )
+        
+        if self.fused_tts:
+            # 融合模式：校验 LLM 同时给出的 tts_text，无效时留空，由 TTS Agent 兜底转换
+            tts_text = seg_data.get("tts_text")
+            is_valid, error_msg = TTSTextValidator.validate(tts_text, segment.narration)
+            if is_valid:
+                segment.tts_text = tts_text.strip()
+            else:
+                logger.warning(f"片段 {segment.segment_id} 的 tts_text 无效（{error_msg}），将由 TTS Agent 兜底转换")
+        
+        return segment
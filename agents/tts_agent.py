@@ -2,10 +2,14 @@
 import json
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
-from models.script_model import Script
-from config import OPENAI_API_KEY, OPENAI_MODEL, OPENAI_API_BASE_URL
+from models.script_model import Script, Segment
+from typing import Optional
+from config import OPENAI_API_KEY, OPENAI_MODEL, OPENAI_API_BASE_URL, LLM_REQUEST_TIMEOUT, TTS_LOCAL_CONVERTER
 from utils.logger import get_logger
+from utils.rate_limiter import get_rate_limiter
 from utils.file_utils import load_file_content
+from utils.latex_speech import LaTeXSpeechConverter
+from utils.validation import TTSTextValidator
 
 logger = get_logger(__name__)
 
@@ -13,7 +17,14 @@ logger = get_logger(__name__)
 class TTSAgent:
     """TTS 文案转换 Agent"""
     
-    def __init__(self):
+    def __init__(self, use_local_converter: Optional[bool] = None):
+        """
+        Args:
+            use_local_converter: 是否先用本地规则转换器处理，仅低置信度片段调用 LLM，
+                默认读取 TTS_LOCAL_CONVERTER 配置
+        """
+        self.use_local_converter = TTS_LOCAL_CONVERTER if use_local_converter is None else use_local_converter
+        self.local_converter = LaTeXSpeechConverter()
         extra_body = {
             "enable_thinking": False
         }
@@ -22,6 +33,8 @@ class TTSAgent:
             temperature=0.5,
             api_key=OPENAI_API_KEY,
             base_url=OPENAI_API_BASE_URL,
+            timeout=LLM_REQUEST_TIMEOUT,
+            max_retries=0,  # 重试由全局限流器统一处理
             extra_body=extra_body
         )
         self.prompt_template = self._load_prompt_template()
@@ -34,30 +47,102 @@ class TTSAgent:
             ("user", prompt_text)
         ])
     
-    async def convert_script(self, script: Script) -> Script:
-        """将剧本中的讲解文案转换为 TTS 友好的文本"""
-        logger.info(f"开始转换 TTS 文案: {script.title}")
+    async def convert_script(self, script: Script, only_missing: bool = False) -> Script:
+        """
+        将剧本中的讲解文案转换为 TTS 友好的文本
+        
+        Args:
+            script: 剧本
+            only_missing: 只转换 tts_text 为空的片段（融合模式下作为兜底）
+        """
+        if only_missing:
+            target_segments = [seg for seg in script.segments if not seg.tts_text]
+            if not target_segments:
+                logger.info("所有片段已有有效的 tts_text，跳过 TTS 文案转换")
+                return script
+            logger.info(f"开始补齐 TTS 文案: {script.title}, 共 {len(target_segments)} 个片段缺失")
+        else:
+            logger.info(f"开始转换 TTS 文案: {script.title}")
+            target_segments = list(script.segments)
+        
+        # 本地规则转换，只有低置信度的片段才交给 LLM
+        if self.use_local_converter:
+            target_segments = [seg for seg in target_segments if not self._convert_locally(seg)]
+            if not target_segments:
+                logger.info("所有片段已由本地规则转换完成，跳过 LLM 调用")
+                return script
+            logger.info(f"{len(target_segments)} 个片段本地转换置信度低，交由 LLM 转换")
+        
+        target_script = Script(title=script.title, segments=target_segments)
         
         # 将 script 转换为 JSON 字符串
-        script_json = script.model_dump_json(indent=2)
+        script_json = target_script.model_dump_json(indent=2)
         
         # 构建 prompt
         messages = self.prompt_template.format_messages(
             script_json=script_json
         )
         
-        # 调用 LLM（异步）
-        response = await self.llm.ainvoke(messages)
+        # 调用 LLM（异步，经全局限流器）
+        response = await get_rate_limiter().ainvoke(self.llm, messages)
         content = response.content
         
         # 提取 JSON
         script_data = self._extract_json(content)
         
         # 更新 script 中的 tts_text
-        updated_script = self._update_tts_text(script, script_data)
+        self._update_segments_tts_text(target_script.segments, script_data)
         
         logger.info("TTS 文案转换完成")
-        return updated_script
+        return script
+    
+    async def convert_segment(self, segment: Segment) -> Segment:
+        """将单个片段的讲解文案转换为 TTS 友好的文本（用于流式剧本逐片段处理）"""
+        logger.info(f"开始转换片段 {segment.segment_id} 的 TTS 文案")
+        
+        if self.use_local_converter and self._convert_locally(segment):
+            logger.info(f"片段 {segment.segment_id} 的 TTS 文案已由本地规则转换完成")
+            return segment
+        
+        # 只发送该片段的讲解文案，保持与整剧本转换相同的输入结构
+        segment_json = json.dumps(
+            {"segments": [{"segment_id": segment.segment_id, "narration": segment.narration}]},
+            ensure_ascii=False,
+            indent=2
+        )
+        
+        # 构建 prompt
+        messages = self.prompt_template.format_messages(
+            script_json=segment_json
+        )
+        
+        # 调用 LLM（异步，经全局限流器）
+        response = await get_rate_limiter().ainvoke(self.llm, messages)
+        content = response.content
+        
+        # 提取 JSON 并更新 tts_text
+        segment_data = self._extract_json(content)
+        self._update_segments_tts_text([segment], segment_data)
+        
+        logger.info(f"片段 {segment.segment_id} 的 TTS 文案转换完成")
+        return segment
+    
+    def _convert_locally(self, segment: Segment) -> bool:
+        """
+        使用本地规则转换器转换片段的讲解文案
+        
+        Returns:
+            是否转换成功（高置信度且通过校验），成功时已写入 segment.tts_text
+        """
+        tts_text, confident = self.local_converter.convert(segment.narration)
+        if not confident:
+            return False
+        is_valid, error_msg = TTSTextValidator.validate(tts_text, segment.narration)
+        if not is_valid:
+            logger.debug(f"片段 {segment.segment_id} 本地转换结果无效: {error_msg}")
+            return False
+        segment.tts_text = tts_text
+        return True
     
     def _extract_json(self, text: str) -> dict:
         """从文本中提取 JSON，支持 markdown 代码块格式"""
@@ -106,19 +191,17 @@ class TTSAgent:
             logger.error(f"无法解析 JSON: {cleaned_text[:200]}...")
             raise ValueError("无法从 LLM 响应中提取有效的 JSON")
     
-    def _update_tts_text(self, script: Script, data: dict) -> Script:
-        """更新 script 中的 tts_text"""
+    def _update_segments_tts_text(self, segments: list[Segment], data: dict) -> None:
+        """按 segment_id 更新片段的 tts_text"""
         segments_data = data.get("segments", [])
         
         # 创建 segment_id 到数据的映射
         segment_map = {seg.get("segment_id"): seg for seg in segments_data}
         
         # 更新每个 segment
-        for segment in script.segments:
+        for segment in segments:
             if segment.segment_id in segment_map:
                 segment.tts_text = segment_map[segment.segment_id].get("tts_text", segment.narration)
             else:
                 # 如果没有找到，使用原始 narration
                 segment.tts_text = segment.narration
-        
-        return script
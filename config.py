@@ -9,21 +9,98 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_API_BASE_URL = os.getenv("OPENAI_API_BASE_URL")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4")
 
+# LLM 限流配置（所有 Agent 共享）
+LLM_RPM_LIMIT = int(os.getenv("LLM_RPM_LIMIT", "0"))  # 每分钟请求数上限，0 表示不限制
+LLM_TPM_LIMIT = int(os.getenv("LLM_TPM_LIMIT", "0"))  # 每分钟 token 数上限，0 表示不限制
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))  # 自适应并发上限
+LLM_MIN_CONCURRENCY = int(os.getenv("LLM_MIN_CONCURRENCY", "1"))  # 自适应并发下限
+LLM_INITIAL_CONCURRENCY = int(os.getenv("LLM_INITIAL_CONCURRENCY", "4"))  # 初始并发数
+LLM_LATENCY_TARGET = float(os.getenv("LLM_LATENCY_TARGET", "0"))  # 延迟目标（秒），超过时不再增加并发，0 表示不启用
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))  # 429/超时等可重试错误的最大重试次数
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "1.0"))  # 重试退避基准时间（秒）
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "60.0"))  # 重试退避最大时间（秒）
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "300"))  # 单次 LLM 请求超时（秒）
+LLM_ESTIMATED_OUTPUT_TOKENS = int(os.getenv("LLM_ESTIMATED_OUTPUT_TOKENS", "2000"))  # 预估输出 token 数（用于 TPM 预扣）
+
+# 剧本配置
+SCRIPT_STREAMING = os.getenv("SCRIPT_STREAMING", "false").lower() == "true"  # 流式生成剧本，逐片段立即生成 TTS 文案和音频
+SCRIPT_FUSED_TTS = os.getenv("SCRIPT_FUSED_TTS", "false").lower() == "true"  # 剧本生成时同时输出 tts_text，TTS Agent 仅兜底
+
 # Manim 配置
 MANIM_OUTPUT_DIR = os.getenv("MANIM_OUTPUT_DIR", "./media/videos")
 MANIM_QUALITY = os.getenv("MANIM_QUALITY", "medium_quality")  # low_quality, medium_quality, high_quality
+MANIM_STREAMING = os.getenv("MANIM_STREAMING", "false").lower() == "true"  # 流式生成 Manim 代码（边生成边校验）
+MANIM_STREAM_MAX_ATTEMPTS = int(os.getenv("MANIM_STREAM_MAX_ATTEMPTS", "3"))  # 流式生成跑偏时的最大尝试次数
+
+# 渲染配置（Manim 与切割、合并、片尾环节共用）
+RENDER_PROFILE = os.getenv("RENDER_PROFILE", "")  # draft, standard, archive；留空时按 MANIM_QUALITY 选择
+RENDER_THREADS = int(os.getenv("RENDER_THREADS", "0"))  # x264 编码线程数，0 表示按 CPU 预算分配
+CPU_BUDGET_THREADS = int(os.getenv("CPU_BUDGET_THREADS", "0"))  # 所有并发任务的 Manim / ffmpeg / moviepy 共用的线程总数，0 表示可用 CPU 核数
+CPU_AFFINITY = os.getenv("CPU_AFFINITY", "false").lower() == "true"  # 把各环节绑定到不同的 CPU 核上（仅 Linux），减少缓存争抢
+INTERMEDIATE_MODE = os.getenv("INTERMEDIATE_MODE", "false").lower() == "true"  # 中间片段使用无损全帧内编码，只在最终合并时有损编码一次
+INTERMEDIATE_DIR = os.getenv("INTERMEDIATE_DIR", "")  # 中间文件目录（建议本地高速存储，如 /dev/shm），留空时使用任务临时目录
+CHUNKED_ENCODE = os.getenv("CHUNKED_ENCODE", "false").lower() == "true"  # 最终编码按片段分块，多进程并行编码后无损拼接
+CHUNKED_ENCODE_WORKERS = int(os.getenv("CHUNKED_ENCODE_WORKERS", "0"))  # 并行编码进程数，0 表示 CPU 核数
+CHUNK_MAX_SECONDS = float(os.getenv("CHUNK_MAX_SECONDS", "20"))  # 超过该时长两倍的片段按 GOP 整数倍细分
+STATIC_SPAN_VFR = os.getenv("STATIC_SPAN_VFR", "false").lower() == "true"  # 静止画面（wait、冻结帧）去掉重复帧，按可变帧率编码
+STATIC_SPAN_MAX_HOLD = float(os.getenv("STATIC_SPAN_MAX_HOLD", "2.0"))  # 静止画面单帧最长持续时间（秒）
+PROGRESSIVE_OUTPUT = os.getenv("PROGRESSIVE_OUTPUT", "false").lower() == "true"  # 边编码边输出 HLS 预览分片，播放列表随之增长
+ENDING_STREAM_COPY = os.getenv("ENDING_STREAM_COPY", "true").lower() == "true"  # 片尾预先转码并缓存，追加时直接复制流，不重新编码主视频
+ENDING_CACHE_DIR = os.getenv("ENDING_CACHE_DIR", "./temp/ending_cache")  # 转码后的片尾缓存目录
+ENDING_WORKERS = int(os.getenv("ENDING_WORKERS", "0"))  # 片尾工具批量处理的并行进程数，0 表示 CPU 核数
+ENDING_PATH = os.getenv("ENDING_PATH", "")  # 生成视频时在最终合并中直接拼接的片尾视频，留空时不加片尾
+
+# 打包配置（多码率版本）
+PACKAGE_FORMAT = os.getenv("PACKAGE_FORMAT", "")  # mp4, hls, dash；留空时不打包
+PACKAGE_RENDITIONS = os.getenv("PACKAGE_RENDITIONS", "1080p,720p,480p")  # 可选 1080p, 720p, 480p, 360p
+PACKAGE_SEGMENT_SECONDS = float(os.getenv("PACKAGE_SEGMENT_SECONDS", "4"))  # HLS/DASH 分片时长（秒）
 
 # TTS 配置
 TTS_OUTPUT_DIR = os.getenv("TTS_OUTPUT_DIR", "./audio/segments")
 TTS_VOICE = os.getenv("TTS_VOICE", "zh-CN-XiaoxiaoNeural")
+TTS_LOCAL_CONVERTER = os.getenv("TTS_LOCAL_CONVERTER", "true").lower() == "true"  # 先用本地规则转换 LaTeX，仅低置信度片段调用 LLM
+TTS_MAX_CONCURRENT = int(os.getenv("TTS_MAX_CONCURRENT", "8"))  # 进程内所有任务共享的 TTS 并发上限
+TTS_MAX_RETRIES = int(os.getenv("TTS_MAX_RETRIES", "3"))  # 单个片段合成失败的最大重试次数
+TTS_RETRY_BASE_DELAY = float(os.getenv("TTS_RETRY_BASE_DELAY", "1.0"))  # 重试退避基准延迟（秒）
+TTS_REQUEST_TIMEOUT = float(os.getenv("TTS_REQUEST_TIMEOUT", "60"))  # 单次合成超时（秒）
+TTS_SERVER_URL = os.getenv("TTS_SERVER_URL") or None  # HTTP TTS 服务地址（如本地替身服务）
+TTS_BACKEND = os.getenv("TTS_BACKEND", "")  # edge, http, espeak, synthetic；留空时有 TTS_SERVER_URL 用 http，否则用 edge
+TTS_ESPEAK_BINARY = os.getenv("TTS_ESPEAK_BINARY", "espeak-ng")
+TTS_ESPEAK_VOICE = os.getenv("TTS_ESPEAK_VOICE", "cmn")
+TTS_ESPEAK_SPEED = int(os.getenv("TTS_ESPEAK_SPEED", "175"))  # 每分钟词数
+TTS_SYNTHETIC_CHARS_PER_SECOND = float(os.getenv("TTS_SYNTHETIC_CHARS_PER_SECOND", "4.5"))  # synthetic 后端的语速
+TTS_SINGLE_TRACK = os.getenv("TTS_SINGLE_TRACK", "false").lower() == "true"  # 拼接为一条连续旁白音轨，记录采样级精确的片段起止时间
+TTS_NARRATION_SAMPLE_RATE = int(os.getenv("TTS_NARRATION_SAMPLE_RATE", "24000"))  # 旁白音轨采样率（edge-tts 输出为 24kHz）
+TTS_AUDIO_FORMAT = os.getenv("TTS_AUDIO_FORMAT", "auto").lower()  # auto（保持后端输出格式）, aac（旁白一次性编码为 AAC，后续直接复制音频流）
+TTS_AAC_BITRATE = os.getenv("TTS_AAC_BITRATE", "128k")
+
+# ffmpeg 配置
+FFMPEG_BINARY = os.getenv("FFMPEG_BINARY", "")  # 留空时使用 imageio-ffmpeg 自带的 ffmpeg
 
 # 输出目录配置
-OUTPUT_SCRIPTS_DIR = "./output/scripts"
-OUTPUT_TTS_TEXTS_DIR = "./output/tts_texts"
-OUTPUT_MANIM_CODE_DIR = "./output/manim_code"
-OUTPUT_VIDEOS_DIR = "./output/videos"
-OUTPUT_VIDEO_SEGMENTS_DIR = "./output/video_segments"
-OUTPUT_AUDIO_SEGMENTS_DIR = "./output/audio_segments"
+OUTPUT_BASE_DIR = os.getenv("OUTPUT_BASE_DIR", "./output")  # 输出根目录，多机部署时指向共享存储
+OUTPUT_SCRIPTS_DIR = os.path.join(OUTPUT_BASE_DIR, "scripts")
+OUTPUT_TTS_TEXTS_DIR = os.path.join(OUTPUT_BASE_DIR, "tts_texts")
+OUTPUT_MANIM_CODE_DIR = os.path.join(OUTPUT_BASE_DIR, "manim_code")
+OUTPUT_VIDEOS_DIR = os.path.join(OUTPUT_BASE_DIR, "videos")
+OUTPUT_PACKAGES_DIR = os.path.join(OUTPUT_BASE_DIR, "packages")
+OUTPUT_PREVIEWS_DIR = os.path.join(OUTPUT_BASE_DIR, "previews")
+OUTPUT_VIDEO_SEGMENTS_DIR = os.path.join(OUTPUT_BASE_DIR, "video_segments")
+OUTPUT_AUDIO_SEGMENTS_DIR = os.path.join(OUTPUT_BASE_DIR, "audio_segments")
 
 # 任务临时目录配置（用于多线程隔离）
-TEMP_BASE_DIR = os.getenv("TEMP_BASE_DIR", "./temp")
\ No newline at end of file
+TEMP_BASE_DIR = os.getenv("TEMP_BASE_DIR", "./temp")  # 多机部署时指向共享存储
+
+# 任务队列配置
+JOB_QUEUE_URL = os.getenv("JOB_QUEUE_URL", "")  # 共享任务队列地址：redis://host:6379/0 或 sqlite:///路径；留空时使用 JOB_QUEUE_PATH
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", os.path.join(OUTPUT_BASE_DIR, "jobs.db"))  # SQLite 任务队列文件
+JOB_QUEUE_SQLITE_WAL = os.getenv("JOB_QUEUE_SQLITE_WAL", "true").lower() == "true"  # SQLite 队列放在 NFS 等共享文件系统上时需设为 false
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "600"))  # 任务租约时长（秒），工作进程崩溃后超过该时间任务会被重新领取
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))  # 单个任务的最大尝试次数
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "5"))  # 常驻工作进程在队列为空时的轮询间隔（秒）
+
+# 渲染耗时预测与调度配置
+RENDER_HISTORY_PATH = os.getenv("RENDER_HISTORY_PATH", os.path.join(OUTPUT_BASE_DIR, "render_history.jsonl"))  # 历史耗时记录，用于预测渲染和编码耗时
+RENDER_PREDICTOR_MIN_SAMPLES = int(os.getenv("RENDER_PREDICTOR_MIN_SAMPLES", "5"))  # 历史记录少于该数量时使用经验公式估算
+SCHEDULING_POLICY = os.getenv("SCHEDULING_POLICY", "fifo").lower()  # fifo（按提交顺序）, sjf（预计耗时短的优先）, deadline（按截止时间余量排序）
+TASK_TIMEOUT = float(os.getenv("TASK_TIMEOUT", "0"))  # 单个任务的超时（秒），截止时间传递到 LLM、TTS、Manim 和 ffmpeg；0 表示不限制
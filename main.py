@@ -1,14 +1,30 @@
 """公式教学视频生成系统 - 主入口"""
+import os
+import time
+import socket
 import asyncio
 import argparse
 import json
-from typing import List, Dict, Optional
+from typing import Any, Callable, Iterable, Iterator, List, Dict, Optional
 from agents.orchestrator import VideoOrchestrator
+from config import JOB_POLL_INTERVAL, SCHEDULING_POLICY, PACKAGE_FORMAT, ENDING_PATH, TASK_TIMEOUT
 from utils.logger import get_logger
-from utils.file_utils import generate_task_id, load_json
+from utils.file_utils import generate_task_id, load_json, iter_jsonl, append_jsonl, load_jsonl
+from utils.job_queue import JobQueue, open_job_queue
+from utils.task_coalescer import TaskCoalescer
+from utils.deadline import deadline_scope, wait_with_deadline
+from utils.cpu_budget import get_cpu_budget
+from utils.render_predictor import RenderTimePredictor, SCHEDULING_POLICIES, parse_deadline, plan_schedule
+from tools.tts_engine import get_tts_engine
 
 logger = get_logger(__name__)
 
+# 加入任务队列时每个事务写入的任务数
+ENQUEUE_BATCH_SIZE = 500
+
+# 本进程内执行中的任务：相同请求合并为一次计算，相同任务ID的任务依次执行
+_task_coalescer = TaskCoalescer()
+
 
 class FormulaVideoGenerator:
     """公式视频生成器"""
@@ -21,7 +37,10 @@ class FormulaVideoGenerator:
         formula: str,
         duration: int = 60,
         style: str = "3Blue1Brown",
-        task_id: Optional[str] = None
+        task_id: Optional[str] = None,
+        package_format: Optional[str] = None,
+        ending_path: Optional[str] = None,
+        progress_callback: Optional[Callable[[int, str], None]] = None
     ) -> dict:
         """
         生成公式教学视频
@@ -31,87 +50,212 @@ class FormulaVideoGenerator:
             duration: 视频时长（秒），默认 60 秒
             style: 讲解风格，默认 "3Blue1Brown"
             task_id: 任务ID，如果为None则自动生成
+            package_format: 额外输出多码率版本（mp4 / hls / dash），None 时读取 PACKAGE_FORMAT
+            ending_path: 片尾视频（在最终合并中一起编码），None 时读取 ENDING_PATH
+            progress_callback: 进度回调 callback(步骤序号, 步骤描述)
         
         Returns:
             dict: 包含视频路径、剧本、总时长等信息
         """
-        # 如果没有提供 task_id，自动生成
+        # 如果没有提供 task_id，根据公式和生成参数自动生成
         if task_id is None:
-            task_id = generate_task_id(formula)
+            task_id = generate_task_id(
+                formula, duration=duration, style=style, package=package_format, ending=ending_path
+            )
         
-        return await self.orchestrator.generate_video(formula, duration, style, task_id=task_id)
+        return await self.orchestrator.generate_video(
+            formula, duration, style, task_id=task_id,
+            package_format=package_format, ending_path=ending_path,
+            progress_callback=progress_callback
+        )
 
 
 async def process_single_task(
     formula: str,
     duration: int,
     style: str,
-    task_id: Optional[str] = None
+    task_id: Optional[str] = None,
+    package_format: Optional[str] = None,
+    ending_path: Optional[str] = None,
+    progress_callback: Optional[Callable[[int, str], None]] = None,
+    timeout: Optional[float] = None
 ) -> Dict:
-    """处理单个任务"""
+    """
+    处理单个任务
+    
+    与执行中任务的任务ID、参数和超时都相同时不重复计算，直接共享其结果；
+    任务ID相同但参数不同（共用临时目录）时等待前一个任务结束后再执行。
+    
+    Args:
+        timeout: 任务超时（秒），None 时读取 TASK_TIMEOUT，0 表示不限制；截止时间传递到 LLM、TTS、
+            Manim 和 ffmpeg，超时后结束子进程、清理未完成的文件并返回失败结果
+    """
+    timeout = TASK_TIMEOUT if timeout is None else timeout
+    params_id = generate_task_id(
+        formula, duration=duration, style=style, package=package_format, ending=ending_path
+    )
     if task_id is None:
-        task_id = generate_task_id(formula)
+        task_id = params_id
+    
+    async def run() -> Dict:
+        generator = FormulaVideoGenerator()
+        try:
+            with deadline_scope(timeout):
+                result = await wait_with_deadline(
+                    generator.generate(
+                        formula=formula,
+                        duration=duration,
+                        style=style,
+                        task_id=task_id,
+                        package_format=package_format,
+                        ending_path=ending_path,
+                        progress_callback=progress_callback
+                    ),
+                    "视频生成任务"
+                )
+            return {"success": True, "formula": formula, "task_id": task_id, "result": result}
+        except Exception as e:
+            logger.error(f"生成失败 [{formula}]: {e}", exc_info=True)
+            return {"success": False, "formula": formula, "task_id": task_id, "error": str(e)}
     
-    generator = FormulaVideoGenerator()
+    # 超时不同的请求不合并，否则时限较长的请求可能拿到时限较短的副本的超时失败
+    result = await _task_coalescer.run(f"{task_id}:{params_id}:{timeout or 0}", run, lock_key=task_id)
+    return dict(result)
+
+
+def task_id_for(
+    task: Dict,
+    package_format: Optional[str] = None,
+    ending_path: Optional[str] = None
+) -> str:
+    """批量任务的任务ID：未指定 task_id 时与 process_single_task 的生成规则一致"""
+    return task.get("task_id") or generate_task_id(
+        task["formula"],
+        duration=task.get("duration", 60),
+        style=task.get("style", "3Blue1Brown"),
+        package=task.get("package", package_format),
+        ending=task.get("ending", ending_path)
+    )
+
+
+async def process_task_safely(
+    task: Dict,
+    package_format: Optional[str] = None,
+    ending_path: Optional[str] = None
+) -> Dict:
+    """处理单个批量任务，任何异常都转换为失败结果，确保错误隔离"""
     try:
-        result = await generator.generate(
-            formula=formula,
-            duration=duration,
-            style=style,
-            task_id=task_id
+        return await process_single_task(
+            formula=task.get("formula", ""),
+            duration=task.get("duration", 60),
+            style=task.get("style", "3Blue1Brown"),
+            task_id=task.get("task_id"),
+            package_format=task.get("package", package_format),
+            ending_path=task.get("ending", ending_path),
+            timeout=task.get("timeout")
         )
-        return {"success": True, "formula": formula, "task_id": task_id, "result": result}
     except Exception as e:
-        logger.error(f"生成失败 [{formula}]: {e}", exc_info=True)
-        return {"success": False, "formula": formula, "task_id": task_id, "error": str(e)}
+        # 额外的保护层，防止未预期的异常
+        formula = task.get("formula", "未知")
+        task_id = task.get("task_id", "未知")
+        logger.error(f"任务处理异常 [{formula}]: {e}", exc_info=True)
+        return {
+            "success": False,
+            "formula": formula,
+            "task_id": task_id,
+            "error": f"未预期的异常: {str(e)}"
+        }
+
+
+def plan_batch(
+    tasks: List[Dict],
+    max_concurrent: int = 3,
+    package_format: Optional[str] = None,
+    ending_path: Optional[str] = None,
+    policy: str = SCHEDULING_POLICY
+) -> List[Dict]:
+    """
+    根据历史耗时预测每个任务的耗时，确定执行顺序并估算完成时间
+    
+    Returns:
+        按执行顺序排列的计划（见 plan_schedule）
+    """
+    predictor = RenderTimePredictor()
+    estimates = []
+    deadlines = []
+    for task in tasks:
+        package = task.get("package", package_format)
+        ending = task.get("ending", ending_path)
+        estimates.append(predictor.predict({
+            "target_duration": task.get("duration", 60),
+            "package": bool(PACKAGE_FORMAT if package is None else package),
+            "ending": bool(ENDING_PATH if ending is None else ending),
+        })["total_seconds"])
+        try:
+            deadlines.append(parse_deadline(task.get("deadline")))
+        except ValueError as e:
+            logger.warning(f"任务 [{task.get('formula')}] 的截止时间被忽略: {e}")
+            deadlines.append(None)
+    
+    plan = plan_schedule(estimates, deadlines, policy, max_concurrent)
+    source = f"{predictor.sample_count} 条历史记录" if predictor.sample_count >= predictor.min_samples else "经验公式"
+    logger.info(f"调度计划（策略: {policy}，耗时预测: {source}）:")
+    for position, entry in enumerate(plan, 1):
+        formula = tasks[entry["index"]].get("formula")
+        eta = time.strftime("%H:%M:%S", time.localtime(entry["eta"]))
+        logger.info(f"  {position}. {formula}: 预计耗时 {entry['estimate']:.0f}s，预计完成 {eta}")
+        if entry["late"]:
+            deadline = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry["deadline"]))
+            logger.warning(f"  任务 [{formula}] 预计无法在截止时间 {deadline} 前完成")
+    return plan
 
 
 async def process_batch_tasks(
     tasks: List[Dict],
-    max_concurrent: int = 3
+    max_concurrent: int = 3,
+    package_format: Optional[str] = None,
+    ending_path: Optional[str] = None,
+    on_result: Optional[Callable[[Dict], None]] = None,
+    policy: str = SCHEDULING_POLICY
 ) -> List[Dict]:
-    """批量处理任务，支持并发，确保错误隔离"""
+    """
+    批量处理任务，支持并发，确保错误隔离
+    
+    Args:
+        on_result: 每个任务完成时立即调用（如写入结果文件），不必等待整批结束
+        policy: 调度策略 fifo / sjf / deadline（见 plan_schedule），结果仍按提交顺序返回
+    """
     semaphore = asyncio.Semaphore(max_concurrent)
+    get_cpu_budget().set_concurrency(min(max_concurrent, len(tasks)))
+    plan = plan_batch(tasks, max_concurrent, package_format, ending_path, policy)
     
     async def process_with_semaphore(task: Dict):
         """带信号量控制的包装函数，增强错误隔离"""
-        try:
-            async with semaphore:
-                return await process_single_task(
-                    formula=task.get("formula", ""),
-                    duration=task.get("duration", 60),
-                    style=task.get("style", "3Blue1Brown"),
-                    task_id=task.get("task_id")
-                )
-        except Exception as e:
-            # 额外的保护层，防止未预期的异常
-            formula = task.get("formula", "未知")
-            task_id = task.get("task_id", "未知")
-            logger.error(f"任务处理异常 [{formula}]: {e}", exc_info=True)
-            return {
-                "success": False,
-                "formula": formula,
-                "task_id": task_id,
-                "error": f"未预期的异常: {str(e)}"
-            }
+        async with semaphore:
+            result = await process_task_safely(task, package_format, ending_path)
+        if on_result is not None:
+            on_result(result)
+        return result
+    
+    # 按计划顺序创建任务：信号量按等待的先后放行，先创建的任务先执行
+    futures: List[Any] = [None] * len(tasks)
+    for entry in plan:
+        futures[entry["index"]] = asyncio.ensure_future(process_with_semaphore(tasks[entry["index"]]))
     
     # 使用 return_exceptions=True 确保所有任务都能完成
-    results = await asyncio.gather(
-        *[process_with_semaphore(task) for task in tasks],
-        return_exceptions=True
-    )
+    results = await asyncio.gather(*futures, return_exceptions=True)
     
     # 处理可能的异常结果
     processed_results = []
     for i, result in enumerate(results):
-        if isinstance(result, Exception):
-            # 如果返回的是异常对象，转换为标准错误格式
+        if isinstance(result, BaseException):
+            # 如果返回的是异常对象（包括被取消的任务），转换为标准错误格式
             task = tasks[i]
             processed_results.append({
                 "success": False,
                 "formula": task.get("formula", "未知"),
                 "task_id": task.get("task_id", "未知"),
-                "error": f"未捕获的异常: {str(result)}"
+                "error": f"未捕获的异常: {type(result).__name__} {str(result)}".rstrip()
             })
         else:
             processed_results.append(result)
@@ -119,6 +263,287 @@ async def process_batch_tasks(
     return processed_results
 
 
+async def process_task_stream(
+    tasks: Iterable[Dict],
+    max_concurrent: int = 3,
+    package_format: Optional[str] = None,
+    ending_path: Optional[str] = None,
+    on_result: Optional[Callable[[Dict], None]] = None
+) -> Dict[str, Any]:
+    """
+    流式批量处理：按需从 tasks 中取任务，同时最多 max_concurrent 个任务在执行
+    
+    任务在需要时才读取，内存占用与任务总数无关，第一个任务读到即开始执行；
+    每个任务完成时调用 on_result，结果不在内存中累积。
+    
+    Returns:
+        {"success": 成功数, "failed": 失败数, "failures": 失败结果列表}
+    """
+    summary: Dict[str, Any] = {"success": 0, "failed": 0, "failures": []}
+    get_cpu_budget().set_concurrency(max_concurrent)
+    task_iter = iter(tasks)
+    exhausted = False
+    active = set()
+    while True:
+        while not exhausted and len(active) < max_concurrent:
+            task = next(task_iter, None)
+            if task is None:
+                exhausted = True
+                break
+            active.add(asyncio.create_task(process_task_safely(task, package_format, ending_path)))
+        if not active:
+            break
+        done, active = await asyncio.wait(active, return_when=asyncio.FIRST_COMPLETED)
+        for finished in done:
+            result = finished.result()
+            if result["success"]:
+                summary["success"] += 1
+            else:
+                summary["failed"] += 1
+                summary["failures"].append(result)
+            if on_result is not None:
+                on_result(result)
+            logger.info(f"已完成 {summary['success'] + summary['failed']} 个任务（成功 {summary['success']}，失败 {summary['failed']}）")
+    return summary
+
+
+def result_record(result: Dict) -> Dict[str, Any]:
+    """任务结果转换为一行可序列化的结果记录"""
+    return {
+        "success": result["success"],
+        "formula": result["formula"],
+        "task_id": result["task_id"],
+        "result": summarize_result(result["result"]) if result["success"] else None,
+        "error": result.get("error"),
+        "finished_at": time.time(),
+    }
+
+
+def summarize_result(result: dict) -> Dict[str, Any]:
+    """提取生成结果中可序列化的摘要（剧本对象只保留路径）"""
+    package = result.get("package")
+    return {
+        "video_path": result["video_path"],
+        "total_duration": result["total_duration"],
+        "script_path": result.get("script_path"),
+        "code_path": result.get("code_path"),
+        "package_manifest": package["manifest_path"] if package else None,
+    }
+
+
+async def run_queue_worker(
+    queue: JobQueue,
+    max_concurrent: int = 3,
+    worker_id: Optional[str] = None,
+    follow: bool = False,
+    poll_interval: float = JOB_POLL_INTERVAL,
+    stop_event: Optional[asyncio.Event] = None
+) -> Dict[str, int]:
+    """
+    从任务队列领取并执行任务
+    
+    每个任务执行期间定期续约，进入新步骤时立即把步骤写回队列；租约被其他工作进程接管时立即中止本地执行
+    （清理未完成的文件），避免两台机器同时写同一个任务目录。
+    失败的任务在未达最大尝试次数前放回等待队列，由本进程或其他工作进程重试。
+    
+    Args:
+        queue: 任务队列（JobQueue 或 RedisJobQueue）
+        max_concurrent: 本进程同时执行的任务数
+        worker_id: 工作进程标识，默认为 "主机名-进程号"
+        follow: 队列为空时不退出，每隔 poll_interval 秒检查一次新任务（常驻工作进程）
+        poll_interval: 轮询间隔（秒）
+        stop_event: 设置后不再领取新任务，等待执行中的任务完成后返回（用于优雅退出）
+    
+    Returns:
+        本次执行的统计 {"done": 完成数, "retry": 放回重试数, "failed": 最终失败数, "lost": 租约被接管数}
+    """
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    counts = {"done": 0, "retry": 0, "failed": 0, "lost": 0}
+    get_cpu_budget().set_concurrency(max_concurrent)
+    logger.info(f"工作进程 {worker_id} 开始处理队列 {queue.db_path}（最大并发数: {max_concurrent}）")
+    
+    async def run_job(job: Dict[str, Any]) -> None:
+        task_id = job["task_id"]
+        params = job["params"]
+        stage = {"stage": None, "name": None}
+        stage_changed = asyncio.Event()
+        lease_lost = False
+        
+        def on_progress(stage_index: int, stage_name: str) -> None:
+            stage.update(stage=stage_index, name=stage_name)
+            stage_changed.set()
+        
+        async def keep_lease() -> None:
+            # 定期续约；步骤变化时立即写回，便于随时查看任务进度
+            nonlocal lease_lost
+            while True:
+                try:
+                    await asyncio.wait_for(stage_changed.wait(), timeout=queue.lease_seconds / 3)
+                except asyncio.TimeoutError:
+                    pass
+                stage_changed.clear()
+                held = await asyncio.to_thread(queue.heartbeat, task_id, worker_id, stage["stage"], stage["name"])
+                if not held:
+                    lease_lost = True
+                    logger.warning(f"任务 {task_id} 的租约已被其他工作进程接管，中止本地执行")
+                    job_task.cancel()
+                    return
+        
+        logger.info(f"领取任务 {task_id}（第 {job['attempts']} 次尝试）: {params.get('formula')}")
+        job_task = asyncio.create_task(process_single_task(
+            formula=params.get("formula", ""),
+            duration=params.get("duration", 60),
+            style=params.get("style", "3Blue1Brown"),
+            task_id=task_id,
+            package_format=params.get("package"),
+            ending_path=params.get("ending"),
+            progress_callback=on_progress,
+            timeout=params.get("timeout")
+        ))
+        heartbeat_task = asyncio.create_task(keep_lease())
+        try:
+            result = await job_task
+        except asyncio.CancelledError:
+            if not lease_lost:
+                raise
+            counts["lost"] += 1
+            return
+        finally:
+            heartbeat_task.cancel()
+        
+        if result["success"]:
+            if await asyncio.to_thread(queue.complete, task_id, worker_id, summarize_result(result["result"])):
+                counts["done"] += 1
+                logger.info(f"任务 {task_id} 完成: {result['result']['video_path']}")
+            else:
+                counts["lost"] += 1
+                logger.warning(f"任务 {task_id} 已完成，但租约已被其他工作进程接管，结果未写入队列")
+        else:
+            state = await asyncio.to_thread(queue.fail, task_id, worker_id, result["error"])
+            if state is None:
+                counts["lost"] += 1
+                logger.warning(f"任务 {task_id} 失败，但租约已被其他工作进程接管: {result['error']}")
+            elif state == "pending":
+                counts["retry"] += 1
+                logger.warning(f"任务 {task_id} 失败，已放回队列等待重试: {result['error']}")
+            else:
+                counts["failed"] += 1
+                logger.error(f"任务 {task_id} 失败（已达最大尝试次数）: {result['error']}")
+    
+    def stopping() -> bool:
+        return stop_event is not None and stop_event.is_set()
+    
+    active = set()
+    while True:
+        while len(active) < max_concurrent and not stopping():
+            job = await asyncio.to_thread(queue.claim, worker_id)
+            if job is None:
+                break
+            active.add(asyncio.create_task(run_job(job)))
+        if not active and (stopping() or not follow):
+            break
+        if active:
+            # 常驻模式下定期醒来检查新任务，不必等到某个任务完成
+            _, active = await asyncio.wait(
+                active,
+                timeout=poll_interval if follow else None,
+                return_when=asyncio.FIRST_COMPLETED
+            )
+        else:
+            await _sleep_until_stopped(poll_interval, stop_event)
+    
+    logger.info(f"工作进程 {worker_id} 结束: {counts}")
+    return counts
+
+
+async def _sleep_until_stopped(seconds: float, stop_event: Optional[asyncio.Event]) -> None:
+    """等待 seconds 秒，stop_event 被设置时提前返回"""
+    if stop_event is None:
+        await asyncio.sleep(seconds)
+        return
+    try:
+        await asyncio.wait_for(stop_event.wait(), timeout=seconds)
+    except asyncio.TimeoutError:
+        pass
+
+
+def print_queue_status(queue: JobQueue, limit: int = 20) -> None:
+    """打印队列各状态的任务数，以及执行中和失败的任务"""
+    stats = queue.stats()
+    print(f"\n任务队列: {queue.db_path}")
+    print("=" * 50)
+    print("  ".join(f"{state}: {count}" for state, count in stats.items()))
+    for job in queue.list_jobs("running", limit):
+        stage = f"stage-{job['stage']} {job['stage_name']}" if job["stage"] else "running"
+        print(f"  ▶ {job['params'].get('formula')} (任务ID: {job['task_id']}) {stage}，第 {job['attempts']} 次尝试，{job['worker_id']}")
+    for job in queue.list_jobs("failed", limit):
+        print(f"  ✗ {job['params'].get('formula')} (任务ID: {job['task_id']}) 错误: {job['error']}")
+    print("=" * 50)
+
+
+def normalize_task(task: Any, args: argparse.Namespace) -> Optional[Dict]:
+    """把一条 JSON 任务转换为任务字典，缺省字段使用命令行参数；无效任务返回 None"""
+    if not isinstance(task, dict) or "formula" not in task:
+        return None
+    return {
+        "formula": task["formula"],
+        "duration": task.get("duration", args.duration),
+        "style": task.get("style", args.style),
+        "task_id": task.get("task_id"),
+        "package": task.get("package", args.package),
+        "ending": task.get("ending", args.ending),
+        "deadline": task.get("deadline"),
+        "timeout": task.get("timeout", args.timeout)
+    }
+
+
+def parse_json_tasks(tasks_data: Any, args: argparse.Namespace) -> List[Dict]:
+    """把 JSON 任务数组转换为任务列表，缺省字段使用命令行参数"""
+    if not isinstance(tasks_data, list):
+        raise ValueError("JSON文件必须包含一个任务数组")
+    tasks = []
+    for i, task in enumerate(tasks_data):
+        normalized = normalize_task(task, args)
+        if normalized is None:
+            print(f"警告: 跳过无效任务 #{i+1}")
+            continue
+        tasks.append(normalized)
+    return tasks
+
+
+def iter_jsonl_tasks(
+    file_path: str,
+    args: argparse.Namespace,
+    skip_task_ids: Optional[set] = None
+) -> Iterator[Dict]:
+    """
+    逐行读取 JSONL 任务文件（每行一个任务对象），无效行给出警告后跳过
+    
+    Args:
+        skip_task_ids: 需要跳过的任务ID（如结果文件中已成功的任务）
+    """
+    def warn_invalid(line_number: int, line: str) -> None:
+        print(f"警告: 跳过第 {line_number} 行（不是有效的 JSON）")
+    
+    for i, record in enumerate(iter_jsonl(file_path, on_invalid=warn_invalid)):
+        task = normalize_task(record, args)
+        if task is None:
+            print(f"警告: 跳过无效任务 #{i+1}")
+            continue
+        task["task_id"] = task_id_for(task)
+        if skip_task_ids and task["task_id"] in skip_task_ids:
+            continue
+        yield task
+
+
+def load_completed_task_ids(results_path: str) -> set:
+    """读取结果文件中已成功完成的任务ID"""
+    return {
+        record["task_id"] for record in load_jsonl(results_path)
+        if record.get("success") and record.get("task_id")
+    }
+
+
 async def main():
     """命令行入口"""
     parser = argparse.ArgumentParser(description="公式教学视频生成系统")
@@ -145,6 +570,23 @@ async def main():
         metavar="FILE",
         help="从JSON文件读取批量任务。JSON格式: [{\"formula\": \"...\", \"duration\": 60, \"style\": \"...\"}, ...]"
     )
+    parser.add_argument(
+        "--jsonl",
+        type=str,
+        metavar="FILE",
+        help="从JSONL文件流式读取批量任务（每行一个任务对象，字段同 --json），边读边执行，适合大量任务"
+    )
+    parser.add_argument(
+        "--results",
+        type=str,
+        metavar="FILE",
+        help="结果文件（JSONL），每个任务完成后立即追加一行结果，中途中断也不会丢失已完成的结果"
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="跳过 --results 结果文件中已成功的任务（按任务ID），用于中断后续跑"
+    )
     
     # 通用参数
     parser.add_argument(
@@ -165,36 +607,189 @@ async def main():
         default=3,
         help="批量处理时的最大并发数，默认 3"
     )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        metavar="SECONDS",
+        default=None,
+        help="单个任务的超时（秒），超时后中止任务并结束 Manim/ffmpeg 子进程，JSON 任务中可用 \"timeout\" 字段单独指定，默认读取 TASK_TIMEOUT（0 表示不限制）"
+    )
+    parser.add_argument(
+        "--policy",
+        type=str,
+        choices=SCHEDULING_POLICIES,
+        default=SCHEDULING_POLICY,
+        help="批量任务的调度策略：fifo（提交顺序）、sjf（预计耗时短的优先）、deadline（按任务的 deadline 字段），默认读取 SCHEDULING_POLICY"
+    )
+    parser.add_argument(
+        "--package",
+        type=str,
+        choices=["mp4", "hls", "dash"],
+        default=None,
+        help="额外输出多码率版本（一次解码生成 PACKAGE_RENDITIONS 中的各档分辨率），默认读取 PACKAGE_FORMAT"
+    )
+    parser.add_argument(
+        "--ending",
+        type=str,
+        metavar="FILE",
+        default=None,
+        help="片尾视频，在最终合并时与各片段一起编码（无需再单独运行片尾工具），默认读取 ENDING_PATH"
+    )
+    
+    # 持久化任务队列
+    parser.add_argument(
+        "--queue",
+        type=str,
+        metavar="URL",
+        default=None,
+        help="任务队列：SQLite 文件路径（或 sqlite:///路径）或 redis://host:6379/0，默认读取 JOB_QUEUE_URL / JOB_QUEUE_PATH"
+    )
+    parser.add_argument(
+        "--enqueue",
+        action="store_true",
+        help="把公式 / --batch / --json / --jsonl 中的任务加入任务队列后立即退出（相同任务ID不会重复加入）"
+    )
+    parser.add_argument(
+        "--worker",
+        action="store_true",
+        help="作为工作进程执行任务队列中的任务，直到队列中没有可领取的任务（可同时启动多个）"
+    )
+    parser.add_argument(
+        "--queue-status",
+        action="store_true",
+        help="查看任务队列中各状态的任务数，以及执行中和失败的任务"
+    )
+    parser.add_argument(
+        "--retry-failed",
+        action="store_true",
+        help="把任务队列中失败的任务放回等待队列"
+    )
     
     args = parser.parse_args()
+    if args.resume and not args.results:
+        parser.error("--resume 需要同时指定 --results")
+    
+    # 任务队列模式
+    if args.queue_status or args.retry_failed or args.worker or args.enqueue:
+        queue = open_job_queue(args.queue)
+        if args.retry_failed:
+            print(f"已把 {queue.retry_failed()} 个失败任务放回等待队列")
+        if args.enqueue:
+            try:
+                if args.jsonl:
+                    tasks = iter_jsonl_tasks(args.jsonl, args)
+                elif args.json:
+                    tasks = parse_json_tasks(load_json(args.json), args)
+                elif args.batch:
+                    tasks = [{"formula": formula} for formula in args.batch]
+                elif args.formula:
+                    tasks = [{"formula": args.formula}]
+                else:
+                    parser.error("--enqueue 需要提供公式（formula）或 --batch/--json/--jsonl")
+                # 分批加入（每批一个事务），JSONL 文件不必整体读入内存
+                total = added = 0
+                entries = []
+                for task in tasks:
+                    params = {
+                        "formula": task["formula"],
+                        "duration": task.get("duration", args.duration),
+                        "style": task.get("style", args.style),
+                        "package": task.get("package", args.package),
+                        "ending": task.get("ending", args.ending),
+                        "timeout": task.get("timeout", args.timeout),
+                    }
+                    entries.append((task.get("task_id") or task_id_for(params), params))
+                    if len(entries) >= ENQUEUE_BATCH_SIZE:
+                        added += queue.enqueue_many(entries)
+                        total += len(entries)
+                        entries = []
+                if entries:
+                    added += queue.enqueue_many(entries)
+                    total += len(entries)
+            except (FileNotFoundError, json.JSONDecodeError, ValueError) as e:
+                print(f"错误: {e}")
+                return 1
+            print(f"已加入 {added} 个任务（{total - added} 个任务ID已在队列中）: {queue.db_path}")
+        failed_count = 0
+        if args.worker:
+            counts = await run_queue_worker(queue, args.max_concurrent)
+            failed_count = counts["failed"]
+            print(
+                f"\n工作进程结束: 完成 {counts['done']}，放回重试 {counts['retry']}，失败 {counts['failed']}，"
+                f"租约被接管 {counts['lost']}"
+            )
+        print_queue_status(queue)
+        return 1 if failed_count else 0
+    
+    # 结果文件：每个任务完成后立即追加一行
+    on_result: Optional[Callable[[Dict], None]] = None
+    completed_ids: set = set()
+    if args.results:
+        if args.resume:
+            completed_ids = load_completed_task_ids(args.results)
+            print(f"续跑: 结果文件中已有 {len(completed_ids)} 个成功任务，将跳过")
+        
+        def append_result(result: Dict) -> None:
+            append_jsonl(result_record(result), args.results)
+        on_result = append_result
+    
+    def pending_tasks(tasks: List[Dict]) -> List[Dict]:
+        """续跑时去掉结果文件中已成功的任务"""
+        if not completed_ids:
+            return tasks
+        return [
+            task for task in tasks
+            if task_id_for(task, args.package, args.ending) not in completed_ids
+        ]
     
     # 确定处理模式
-    if args.json:
+    if args.jsonl:
+        # JSONL 流式模式：逐行读取，最多 max_concurrent 个任务同时执行，结果不在内存中累积
+        if not os.path.exists(args.jsonl):
+            print(f"错误: JSONL文件不存在: {args.jsonl}")
+            return 1
+        print(f"\n开始流式处理 {args.jsonl}（最大并发数: {args.max_concurrent}）...")
+        summary = await process_task_stream(
+            iter_jsonl_tasks(args.jsonl, args, skip_task_ids=completed_ids),
+            args.max_concurrent,
+            args.package,
+            args.ending,
+            on_result=on_result
+        )
+        total = summary["success"] + summary["failed"]
+        print("\n" + "="*50)
+        print(f"批量处理完成: 成功 {summary['success']}/{total}, 失败 {summary['failed']}/{total}")
+        if args.results:
+            print(f"结果文件: {args.results}")
+        print("="*50)
+        if summary["failures"]:
+            print("\n失败任务:")
+            for result in summary["failures"]:
+                print(f"  ✗ {result['formula']} (任务ID: {result['task_id']})")
+                print(f"    错误: {result['error']}")
+            print("="*50)
+        return 1 if summary["failed"] else 0
+    
+    elif args.json:
         # JSON文件模式
         try:
-            tasks_data = load_json(args.json)
-            if not isinstance(tasks_data, list):
-                print(f"错误: JSON文件必须包含一个任务数组")
+            try:
+                tasks = parse_json_tasks(load_json(args.json), args)
+            except ValueError as e:
+                print(f"错误: {e}")
                 return 1
             
-            tasks = []
-            for i, task in enumerate(tasks_data):
-                if not isinstance(task, dict) or "formula" not in task:
-                    print(f"警告: 跳过无效任务 #{i+1}")
-                    continue
-                tasks.append({
-                    "formula": task["formula"],
-                    "duration": task.get("duration", args.duration),
-                    "style": task.get("style", args.style),
-                    "task_id": task.get("task_id")
-                })
-            
             if not tasks:
                 print("错误: 没有有效的任务")
                 return 1
             
+            tasks = pending_tasks(tasks)
+            if not tasks:
+                print("所有任务均已完成")
+                return 0
+            
             print(f"\n开始批量处理 {len(tasks)} 个任务（最大并发数: {args.max_concurrent}）...")
-            results = await process_batch_tasks(tasks, args.max_concurrent)
+            results = await process_batch_tasks(tasks, args.max_concurrent, args.package, args.ending, on_result, args.policy)
             
         except FileNotFoundError:
             print(f"错误: JSON文件不存在: {args.json}")
@@ -213,13 +808,19 @@ async def main():
             {
                 "formula": formula,
                 "duration": args.duration,
-                "style": args.style
+                "style": args.style,
+                "timeout": args.timeout
             }
             for formula in args.batch
         ]
         
+        tasks = pending_tasks(tasks)
+        if not tasks:
+            print("所有任务均已完成")
+            return 0
+        
         print(f"\n开始批量处理 {len(tasks)} 个任务（最大并发数: {args.max_concurrent}）...")
-        results = await process_batch_tasks(tasks, args.max_concurrent)
+        results = await process_batch_tasks(tasks, args.max_concurrent, args.package, args.ending, on_result, args.policy)
     
     else:
         # 单个任务模式（向后兼容）
@@ -230,8 +831,13 @@ async def main():
             result = await process_single_task(
                 formula=args.formula,
                 duration=args.duration,
-                style=args.style
+                style=args.style,
+                package_format=args.package,
+                ending_path=args.ending,
+                timeout=args.timeout
             )
+            if on_result is not None:
+                on_result(result)
             results = [result]
         except Exception as e:
             logger.error(f"生成失败: {e}", exc_info=True)
@@ -250,6 +856,8 @@ async def main():
             print(f"总时长: {result['result']['total_duration']:.2f} 秒")
             print(f"剧本路径: {result['result'].get('script_path', 'N/A')}")
             print(f"代码路径: {result['result'].get('code_path', 'N/A')}")
+            if result['result'].get('package'):
+                print(f"多码率版本: {result['result']['package']['manifest_path']}")
             print(f"任务ID: {result['task_id']}")
             print("="*50)
         else:
@@ -288,6 +896,14 @@ async def main():
     return 0
 
 
+async def _run() -> int:
+    """运行命令行入口，结束时释放共享资源"""
+    try:
+        return await main()
+    finally:
+        await get_tts_engine().close()
+
+
 if __name__ == "__main__":
-    exit_code = asyncio.run(main())
+    exit_code = asyncio.run(_run())
     exit(exit_code)
@@ -19,6 +19,7 @@ class Script(BaseModel):
     """剧本"""
     title: str
     segments: List[Segment]
+    narration_path: Optional[str] = None  # 连续旁白音轨路径（单音轨模式）
     
     def get_total_duration(self) -> float:
         """计算总时长（基于音频时长）"""
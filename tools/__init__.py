@@ -4,6 +4,8 @@ from .tts_generator import TTSGenerator
 from .video_splitter import VideoSplitter
 from .video_merger import VideoMerger
 from .video_ending_appender import VideoEndingAppender
+from .chunked_encoder import ChunkedEncoder
+from .video_packager import VideoPackager
 
 __all__ = [
     "ManimExecutor",
@@ -11,4 +13,6 @@ __all__ = [
     "VideoSplitter",
     "VideoMerger",
     "VideoEndingAppender",
+    "ChunkedEncoder",
+    "VideoPackager",
 ]
\ No newline at end of file
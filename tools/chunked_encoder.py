@@ -0,0 +1,382 @@
+"""分块并行编码工具（最终编码按片段切块，多进程并行，concat 无损拼接）"""
+import os
+import asyncio
+from typing import Optional
+from models.script_model import Script
+from config import (
+    CHUNKED_ENCODE_WORKERS,
+    CHUNK_MAX_SECONDS,
+    STATIC_SPAN_VFR,
+    STATIC_SPAN_MAX_HOLD,
+    PROGRESSIVE_OUTPUT,
+    OUTPUT_PREVIEWS_DIR,
+)
+from utils.encoding import EncodingProfile, get_encoding_profile
+from utils.ffmpeg_utils import run_ffmpeg, mux_video_audio, probe_media
+from utils.cpu_budget import get_cpu_budget
+from utils.file_utils import ensure_dir, cleanup_directory
+from utils.hls_playlist import ProgressivePlaylist
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class ChunkedEncoder:
+    """
+    分块并行编码器
+
+    每个片段（过长的片段再按 GOP 整数倍细分）由独立的 ffmpeg 进程编码为封闭 GOP 的块，
+    各块编码参数完全一致，最后用 concat 分离器直接复制视频流拼接，再封装一条音轨。
+    块边界由累计时间换算为帧号，逐块取整不会累计漂移。
+    
+    启用静止画面可变帧率时，self.wait() 和冻结帧产生的连续相同帧只编码一帧并延长显示时长，
+    拼接时按各块的标称时长排列时间轴，音画同步不受影响。
+    
+    启用渐进式输出时，每个块编码完成后立即封装成带音频的 HLS 分片并追加到 EVENT 播放列表，
+    预览播放器在第一个块完成后即可开始播放，无需等待整个视频写完。
+    
+    指定片尾时，片尾缩放到档位分辨率后作为最后一个块参与同一次编码，其音频接在旁白之后。
+    """
+
+    def __init__(
+        self,
+        profile: Optional[EncodingProfile] = None,
+        workers: int = CHUNKED_ENCODE_WORKERS,
+        chunk_max_seconds: float = CHUNK_MAX_SECONDS,
+        static_vfr: bool = STATIC_SPAN_VFR,
+        max_hold_seconds: float = STATIC_SPAN_MAX_HOLD,
+        progressive: bool = PROGRESSIVE_OUTPUT,
+        preview_dir: str = OUTPUT_PREVIEWS_DIR
+    ):
+        self.profile = profile or get_encoding_profile()
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_max_seconds = chunk_max_seconds
+        self.static_vfr = static_vfr
+        self.max_hold_seconds = max_hold_seconds
+        self.progressive = progressive
+        self.preview_dir = preview_dir
+
+    async def encode(
+        self,
+        video_segments: list[tuple[int, str, float]],
+        audio_segments: list[tuple[int, str, float]],
+        script: Script,
+        output_path: str,
+        ending_path: Optional[str] = None
+    ) -> str:
+        """
+        将片段编码为最终视频
+
+        Args:
+            video_segments: [(segment_id, 视频路径, 视频时长), ...]
+            audio_segments: [(segment_id, 音频路径, 音频时长), ...]
+            script: 剧本（单音轨模式下使用 script.narration_path）
+            output_path: 输出视频路径
+            ending_path: 可选的片尾视频，作为最后一个块一起编码
+        """
+        video_segments = sorted(video_segments, key=lambda x: x[0])
+        audio_segments = sorted(audio_segments, key=lambda x: x[0])
+        if len(video_segments) != len(audio_segments):
+            raise ValueError(f"视频片段数 ({len(video_segments)}) 与音频片段数 ({len(audio_segments)}) 不匹配")
+
+        work_dir = os.path.splitext(output_path)[0] + "_chunks"
+        ensure_dir(work_dir)
+
+        try:
+            chunks = self._plan_chunks(video_segments, audio_segments)
+            ending_chunk = None
+            if ending_path:
+                ending_chunk = await self._plan_ending_chunk(ending_path, chunks)
+                chunks.append(ending_chunk)
+            logger.info(f"分块并行编码: {len(chunks)} 个块，{self.workers} 个并行进程")
+
+            semaphore = asyncio.Semaphore(self.workers)
+
+            playlist = self._create_preview_playlist(chunks, output_path) if self.progressive else None
+
+            async def encode_with_limit(index: int, chunk: dict) -> str:
+                async with semaphore:
+                    chunk_path = await self._encode_chunk(index, chunk, work_dir)
+                if playlist is not None:
+                    await self._publish_preview_segment(index, chunk, chunk_path, script, playlist)
+                return chunk_path
+
+            chunk_paths = await asyncio.gather(*[
+                encode_with_limit(index, chunk) for index, chunk in enumerate(chunks)
+            ])
+            if playlist is not None:
+                # 只有全部分片都写入后才加结束标记；有分片发布失败时保持为未结束的 EVENT 播放列表，
+                # 避免播放器把截断的预览当作完整视频
+                if playlist.published_count == len(chunks):
+                    playlist.finish()
+                else:
+                    logger.warning(
+                        f"预览播放列表只发布了 {playlist.published_count}/{len(chunks)} 个分片，不写入结束标记: "
+                        f"{playlist.playlist_path}"
+                    )
+
+            # concat 分离器直接复制视频流；显式写出各块的标称时长，
+            # 可变帧率下块末尾的静止帧被去重后，时间轴仍按帧数精确排列
+            list_path = os.path.join(work_dir, "chunks.txt")
+            with open(list_path, "w", encoding="utf-8") as f:
+                for chunk, chunk_path in zip(chunks, chunk_paths):
+                    chunk_duration = (chunk["end_frame"] - chunk["first_frame"]) / self.profile.fps
+                    f.write(f"file '{os.path.abspath(chunk_path)}'\n")
+                    f.write(f"duration {chunk_duration:.6f}\n")
+            video_only_path = os.path.join(work_dir, "video_only.mp4")
+            await run_ffmpeg(
+                ["-f", "concat", "-safe", "0", "-i", list_path, "-c", "copy", video_only_path],
+                description="拼接编码块"
+            )
+
+            await self._mux_audio(video_only_path, audio_segments, script, output_path, ending_chunk)
+        finally:
+            cleanup_directory(work_dir, force=True)
+
+        logger.info(f"分块并行编码完成: {output_path}")
+        return output_path
+
+    def _plan_chunks(
+        self,
+        video_segments: list[tuple[int, str, float]],
+        audio_segments: list[tuple[int, str, float]]
+    ) -> list[dict]:
+        """按累计音频时长计算各块的源文件、帧范围和需要补齐的冻结帧"""
+        fps = self.profile.fps
+        gop = self.profile.gop
+        # 块的最大帧数取 GOP 的整数倍，细分后的块边界落在关键帧上
+        max_chunk_frames = max(1, round(self.chunk_max_seconds * fps / gop)) * gop
+
+        chunks = []
+        current_time = 0.0
+        for (vid_id, vid_path, vid_duration), (aud_id, aud_path, aud_duration) in zip(video_segments, audio_segments):
+            if vid_id != aud_id:
+                raise ValueError(f"片段 ID 不匹配: 视频 {vid_id} vs 音频 {aud_id}")
+            if not os.path.exists(vid_path):
+                raise FileNotFoundError(f"视频文件不存在: {vid_path}")
+
+            start_frame = round(current_time * fps)
+            current_time += aud_duration
+            segment_frames = round(current_time * fps) - start_frame
+            if segment_frames <= 0:
+                continue
+
+            # 视频比音频短时用最后一帧补齐（多补一帧余量，最终按帧数截断）
+            freeze_seconds = max(0.0, aud_duration - vid_duration) + 1 / fps
+
+            # 过长的片段细分为多个块，保证并行度
+            if segment_frames > 2 * max_chunk_frames:
+                frame_ranges = [
+                    (first, min(segment_frames, first + max_chunk_frames))
+                    for first in range(0, segment_frames, max_chunk_frames)
+                ]
+            else:
+                frame_ranges = [(0, segment_frames)]
+            for first, last in frame_ranges:
+                chunks.append({
+                    "segment_id": vid_id,
+                    "source": vid_path,
+                    "first_frame": first,
+                    "end_frame": last,
+                    "freeze_seconds": freeze_seconds,
+                    "timeline_start_frame": start_frame + first,
+                    "audio_path": aud_path,
+                })
+        return chunks
+
+    async def _plan_ending_chunk(self, ending_path: str, chunks: list[dict]) -> dict:
+        """片尾块：接在最后一个片段之后，完整保留片尾时长"""
+        info = await probe_media(ending_path)
+        if not info["duration"]:
+            raise ValueError(f"无法读取片尾视频时长: {ending_path}")
+        fps = self.profile.fps
+        ending_frames = max(1, round(info["duration"] * fps))
+        timeline_start_frame = 0
+        if chunks:
+            last = chunks[-1]
+            timeline_start_frame = last["timeline_start_frame"] + last["end_frame"] - last["first_frame"]
+        logger.info(f"片尾 {ending_path}: {info['duration']:.2f}s，作为最后一个块编码")
+        return {
+            "segment_id": "ending",
+            "source": ending_path,
+            "first_frame": 0,
+            "end_frame": ending_frames,
+            "freeze_seconds": 1 / fps,
+            "timeline_start_frame": timeline_start_frame,
+            "audio_path": ending_path if info["has_audio"] else None,
+            "ending": True,
+        }
+
+    def _create_preview_playlist(self, chunks: list[dict], output_path: str) -> ProgressivePlaylist:
+        """创建渐进式预览目录和播放列表"""
+        preview_dir = os.path.join(self.preview_dir, os.path.splitext(os.path.basename(output_path))[0])
+        cleanup_directory(preview_dir, force=True)
+        ensure_dir(preview_dir)
+        max_duration = max((c["end_frame"] - c["first_frame"]) / self.profile.fps for c in chunks)
+        playlist = ProgressivePlaylist(os.path.join(preview_dir, "index.m3u8"), max_duration)
+        logger.info(f"渐进式预览播放列表: {playlist.playlist_path}")
+        return playlist
+
+    async def _publish_preview_segment(
+        self,
+        index: int,
+        chunk: dict,
+        chunk_path: str,
+        script: Script,
+        playlist: ProgressivePlaylist
+    ) -> None:
+        """将编码好的块与对应的音频封装为 HLS 分片并追加到预览播放列表（失败不影响最终视频）"""
+        fps = self.profile.fps
+        duration = (chunk["end_frame"] - chunk["first_frame"]) / fps
+        start_time = chunk["timeline_start_frame"] / fps
+        if chunk.get("ending"):
+            audio_path, audio_offset = chunk["audio_path"], 0.0
+        elif script.narration_path:
+            audio_path, audio_offset = script.narration_path, start_time
+        else:
+            audio_path, audio_offset = chunk["audio_path"], chunk["first_frame"] / fps
+        if audio_path:
+            audio_input = ["-ss", f"{audio_offset:.6f}", "-i", audio_path]
+        else:
+            # 没有音频的片尾用静音补齐，保证预览分片都带音轨
+            audio_input = ["-f", "lavfi", "-i", "anullsrc"]
+
+        preview_dir = os.path.dirname(playlist.playlist_path)
+        segment_path = os.path.join(preview_dir, f"segment_{index:05d}.ts")
+        temp_path = segment_path + ".tmp"
+        try:
+            await run_ffmpeg(
+                [
+                    "-i", chunk_path,
+                    *audio_input,
+                    "-map", "0:v:0",
+                    "-map", "1:a:0",
+                    "-af", "apad",
+                    "-t", f"{duration:.6f}",
+                    "-c:v", "copy",
+                    "-c:a", "aac",
+                    "-b:a", self.profile.audio_bitrate,
+                    "-f", "mpegts",
+                    "-output_ts_offset", f"{start_time:.6f}",
+                    temp_path,
+                ],
+                description=f"封装预览分片 {index}"
+            )
+            os.replace(temp_path, segment_path)
+        except Exception as e:
+            logger.warning(f"预览分片 {index} 生成失败，预览播放列表将停在此处: {e}")
+            return
+
+        if playlist.add_segment(index, segment_path, duration):
+            logger.info(f"预览播放列表已更新: 已有 {playlist.published_count} 个分片可播放")
+
+    async def _encode_chunk(self, index: int, chunk: dict, work_dir: str) -> str:
+        """
+        编码单个块（封闭 GOP，首帧为关键帧）
+
+        线程数从全局 CPU 预算领取：同时编码的块（包括其他任务的块）越多，每个进程分到的线程越少，
+        避免并行进程之间超额争抢 CPU
+        """
+        fps = self.profile.fps
+        chunk_path = os.path.join(work_dir, f"chunk_{index:04d}.mp4")
+        filters = []
+        if chunk.get("ending"):
+            # 片尾分辨率可能与档位不同，缩放后与其余块保持一致才能直接拼接
+            filters.append(f"scale={self.profile.width}:{self.profile.height},setsar=1")
+        filters += [
+            f"fps={fps}",
+            f"tpad=stop_mode=clone:stop_duration={chunk['freeze_seconds']:.6f}",
+            f"trim=start_frame={chunk['first_frame']}:end_frame={chunk['end_frame']}",
+            "setpts=PTS-STARTPTS",
+        ]
+        if self.static_vfr:
+            filters.append(self.profile.static_span_filter(self.max_hold_seconds))
+
+        # 同一任务的各块并行编码，每块最多分到预算的 1/workers，先开始的块不会占满全部线程
+        budget = get_cpu_budget()
+        with budget.lease(f"编码块 {index}", max_threads=max(1, budget.total_threads // self.workers)) as lease:
+            video_args = self.profile.with_threads(lease.threads).ffmpeg_video_args(vfr=self.static_vfr)
+            await run_ffmpeg(
+                [
+                    "-i", chunk["source"],
+                    "-an",
+                    "-vf", ",".join(filters),
+                    *video_args,
+                    "-flags", "+cgop",
+                    chunk_path,
+                ],
+                description=f"编码块 {index}（片段 {chunk['segment_id']}）",
+                cpu_lease=lease
+            )
+        return chunk_path
+
+    async def _mux_audio(
+        self,
+        video_only_path: str,
+        audio_segments: list[tuple[int, str, float]],
+        script: Script,
+        output_path: str,
+        ending_chunk: Optional[dict] = None
+    ) -> None:
+        """封装音轨：AAC 旁白直接复制，其余情况（包括带片尾）编码一次 AAC"""
+        narration_path = script.narration_path
+        if narration_path and narration_path.endswith(".m4a") and ending_chunk is None:
+            await mux_video_audio(video_only_path, narration_path, output_path)
+            return
+
+        audio_inputs = []
+        filters = []
+        if narration_path:
+            audio_inputs = [narration_path]
+            audio_label = "[1:a]"
+        else:
+            # 逐片段音频按顺序拼接为一条音轨
+            for _, aud_path, _ in audio_segments:
+                if not os.path.exists(aud_path):
+                    raise FileNotFoundError(f"音频文件不存在: {aud_path}")
+                audio_inputs.append(aud_path)
+            inputs = "".join(f"[{i + 1}:a]" for i in range(len(audio_segments)))
+            filters.append(f"{inputs}concat=n={len(audio_segments)}:v=0:a=1[narration]")
+            audio_label = "[narration]"
+
+        if ending_chunk is not None:
+            fps = self.profile.fps
+            main_duration = ending_chunk["timeline_start_frame"] / fps
+            total_duration = main_duration + (ending_chunk["end_frame"] - ending_chunk["first_frame"]) / fps
+            # 旁白按视频时间轴补齐或截断，片尾音频从片尾第一帧开始
+            filters.append(
+                f"{audio_label}apad=whole_dur={main_duration:.6f},atrim=end={main_duration:.6f}[main]"
+            )
+            if ending_chunk["audio_path"]:
+                audio_inputs.append(ending_chunk["audio_path"])
+                filters.append(
+                    f"[main][{len(audio_inputs)}:a]concat=n=2:v=0:a=1,"
+                    f"apad=whole_dur={total_duration:.6f},atrim=end={total_duration:.6f}[audio]"
+                )
+            else:
+                filters.append(f"[main]apad=whole_dur={total_duration:.6f}[audio]")
+            audio_label = "[audio]"
+
+        audio_args = []
+        for path in audio_inputs:
+            audio_args += ["-i", path]
+        if filters:
+            audio_args += ["-filter_complex", ";".join(filters)]
+            audio_map = audio_label
+        else:
+            audio_map = "1:a:0"
+
+        await run_ffmpeg(
+            [
+                "-i", video_only_path,
+                *audio_args,
+                "-map", "0:v:0",
+                "-map", audio_map,
+                "-c:v", "copy",
+                "-c:a", "aac",
+                "-b:a", self.profile.audio_bitrate,
+                "-movflags", "+faststart",
+                output_path,
+            ],
+            description=f"封装音视频 {output_path}"
+        )
@@ -4,8 +4,11 @@ import asyncio
 import os
 from typing import Optional
 from utils.validation import LaTeXValidator
-from config import MANIM_OUTPUT_DIR, MANIM_QUALITY, TEMP_BASE_DIR
+from config import MANIM_OUTPUT_DIR, MANIM_QUALITY, TEMP_BASE_DIR, OUTPUT_MANIM_CODE_DIR
 from utils.file_utils import ensure_dir, get_task_subdir
+from utils.deadline import communicate_with_deadline, subprocess_kwargs
+from utils.cpu_budget import get_cpu_budget
+from utils.encoding import EncodingProfile, get_encoding_profile
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
@@ -18,10 +21,13 @@ class ManimExecutor:
         self, 
         output_dir: str = MANIM_OUTPUT_DIR, 
         quality: str = MANIM_QUALITY,
-        task_id: Optional[str] = None
+        task_id: Optional[str] = None,
+        profile: Optional[EncodingProfile] = None
     ):
         self.output_dir = output_dir
-        self.quality = quality
+        # 渲染档位决定分辨率和帧率，质量档位随档位确定
+        self.profile = profile or get_encoding_profile(quality=quality)
+        self.quality = self.profile.manim_quality
         self.task_id = task_id
         ensure_dir(output_dir)
     
@@ -115,7 +121,7 @@ class ManimExecutor:
             manim_code_dir = get_task_subdir(self.task_id, "manim_code", TEMP_BASE_DIR)
             temp_file = os.path.join(manim_code_dir, f"{scene_name.lower()}_temp.py")
         else:
-            temp_file = os.path.join("./output/manim_code", f"{scene_name.lower()}_temp.py")
+            temp_file = os.path.join(OUTPUT_MANIM_CODE_DIR, f"{scene_name.lower()}_temp.py")
             ensure_dir(os.path.dirname(temp_file))
         
         # 使用异步文件写入
@@ -127,33 +133,35 @@ class ManimExecutor:
         if output_filename is None:
             output_filename = scene_name
         
-        # 4. 确定质量参数
-        quality_map = {
-            "low_quality": "-ql",
-            "medium_quality": "-qm",
-            "high_quality": "-qh"
-        }
-        quality_flag = quality_map.get(self.quality, "-qm")
-        
-        # 5. 执行 manim 命令（异步）
+        # 4-5. 执行 manim 命令（异步，质量档位 + 渲染档位的分辨率和帧率）
         cmd = [
             "manim",
-            quality_flag,
-            temp_file,
-            scene_name
+            *self.profile.manim_args(),
         ]
+        # 有 task_id 时 Manim 的全部输出（视频、分段缓存、LaTeX 缓存）写入任务临时目录，
+        # 多个任务（包括共享存储上不同机器的任务）不会写到同一个 media 目录
+        task_media_dir = None
+        if self.task_id:
+            task_media_dir = get_task_subdir(self.task_id, "manim_media", TEMP_BASE_DIR)
+            cmd += ["--media_dir", task_media_dir]
+        cmd += [temp_file, scene_name]
         
         logger.info(f"执行 Manim 命令: {' '.join(cmd)}")
         
-        # 使用异步子进程执行
-        process = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
-            cwd=os.getcwd()
-        )
-        
-        stdout, stderr = await process.communicate()
+        # 使用异步子进程执行；超过任务截止时间或任务被取消时结束 manim 及其派生的 latex / ffmpeg 进程。
+        # 数值库线程数按 CPU 预算限制，多个任务同时渲染时不会各自占满全部核
+        with get_cpu_budget().lease("Manim 渲染") as lease:
+            process = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                cwd=os.getcwd(),
+                env=lease.env(),
+                **subprocess_kwargs(),
+                **lease.popen_kwargs()
+            )
+            
+            stdout, stderr = await communicate_with_deadline(process, "Manim 渲染")
         
         if process.returncode != 0:
             stderr_text = stderr.decode('utf-8') if stderr else ""
@@ -174,7 +182,7 @@ class ManimExecutor:
             "medium_quality": ["720p30", "medium"],
             "high_quality": ["1080p60", "high"]
         }
-        quality_dirs = quality_to_dir.get(self.quality, ["720p30", "medium"])
+        quality_dirs = [self.profile.manim_dir_name] + quality_to_dir.get(self.quality, ["720p30", "medium"])
         quality_name = self.quality.replace("_quality", "")
         
         # 构建可能的路径列表（优先级从高到低）
@@ -182,7 +190,7 @@ class ManimExecutor:
         
         # 如果有 task_id，优先在任务专属目录中查找
         if self.task_id:
-            task_manim_output_dir = get_task_subdir(self.task_id, "manim_output", TEMP_BASE_DIR)
+            task_manim_output_dir = os.path.join(task_media_dir, "videos")
             for q_dir in quality_dirs:
                 possible_dirs.append(os.path.join(task_manim_output_dir, temp_basename, q_dir))
                 possible_dirs.append(os.path.join(task_manim_output_dir, temp_dirname, q_dir))
@@ -0,0 +1,212 @@
+"""可插拔的 TTS 后端"""
+import wave
+import asyncio
+import aiofiles
+from abc import ABC, abstractmethod
+from typing import Optional
+from config import (
+    TTS_BACKEND,
+    TTS_SERVER_URL,
+    TTS_ESPEAK_BINARY,
+    TTS_ESPEAK_VOICE,
+    TTS_ESPEAK_SPEED,
+    TTS_SYNTHETIC_CHARS_PER_SECOND,
+)
+from utils.deadline import communicate_with_deadline, subprocess_kwargs
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class TTSBackend(ABC):
+    """TTS 后端接口：把一段文本合成为音频文件"""
+
+    name: str = ""
+    file_extension: str = ".mp3"
+
+    @abstractmethod
+    async def synthesize(self, text: str, voice: str, output_path: str) -> None:
+        """合成语音并保存到 output_path"""
+
+    async def close(self) -> None:
+        """释放后端持有的连接等资源"""
+
+    def is_transient_error(self, error: Exception) -> bool:
+        """
+        合成失败是否为瞬时错误（超时、连接中断、HTTP 408 / 429 / 5xx），只有瞬时错误才值得重试
+
+        其余 HTTP 4xx、参数错误、程序缺失等重试也不会成功，直接失败
+        """
+        status = getattr(error, "status", None)
+        if isinstance(status, int):
+            return status in (408, 429) or status >= 500
+        return isinstance(error, (TimeoutError, ConnectionError))
+
+
+class EdgeTTSBackend(TTSBackend):
+    """
+    edge-tts 后端（微软在线服务）
+
+    edge-tts 每次合成都会新建 websocket 会话并自行关闭连接器，无法复用连接
+    """
+
+    name = "edge"
+    file_extension = ".mp3"
+
+    async def synthesize(self, text: str, voice: str, output_path: str) -> None:
+        import edge_tts
+
+        communicate = edge_tts.Communicate(text, voice)
+        await communicate.save(output_path)
+
+    def is_transient_error(self, error: Exception) -> bool:
+        import aiohttp
+        from edge_tts.exceptions import EdgeTTSException
+
+        # edge-tts 的服务端异常（未收到音频、websocket 错误、意外响应）都是偶发的
+        return super().is_transient_error(error) or isinstance(
+            error, (EdgeTTSException, aiohttp.ClientConnectionError, aiohttp.ClientPayloadError)
+        )
+
+
+class HttpTTSBackend(TTSBackend):
+    """
+    HTTP TTS 服务后端（如 tools.tts_stub_server 本地替身服务）
+
+    协议：POST {server_url}，JSON 请求体 {"text": ..., "voice": ...}，响应体为 MP3 音频。
+    所有请求共享一个 keep-alive 会话。
+    """
+
+    name = "http"
+    file_extension = ".mp3"
+
+    def __init__(self, server_url: Optional[str] = TTS_SERVER_URL):
+        if not server_url:
+            raise ValueError("HTTP TTS 后端需要设置 TTS_SERVER_URL")
+        self.server_url = server_url
+        self._session = None
+
+    async def synthesize(self, text: str, voice: str, output_path: str) -> None:
+        session = await self._get_session()
+        async with session.post(self.server_url, json={"text": text, "voice": voice}) as response:
+            response.raise_for_status()
+            audio_data = await response.read()
+        async with aiofiles.open(output_path, 'wb') as f:
+            await f.write(audio_data)
+
+    async def _get_session(self):
+        """获取共享的 HTTP 会话（延迟创建，连接池 keep-alive 复用）"""
+        if self._session is None or self._session.closed:
+            import aiohttp
+
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=0, keepalive_timeout=60)
+            )
+        return self._session
+
+    def is_transient_error(self, error: Exception) -> bool:
+        import aiohttp
+
+        return super().is_transient_error(error) or isinstance(
+            error, (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError)
+        )
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+class EspeakTTSBackend(TTSBackend):
+    """
+    espeak-ng 命令行后端（离线，输出 WAV）
+
+    edge-tts 的语音名称对 espeak-ng 无效，统一使用 TTS_ESPEAK_VOICE
+    """
+
+    name = "espeak"
+    file_extension = ".wav"
+
+    def __init__(
+        self,
+        binary: str = TTS_ESPEAK_BINARY,
+        voice: str = TTS_ESPEAK_VOICE,
+        speed: int = TTS_ESPEAK_SPEED
+    ):
+        self.binary = binary
+        self.voice = voice
+        self.speed = speed
+
+    async def synthesize(self, text: str, voice: str, output_path: str) -> None:
+        try:
+            process = await asyncio.create_subprocess_exec(
+                self.binary, "-v", self.voice, "-s", str(self.speed),
+                "-w", output_path, "--stdin",
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE,
+                **subprocess_kwargs()
+            )
+        except FileNotFoundError:
+            raise RuntimeError(f"未找到 {self.binary}，请先安装 espeak-ng 或设置 TTS_ESPEAK_BINARY")
+
+        _, stderr = await communicate_with_deadline(process, "espeak-ng 合成", text.encode("utf-8"))
+        if process.returncode != 0:
+            error_msg = stderr.decode("utf-8", errors="ignore").strip()
+            raise RuntimeError(f"espeak-ng 合成失败 (返回码 {process.returncode}): {error_msg}")
+
+
+class SyntheticTTSBackend(TTSBackend):
+    """
+    确定性的合成音频后端（离线，输出静音 WAV）
+
+    时长只由文本长度决定，同样的文本总是得到同样时长的音频，
+    用于压测和渲染流水线基准测试，不依赖任何外部服务或程序
+    """
+
+    name = "synthetic"
+    file_extension = ".wav"
+
+    SAMPLE_RATE = 24000
+
+    def __init__(self, chars_per_second: float = TTS_SYNTHETIC_CHARS_PER_SECOND):
+        if chars_per_second <= 0:
+            raise ValueError("TTS_SYNTHETIC_CHARS_PER_SECOND 必须大于 0")
+        self.chars_per_second = chars_per_second
+
+    def estimate_duration(self, text: str) -> float:
+        """按文本长度估算朗读时长（忽略空白字符，最短 0.5 秒）"""
+        char_count = sum(1 for ch in text if not ch.isspace())
+        return max(0.5, char_count / self.chars_per_second)
+
+    async def synthesize(self, text: str, voice: str, output_path: str) -> None:
+        frame_count = round(self.estimate_duration(text) * self.SAMPLE_RATE)
+        await asyncio.to_thread(self._write_silence, output_path, frame_count)
+
+    def _write_silence(self, output_path: str, frame_count: int) -> None:
+        with wave.open(output_path, "wb") as wav_file:
+            wav_file.setnchannels(1)
+            wav_file.setsampwidth(2)
+            wav_file.setframerate(self.SAMPLE_RATE)
+            wav_file.writeframes(bytes(frame_count * 2))
+
+
+TTS_BACKENDS = {
+    backend.name: backend
+    for backend in (EdgeTTSBackend, HttpTTSBackend, EspeakTTSBackend, SyntheticTTSBackend)
+}
+
+
+def create_tts_backend(name: Optional[str] = None) -> TTSBackend:
+    """
+    按名称创建 TTS 后端
+
+    Args:
+        name: edge / http / espeak / synthetic；为空时读取 TTS_BACKEND，
+              仍未设置则在配置了 TTS_SERVER_URL 时使用 http，否则使用 edge
+    """
+    name = (name or TTS_BACKEND or ("http" if TTS_SERVER_URL else "edge")).lower()
+    if name not in TTS_BACKENDS:
+        raise ValueError(f"未知的 TTS 后端: {name}，可选: {', '.join(TTS_BACKENDS)}")
+    logger.info(f"使用 TTS 后端: {name}")
+    return TTS_BACKENDS[name]()
@@ -0,0 +1,116 @@
+"""TTS 合成引擎（全局并发上限 + 逐片段重试 + 连接复用）"""
+import os
+import random
+import asyncio
+from typing import Optional
+from config import (
+    TTS_MAX_CONCURRENT,
+    TTS_MAX_RETRIES,
+    TTS_RETRY_BASE_DELAY,
+    TTS_REQUEST_TIMEOUT,
+)
+from tools.tts_backends import TTSBackend, create_tts_backend
+from utils.file_utils import ensure_dir
+from utils.deadline import bounded_timeout, remaining_time
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class TTSEngine:
+    """
+    进程内共享的 TTS 合成引擎
+
+    - 全局并发上限：所有任务的所有片段共用一个信号量，避免同时打开过多 websocket 会话
+    - 逐片段重试：单个片段的瞬时失败（超时、连接错误、429 / 5xx）按指数退避 + 抖动重试，不再拖垮整个视频；
+      其余错误（如 HTTP 4xx）直接失败
+    - 连接复用：由后端负责，HTTP 后端所有请求共享一个 keep-alive 会话
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = TTS_MAX_CONCURRENT,
+        max_retries: int = TTS_MAX_RETRIES,
+        retry_base_delay: float = TTS_RETRY_BASE_DELAY,
+        request_timeout: float = TTS_REQUEST_TIMEOUT,
+        backend: Optional[TTSBackend] = None
+    ):
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.request_timeout = request_timeout
+        self.backend = backend or create_tts_backend()
+        self._semaphore = asyncio.Semaphore(max(1, max_concurrent))
+
+    @property
+    def file_extension(self) -> str:
+        """当前后端输出音频的扩展名"""
+        return self.backend.file_extension
+
+    async def synthesize(self, text: str, voice: str, output_path: str) -> None:
+        """合成语音并保存到 output_path，失败时自动重试（单次超时和重试都不超过任务截止时间）"""
+        ensure_dir(os.path.dirname(output_path))
+        attempt = 0
+        while True:
+            try:
+                async with self._semaphore:
+                    await asyncio.wait_for(
+                        self._synthesize_once(text, voice, output_path),
+                        timeout=bounded_timeout(self.request_timeout)
+                    )
+            except asyncio.CancelledError:
+                self._remove_partial(output_path)
+                raise
+            except Exception as e:
+                error, transient = e, self.backend.is_transient_error(e)
+            else:
+                if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
+                    return
+                # 服务端偶发返回空音频，按瞬时错误重试
+                error, transient = RuntimeError("TTS 未返回任何音频数据"), True
+
+            self._remove_partial(output_path)
+            if not transient:
+                logger.error(f"TTS 合成失败（{type(error).__name__}，不可重试）: {error}")
+                raise error
+            if attempt >= self.max_retries:
+                logger.error(f"TTS 合成失败，已重试 {self.max_retries} 次: {error}")
+                raise error
+            delay = random.uniform(0, self.retry_base_delay * (2 ** attempt))
+            remaining = remaining_time()
+            if remaining is not None and remaining <= delay:
+                logger.error(f"TTS 合成失败，剩余时间不足以重试: {error}")
+                raise error
+            attempt += 1
+            logger.warning(
+                f"TTS 合成失败（{type(error).__name__}: {error}），{delay:.1f}s 后重试 "
+                f"(第 {attempt}/{self.max_retries} 次): {os.path.basename(output_path)}"
+            )
+            await asyncio.sleep(delay)
+
+    async def _synthesize_once(self, text: str, voice: str, output_path: str) -> None:
+        """执行一次合成"""
+        await self.backend.synthesize(text, voice, output_path)
+
+    async def close(self) -> None:
+        """释放后端持有的连接"""
+        await self.backend.close()
+
+    @staticmethod
+    def _remove_partial(output_path: str) -> None:
+        """删除失败时残留的不完整音频文件"""
+        try:
+            if os.path.exists(output_path):
+                os.remove(output_path)
+        except OSError as e:
+            logger.warning(f"删除不完整的音频文件失败 {output_path}: {e}")
+
+
+_tts_engine: Optional[TTSEngine] = None
+
+
+def get_tts_engine() -> TTSEngine:
+    """获取进程内共享的 TTS 引擎"""
+    global _tts_engine
+    if _tts_engine is None:
+        _tts_engine = TTSEngine()
+    return _tts_engine
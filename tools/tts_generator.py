@@ -1,12 +1,25 @@
-"""edge-tts 语音生成工具（返回精确时长）"""
-import edge_tts
+"""TTS 语音生成工具（返回精确时长）"""
 import asyncio
 import os
+import wave
 from typing import Optional
-from mutagen.mp3 import MP3
+import mutagen
 from models.script_model import Script, Segment
-from config import TTS_OUTPUT_DIR, TTS_VOICE, TEMP_BASE_DIR
+from config import (
+    TTS_OUTPUT_DIR,
+    TTS_VOICE,
+    TEMP_BASE_DIR,
+    TTS_SINGLE_TRACK,
+    TTS_NARRATION_SAMPLE_RATE,
+    TTS_AUDIO_FORMAT,
+    TTS_AAC_BITRATE,
+)
 from utils.file_utils import ensure_dir, cleanup_segment_files, get_task_subdir
+from utils.ffmpeg_utils import decode_to_pcm, encode_aac
+from utils.logger import get_logger
+from tools.tts_engine import TTSEngine, get_tts_engine
+
+logger = get_logger(__name__)
 
 
 class TTSGenerator:
@@ -16,10 +29,20 @@ class TTSGenerator:
         self, 
         voice: str = TTS_VOICE, 
         output_dir: str = TTS_OUTPUT_DIR,
-        task_id: Optional[str] = None
+        task_id: Optional[str] = None,
+        engine: Optional[TTSEngine] = None,
+        single_track: bool = TTS_SINGLE_TRACK,
+        audio_format: str = TTS_AUDIO_FORMAT
     ):
+        if audio_format not in ("auto", "aac"):
+            raise ValueError(f"不支持的 TTS_AUDIO_FORMAT: {audio_format}，可选: auto, aac")
         self.voice = voice
         self.task_id = task_id
+        self.audio_format = audio_format
+        # AAC 模式只编码一次整条旁白，因此隐含单音轨模式
+        self.single_track = single_track or audio_format == "aac"
+        # 默认使用进程内共享的引擎，所有任务共用同一个并发上限
+        self.engine = engine or get_tts_engine()
         # 如果有 task_id，使用任务专属目录；否则使用默认目录（向后兼容）
         if task_id:
             self.output_dir = get_task_subdir(task_id, "audio_segments", TEMP_BASE_DIR)
@@ -34,15 +57,16 @@ class TTSGenerator:
         """为单个片段生成音频，返回 (音频路径, 精确时长)"""
         output_path = os.path.join(
             self.output_dir, 
-            f"segment_{segment.segment_id}.mp3"
+            f"segment_{segment.segment_id}{self.engine.file_extension}"
         )
         
-        # 生成音频
-        communicate = edge_tts.Communicate(segment.tts_text, self.voice)
-        await communicate.save(output_path)
+        # 生成音频（并发上限和失败重试由 TTS 引擎统一处理）
+        await self.engine.synthesize(segment.tts_text, self.voice, output_path)
         
         # 获取精确时长
-        audio = MP3(output_path)
+        audio = mutagen.File(output_path)
+        if audio is None:
+            raise RuntimeError(f"无法识别的音频文件: {output_path}")
         duration = audio.info.length
         
         # 更新 segment
@@ -51,22 +75,105 @@ class TTSGenerator:
         
         return output_path, duration
     
+    def cleanup_segments(self) -> None:
+        """清理旧的音频片段文件，防止复用旧文件"""
+        if self.task_id:
+            # 任务专属目录，清理该任务的文件
+            cleanup_segment_files(self.output_dir, "segment_*")
+        else:
+            # 向后兼容：清理全局目录的文件
+            cleanup_segment_files(self.output_dir, "segment_*")
+    
     async def generate_all_segments(
         self, 
         script: Script
     ) -> Script:
         """为所有片段生成音频，更新 script 中的音频时长"""
-        # 清理旧的音频片段文件，防止复用旧文件（仅在任务专属目录中清理）
-        if self.task_id:
-            # 任务专属目录，清理该任务的文件
-            cleanup_segment_files(self.output_dir, "segment_*.mp3")
-        else:
-            # 向后兼容：清理全局目录的文件
-            cleanup_segment_files(self.output_dir, "segment_*.mp3")
+        self.cleanup_segments()
         
         tasks = [
             self.generate_segment_audio(seg) 
             for seg in script.segments
         ]
         await asyncio.gather(*tasks)
+        return await self.finalize_audio(script)
+    
+    async def finalize_audio(self, script: Script) -> Script:
+        """所有片段音频生成后，记录片段起止时间（单音轨模式下同时拼接旁白音轨）"""
+        if self.single_track:
+            await self.build_narration_track(script)
+        else:
+            self._assign_offsets(script)
         return script
+    
+    async def build_narration_track(
+        self,
+        script: Script,
+        sample_rate: int = TTS_NARRATION_SAMPLE_RATE
+    ) -> str:
+        """
+        将所有片段音频拼接为一条连续的旁白音轨（WAV）
+        
+        每个片段解码为 PCM 后按顺序首尾相接，片段时长按采样数计算，
+        start_time/end_time 精确到采样点，消除 MP3 编码器延迟带来的间隙和累计漂移。
+        合并时只需为整段视频挂载这一条音轨。
+        AAC 模式下旁白在这里一次性编码为 M4A，后续环节直接复制音频流。
+        
+        Returns:
+            旁白音轨路径（同时写入 script.narration_path）
+        """
+        segments = sorted(script.segments, key=lambda seg: seg.segment_id)
+        for segment in segments:
+            if not segment.audio_path or not os.path.exists(segment.audio_path):
+                raise FileNotFoundError(f"片段 {segment.segment_id} 的音频文件不存在: {segment.audio_path}")
+        
+        pcm_chunks = await asyncio.gather(*[
+            decode_to_pcm(segment.audio_path, sample_rate)
+            for segment in segments
+        ])
+        
+        bytes_per_sample = 2  # 16 位单声道
+        total_samples = 0
+        for segment, pcm in zip(segments, pcm_chunks):
+            sample_count = len(pcm) // bytes_per_sample
+            segment.start_time = total_samples / sample_rate
+            total_samples += sample_count
+            segment.end_time = total_samples / sample_rate
+            segment.audio_duration = sample_count / sample_rate
+        
+        output_path = os.path.join(self.output_dir, "narration.wav")
+        await asyncio.to_thread(self._write_wav, output_path, pcm_chunks, sample_rate)
+        
+        if self.audio_format == "aac":
+            wav_path = output_path
+            output_path = os.path.join(self.output_dir, "narration.m4a")
+            await encode_aac(wav_path, output_path, TTS_AAC_BITRATE)
+            os.remove(wav_path)
+        script.narration_path = output_path
+        
+        logger.info(
+            f"旁白音轨已生成: {output_path}, 总时长 {total_samples / sample_rate:.3f}s "
+            f"({total_samples} 个采样点)"
+        )
+        return output_path
+    
+    @staticmethod
+    def _assign_offsets(script: Script) -> None:
+        """按音频时长依次累加，记录各片段在最终视频中的起止时间"""
+        current_time = 0.0
+        for segment in sorted(script.segments, key=lambda seg: seg.segment_id):
+            if segment.audio_duration is None:
+                continue
+            segment.start_time = current_time
+            current_time += segment.audio_duration
+            segment.end_time = current_time
+    
+    @staticmethod
+    def _write_wav(output_path: str, pcm_chunks: list[bytes], sample_rate: int) -> None:
+        """写入 16 位单声道 WAV"""
+        with wave.open(output_path, "wb") as wav_file:
+            wav_file.setnchannels(1)
+            wav_file.setsampwidth(2)
+            wav_file.setframerate(sample_rate)
+            for pcm in pcm_chunks:
+                wav_file.writeframes(pcm)
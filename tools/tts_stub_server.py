@@ -0,0 +1,67 @@
+"""本地替身 TTS 服务（用于压测和离线测试 TTS 引擎）"""
+import random
+import asyncio
+import argparse
+from aiohttp import web
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# MPEG-1 Layer III，128kbps，44.1kHz，单声道，无 CRC
+_MP3_FRAME_HEADER = bytes([0xFF, 0xFB, 0x90, 0xC0])
+_MP3_FRAME_SIZE = 144 * 128000 // 44100
+_MP3_FRAME_DURATION = 1152 / 44100
+
+
+def build_silent_mp3(duration: float) -> bytes:
+    """生成指定时长的静音 MP3（全零主数据帧，解码结果为静音）"""
+    frame = _MP3_FRAME_HEADER + bytes(_MP3_FRAME_SIZE - len(_MP3_FRAME_HEADER))
+    frame_count = max(1, round(duration / _MP3_FRAME_DURATION))
+    return frame * frame_count
+
+
+def estimate_speech_duration(text: str, seconds_per_char: float = 0.22) -> float:
+    """按文本长度估算朗读时长（中文语速约每秒 4-5 字）"""
+    return max(0.5, len(text.strip()) * seconds_per_char)
+
+
+def create_app(latency: float = 0.0, fail_rate: float = 0.0) -> web.Application:
+    """
+    创建替身服务
+
+    Args:
+        latency: 每个请求的模拟延迟（秒）
+        fail_rate: 随机返回 503 的概率，用于验证重试逻辑
+    """
+    async def synthesize(request: web.Request) -> web.Response:
+        payload = await request.json()
+        text = payload.get("text", "")
+        if latency > 0:
+            await asyncio.sleep(latency)
+        if fail_rate > 0 and random.random() < fail_rate:
+            return web.Response(status=503, text="模拟的瞬时故障")
+        audio = build_silent_mp3(estimate_speech_duration(text))
+        return web.Response(body=audio, content_type="audio/mpeg")
+
+    app = web.Application()
+    app.router.add_post("/", synthesize)
+    app.router.add_post("/tts", synthesize)
+    return app
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="本地替身 TTS 服务（返回按文本长度计时的静音 MP3）")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="监听地址，默认 127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765, help="监听端口，默认 8765")
+    parser.add_argument("--latency", type=float, default=0.0, help="每个请求的模拟延迟（秒），默认 0")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="随机返回 503 的概率，默认 0")
+    args = parser.parse_args()
+
+    print(f"替身 TTS 服务: http://{args.host}:{args.port}/tts")
+    print(f"设置 TTS_SERVER_URL=http://{args.host}:{args.port}/tts 即可让 TTS 引擎使用该服务")
+    web.run_app(create_app(args.latency, args.fail_rate), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,17 @@
 """视频片尾添加工具"""
 import os
 import glob
+import time
+import hashlib
 import warnings
 import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from typing import Optional, List, Dict, Any
 from moviepy import VideoFileClip, concatenate_videoclips
-from utils.file_utils import ensure_dir
+from config import ENDING_STREAM_COPY, ENDING_CACHE_DIR, ENDING_WORKERS, OUTPUT_VIDEOS_DIR
+from utils.file_utils import ensure_dir, append_jsonl, load_jsonl
+from utils.encoding import EncodingProfile, get_encoding_profile
+from utils.ffmpeg_utils import run_ffmpeg_sync, probe_media_sync, read_h264_parameter_sets
 from utils.logger import get_logger
 
 # 抑制 moviepy 的 "Proc not detected" 警告
@@ -16,24 +22,51 @@ logger = get_logger(__name__)
 # 支持的视频格式
 VIDEO_EXTENSIONS = ['.mp4', '.avi', '.mov', '.mkv', '.flv', '.wmv', '.m4v']
 
+# 批量处理结果日志（位于输出目录下，用于跳过已是最新的视频）
+RESULTS_LOG_NAME = "ending_results.jsonl"
+
+# ffmpeg -i 输出的 H.264 profile 名称 -> x264 的 -profile:v 参数
+H264_PROFILES = {
+    "Constrained Baseline": "baseline",
+    "Baseline": "baseline",
+    "Main": "main",
+    "High": "high",
+}
+
 
 class VideoEndingAppender:
-    """视频片尾添加器"""
+    """
+    视频片尾添加器
+
+    默认按主视频的分辨率、帧率、像素格式、H.264 profile 和音频参数把片尾转码一次并缓存，
+    之后每个视频只需用 concat 分离器直接复制流拼接，不再重新编码主视频。
+    主视频不是 H.264/AAC、缓存的片尾参数对不上或两者的 H.264 参数集（SPS/PPS）不同时，
+    回退到 moviepy 整体重新编码。
+    """
     
     def __init__(
         self, 
-        output_dir: str = "./output/videos",
-        task_id: Optional[str] = None
+        output_dir: str = OUTPUT_VIDEOS_DIR,
+        task_id: Optional[str] = None,
+        profile: Optional[EncodingProfile] = None,
+        stream_copy: bool = ENDING_STREAM_COPY,
+        cache_dir: str = ENDING_CACHE_DIR
     ):
         """
         初始化视频片尾添加器
         
         Args:
-            output_dir: 输出目录，默认为 "./output/videos"
+            output_dir: 输出目录，默认为 OUTPUT_VIDEOS_DIR（./output/videos）
             task_id: 可选的任务ID，用于任务隔离
+            profile: 渲染档位，默认读取 RENDER_PROFILE
+            stream_copy: 是否使用缓存的片尾直接复制流拼接，默认读取 ENDING_STREAM_COPY
+            cache_dir: 转码后的片尾缓存目录，默认读取 ENDING_CACHE_DIR
         """
         self.task_id = task_id
+        self.profile = profile or get_encoding_profile()
         self.output_dir = output_dir
+        self.stream_copy = stream_copy
+        self.cache_dir = cache_dir
         ensure_dir(output_dir)
     
     def _find_video_files(self, video_dir: str) -> List[str]:
@@ -105,8 +138,10 @@ class VideoEndingAppender:
             "success": False,
             "input_path": video_path,
             "output_path": None,
-            "error": None
+            "error": None,
+            "mode": None
         }
+        start_time = time.monotonic()
         
         try:
             # 检查文件是否存在
@@ -126,31 +161,24 @@ class VideoEndingAppender:
             logger.info(f"添加片尾: {ending_path}")
             logger.info(f"输出路径: {output_path}")
             
-            # 加载视频
-            main_clip = VideoFileClip(video_path)
-            ending_clip = VideoFileClip(ending_path)
-            
-            # 调整片尾尺寸以匹配主视频
-            ending_clip = self._resize_ending_to_match(ending_clip, main_clip)
-            
-            # 拼接视频（片尾会覆盖主视频末尾的音频）
-            final_video = concatenate_videoclips([main_clip, ending_clip], method="compose")
-            
-            # 写入文件
-            logger.info(f"正在写入最终视频: {output_path}")
-            final_video.write_videofile(
-                output_path,
-                codec='libx264',
-                audio_codec='aac',
-                fps=30,
-                logger=None  # 禁用 moviepy 的日志输出
-            )
-            
-            # 清理资源
-            main_clip.close()
-            ending_clip.close()
-            final_video.close()
+            # 先写临时文件再原子替换，中断时不会留下看似完整的输出文件
+            root, ext = os.path.splitext(output_path)
+            temp_output_path = f"{root}.tmp{ext}"
+            try:
+                appended = False
+                if self.stream_copy:
+                    try:
+                        appended = self._append_by_stream_copy(video_path, ending_path, temp_output_path)
+                    except Exception as e:
+                        logger.warning(f"直接复制流拼接失败，回退到重新编码: {e}")
+                if not appended:
+                    self._append_by_reencode(video_path, ending_path, temp_output_path)
+                os.replace(temp_output_path, output_path)
+            finally:
+                if os.path.exists(temp_output_path):
+                    os.remove(temp_output_path)
             
+            result["mode"] = "stream_copy" if appended else "reencode"
             result["success"] = True
             result["output_path"] = output_path
             logger.info(f"视频处理完成: {output_path}")
@@ -160,71 +188,358 @@ class VideoEndingAppender:
             result["error"] = error_msg
             logger.error(f"处理视频失败 {video_path}: {error_msg}")
         
+        result["elapsed"] = round(time.monotonic() - start_time, 3)
         return result
     
+    def _append_by_reencode(self, video_path: str, ending_path: str, output_path: str) -> None:
+        """用 moviepy 解码主视频和片尾，整体重新编码"""
+        # 加载视频
+        main_clip = VideoFileClip(video_path)
+        ending_clip = VideoFileClip(ending_path)
+        
+        # 调整片尾尺寸以匹配主视频
+        ending_clip = self._resize_ending_to_match(ending_clip, main_clip)
+        
+        # 拼接视频（片尾会覆盖主视频末尾的音频）
+        final_video = concatenate_videoclips([main_clip, ending_clip], method="compose")
+        
+        # 写入文件
+        logger.info(f"正在写入最终视频: {output_path}")
+        final_video.write_videofile(
+            output_path,
+            audio_codec='aac',
+            audio_bitrate=self.profile.audio_bitrate,
+            logger=None,  # 禁用 moviepy 的日志输出
+            **self.profile.moviepy_kwargs()
+        )
+        
+        # 清理资源
+        main_clip.close()
+        ending_clip.close()
+        final_video.close()
+    
+    def _append_by_stream_copy(self, video_path: str, ending_path: str, output_path: str) -> bool:
+        """
+        用缓存的片尾直接复制流拼接
+        
+        Returns:
+            是否拼接成功；主视频编码不支持或片尾参数不一致时返回 False，由调用方回退到重新编码
+        """
+        main_info = probe_media_sync(video_path)
+        if main_info["video_codec"] != "h264" or main_info["video_profile"] not in H264_PROFILES:
+            logger.info(f"主视频编码为 {main_info['video_codec']} ({main_info['video_profile']})，无法直接复制流拼接")
+            return False
+        if main_info["has_audio"] and main_info["audio_codec"] != "aac":
+            logger.info(f"主视频音频编码为 {main_info['audio_codec']}，无法直接复制流拼接")
+            return False
+        if not main_info["width"] or not main_info["height"] or not main_info["fps"]:
+            logger.info("无法读取主视频的分辨率或帧率，无法直接复制流拼接")
+            return False
+        
+        cached_ending = self._get_normalized_ending(ending_path, main_info)
+        
+        # concat 分离器要求各文件的流参数一致，否则复制出的视频无法正常解码
+        ending_info = probe_media_sync(cached_ending)
+        keys = ["video_codec", "video_profile", "pix_fmt", "width", "height", "has_audio"]
+        if main_info["has_audio"]:
+            keys += ["audio_codec", "sample_rate", "channels"]
+        mismatched = [key for key in keys if ending_info[key] != main_info[key]]
+        if ending_info["fps"] is None or abs(ending_info["fps"] - main_info["fps"]) > 0.01:
+            mismatched.append("fps")
+        if mismatched:
+            logger.warning(f"缓存的片尾与主视频参数不一致 {mismatched}，回退到重新编码")
+            return False
+        
+        # 复制流拼接后只保留第一个文件的 avcC（SPS / PPS），片尾的 level、参考帧数、CABAC、
+        # 8x8 变换、初始 QP 等与主视频不同时会按主视频的参数集解码出花屏。
+        # 片尾按本工具的编码参数转码，与其他编码器（如 moviepy 默认参数）生成的主视频通常不一致
+        main_parameter_sets = read_h264_parameter_sets(video_path)
+        if main_parameter_sets is None or main_parameter_sets != read_h264_parameter_sets(cached_ending):
+            logger.warning("缓存的片尾与主视频的 H.264 参数集（SPS/PPS）不一致，回退到重新编码")
+            return False
+        
+        list_path = output_path + ".concat.txt"
+        try:
+            with open(list_path, "w", encoding="utf-8") as f:
+                for path in (video_path, cached_ending):
+                    escaped = os.path.abspath(path).replace("'", "'\\''")
+                    f.write(f"file '{escaped}'\n")
+            run_ffmpeg_sync(
+                [
+                    "-f", "concat", "-safe", "0", "-i", list_path,
+                    "-map", "0",
+                    "-c", "copy",
+                    "-movflags", "+faststart",
+                    output_path,
+                ],
+                description=f"拼接片尾 {os.path.basename(video_path)}"
+            )
+        finally:
+            if os.path.exists(list_path):
+                os.remove(list_path)
+        logger.info(f"已直接复制流拼接片尾（缓存: {cached_ending}）")
+        return True
+    
+    def _get_normalized_ending(self, ending_path: str, main_info: Dict[str, Any]) -> str:
+        """
+        获取按主视频参数转码的片尾（同一片尾文件和同一组参数只转码一次）
+        
+        Args:
+            ending_path: 原始片尾视频路径
+            main_info: 主视频的 probe_media_sync 结果
+        
+        Returns:
+            缓存中的片尾路径
+        """
+        width, height, fps = main_info["width"], main_info["height"], main_info["fps"]
+        has_audio = main_info["has_audio"]
+        stat = os.stat(ending_path)
+        key_parts = [
+            os.path.abspath(ending_path), stat.st_mtime_ns, stat.st_size,
+            width, height, fps, main_info["video_profile"], main_info["pix_fmt"],
+            self.profile.preset, *self.profile.x264_params(),
+        ]
+        if has_audio:
+            key_parts += [main_info["sample_rate"], main_info["channels"], self.profile.audio_bitrate]
+        cache_key = hashlib.sha1("|".join(str(part) for part in key_parts).encode("utf-8")).hexdigest()[:16]
+        
+        ensure_dir(self.cache_dir)
+        cached_path = os.path.join(self.cache_dir, f"ending_{cache_key}.mp4")
+        if os.path.exists(cached_path):
+            logger.info(f"使用缓存的片尾: {cached_path}")
+            return cached_path
+        
+        logger.info(f"转码片尾: {width}x{height}@{fps:g}fps -> {cached_path}")
+        ending_info = probe_media_sync(ending_path)
+        args = ["-i", ending_path]
+        audio_args = ["-an"]
+        if has_audio:
+            sample_rate, channels = main_info["sample_rate"], main_info["channels"]
+            audio_args = ["-c:a", "aac", "-b:a", self.profile.audio_bitrate]
+            if ending_info["has_audio"]:
+                audio_args += ["-af", f"aformat=sample_rates={sample_rate}:channel_layouts={channels}"]
+                audio_map = "0:a:0"
+            else:
+                # 片尾没有音频时补一条静音音轨，保证拼接后音轨连续
+                args += ["-f", "lavfi", "-i", f"anullsrc=r={sample_rate}:cl={channels}"]
+                audio_map = "1:a:0"
+                audio_args += ["-shortest"]
+            audio_args = ["-map", audio_map, *audio_args]
+        
+        video_filter = (
+            f"scale={width}:{height},setsar=1,fps={fps:g},format={main_info['pix_fmt'] or 'yuv420p'}"
+        )
+        video_args = [
+            "-c:v", "libx264", "-preset", self.profile.preset,
+            "-profile:v", H264_PROFILES[main_info["video_profile"]],
+            "-r", f"{fps:g}", *self.profile.x264_params(),
+        ]
+        if self.profile.threads:
+            video_args += ["-threads", str(self.profile.threads)]
+        
+        # 先写临时文件再原子替换，并发任务不会读到写了一半的缓存
+        temp_path = f"{cached_path}.{os.getpid()}.tmp.mp4"
+        try:
+            run_ffmpeg_sync(
+                [
+                    *args,
+                    "-map", "0:v:0",
+                    "-vf", video_filter,
+                    *video_args,
+                    *audio_args,
+                    temp_path,
+                ],
+                description="转码片尾"
+            )
+            os.replace(temp_path, cached_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return cached_path
+    
     def add_ending_to_videos(
         self,
         video_dir: str,
         ending_path: str,
         output_dir: Optional[str] = None,
-        prefix: str = "final_"
+        prefix: str = "final_",
+        workers: int = ENDING_WORKERS,
+        force: bool = False,
+        results_log: Optional[str] = None
     ) -> List[Dict[str, Any]]:
         """
         为指定目录下的所有视频添加片尾
         
+        输出已是最新（主视频和片尾的大小、修改时间与上次成功处理时一致，且输出文件未变）的视频直接跳过，
+        其余视频分发到进程池并行处理，每个结果追加一行到 JSONL 结果日志。
+        
         Args:
             video_dir: 包含视频文件的目录路径
             ending_path: 片尾视频文件路径
             output_dir: 输出目录（可选，如果不提供则使用实例的 output_dir）
             prefix: 输出文件名前缀，默认为 "final_"
+            workers: 并行进程数，0 表示 CPU 核数，默认读取 ENDING_WORKERS
+            force: 忽略已有结果，全部重新处理
+            results_log: JSONL 结果日志路径，默认为输出目录下的 ending_results.jsonl
         
         Returns:
-            处理结果列表，每个元素包含 success, input_path, output_path, error 等字段
+            处理结果列表，每个元素包含 success, input_path, output_path, error, skipped 等字段
         """
-        if output_dir is not None:
-            # 如果提供了输出目录，临时更新
-            original_output_dir = self.output_dir
-            self.output_dir = output_dir
-            ensure_dir(output_dir)
-        else:
-            original_output_dir = None
+        output_dir = output_dir or self.output_dir
+        ensure_dir(output_dir)
+        results_log = results_log or os.path.join(output_dir, RESULTS_LOG_NAME)
         
         # 检查片尾文件是否存在
         if not os.path.exists(ending_path):
             raise FileNotFoundError(f"片尾视频文件不存在: {ending_path}")
         
-        # 查找所有视频文件
+        # 查找所有视频文件（输出目录与输入目录相同时跳过已处理的输出文件）
         video_files = self._find_video_files(video_dir)
+        if os.path.abspath(output_dir) == os.path.abspath(video_dir):
+            video_files = [path for path in video_files if not os.path.basename(path).startswith(prefix)]
         
         if not video_files:
             logger.warning(f"在目录 {video_dir} 中未找到任何视频文件")
-            if original_output_dir is not None:
-                self.output_dir = original_output_dir
             return []
         
-        # 处理每个视频文件
-        results = []
-        success_count = 0
-        fail_count = 0
+        # 跳过已是最新的视频
+        previous = {} if force else self._load_previous_results(results_log)
+        ending_fingerprint = _file_fingerprint(ending_path)
+        results_by_path: Dict[str, Dict[str, Any]] = {}
+        pending = []
+        for video_path in video_files:
+            output_path = os.path.join(output_dir, prefix + os.path.basename(video_path))
+            if not force and self._is_up_to_date(video_path, ending_fingerprint, output_path, previous):
+                results_by_path[video_path] = {
+                    "success": True,
+                    "input_path": video_path,
+                    "output_path": output_path,
+                    "error": None,
+                    "mode": None,
+                    "skipped": True,
+                }
+            else:
+                pending.append((video_path, output_path))
         
-        logger.info(f"开始处理 {len(video_files)} 个视频文件...")
+        skipped_count = len(results_by_path)
+        total_count = len(pending)
+        workers = min(workers or os.cpu_count() or 1, max(1, len(pending)))
+        logger.info(
+            f"共 {len(video_files)} 个视频：跳过 {skipped_count} 个已是最新的，"
+            f"处理 {len(pending)} 个（{workers} 个并行进程）"
+        )
         
-        for i, video_path in enumerate(video_files, 1):
-            logger.info(f"[{i}/{len(video_files)}] 处理: {os.path.basename(video_path)}")
-            result = self.add_ending_to_video(video_path, ending_path, prefix=prefix)
-            results.append(result)
-            
-            if result["success"]:
-                success_count += 1
-            else:
-                fail_count += 1
+        def record(video_path: str, result: Dict[str, Any]) -> None:
+            result["skipped"] = False
+            results_by_path[video_path] = result
+            append_jsonl({
+                **result,
+                "input": _file_fingerprint(video_path),
+                "ending": ending_fingerprint,
+                "output": _file_fingerprint(result["output_path"]) if result["success"] else None,
+                "finished_at": time.time(),
+            }, results_log)
+            done = len(results_by_path) - skipped_count
+            status = "完成" if result["success"] else f"失败: {result['error']}"
+            logger.info(f"[{done}/{total_count}] {os.path.basename(video_path)} {status}")
+        
+        # 第一个视频在当前进程中处理，顺带生成片尾缓存，避免多个进程同时转码同一个片尾
+        if pending and self.stream_copy:
+            video_path, output_path = pending.pop(0)
+            record(video_path, self.add_ending_to_video(video_path, ending_path, output_path))
         
-        # 恢复原始输出目录
-        if original_output_dir is not None:
-            self.output_dir = original_output_dir
+        if workers == 1:
+            for video_path, output_path in pending:
+                record(video_path, self.add_ending_to_video(video_path, ending_path, output_path))
+        elif pending:
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_worker,
+                initargs=(output_dir, self.profile, self.stream_copy, self.cache_dir)
+            ) as executor:
+                futures = {
+                    executor.submit(_process_video, video_path, ending_path, output_path): video_path
+                    for video_path, output_path in pending
+                }
+                for future in as_completed(futures):
+                    video_path = futures[future]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        # 工作进程异常退出等情况，单个文件失败不影响其他文件
+                        result = {
+                            "success": False,
+                            "input_path": video_path,
+                            "output_path": None,
+                            "error": f"工作进程异常: {e}",
+                            "mode": None,
+                        }
+                    record(video_path, result)
         
-        logger.info(f"处理完成: 成功 {success_count} 个，失败 {fail_count} 个")
+        results = [results_by_path[path] for path in video_files]
+        success_count = sum(1 for r in results if r["success"])
+        fail_count = len(results) - success_count
+        logger.info(f"处理完成: 成功 {success_count} 个（其中跳过 {skipped_count} 个），失败 {fail_count} 个")
         return results
+    
+    def _load_previous_results(self, results_log: str) -> Dict[str, Dict[str, Any]]:
+        """读取结果日志中每个主视频最近一次成功处理的记录"""
+        previous = {}
+        for entry in load_jsonl(results_log):
+            if entry.get("success") and not entry.get("skipped") and entry.get("input"):
+                previous[entry["input"]["path"]] = entry
+        return previous
+    
+    def _is_up_to_date(
+        self,
+        video_path: str,
+        ending_fingerprint: Dict[str, Any],
+        output_path: str,
+        previous: Dict[str, Dict[str, Any]]
+    ) -> bool:
+        """
+        判断输出是否已是最新
+        
+        有结果日志记录时，要求主视频、片尾和输出文件的大小与修改时间都与记录一致；
+        没有记录时（如日志被删除），输出文件比主视频和片尾都新即视为最新。
+        """
+        if not os.path.exists(output_path):
+            return False
+        entry = previous.get(os.path.abspath(video_path))
+        if entry is not None:
+            return (
+                entry["input"] == _file_fingerprint(video_path)
+                and entry.get("ending") == ending_fingerprint
+                and entry.get("output") == _file_fingerprint(output_path)
+            )
+        output_mtime = os.stat(output_path).st_mtime_ns
+        return output_mtime >= os.stat(video_path).st_mtime_ns and output_mtime >= ending_fingerprint["mtime_ns"]
+
+
+def _file_fingerprint(path: str) -> Dict[str, Any]:
+    """文件指纹（绝对路径、大小、修改时间），用于判断文件是否变化"""
+    stat = os.stat(path)
+    return {"path": os.path.abspath(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+# 工作进程内复用的片尾添加器（由进程池 initializer 创建）
+_worker_appender: Optional[VideoEndingAppender] = None
+
+
+def _init_worker(output_dir: str, profile: EncodingProfile, stream_copy: bool, cache_dir: str) -> None:
+    """进程池初始化：每个工作进程只创建一次片尾添加器"""
+    global _worker_appender
+    _worker_appender = VideoEndingAppender(
+        output_dir=output_dir,
+        profile=profile,
+        stream_copy=stream_copy,
+        cache_dir=cache_dir
+    )
+
+
+def _process_video(video_path: str, ending_path: str, output_path: str) -> Dict[str, Any]:
+    """在工作进程中为单个视频添加片尾"""
+    return _worker_appender.add_ending_to_video(video_path, ending_path, output_path)
 
 
 def main():
@@ -242,6 +557,9 @@ def main():
 
   # 自定义文件前缀
   uv run python -m tools.video_ending_appender ./output/videos ./path/to/ending.mp4 -p "with_ending_"
+
+  # 8 个进程并行，忽略已有结果全部重新处理
+  uv run python -m tools.video_ending_appender ./output/videos ./path/to/ending.mp4 -j 8 --force
         """
     )
     
@@ -272,6 +590,40 @@ def main():
         help="输出文件名前缀，默认为 'final_'"
     )
     
+    parser.add_argument(
+        "-j", "--workers",
+        type=int,
+        default=ENDING_WORKERS,
+        help="并行进程数，0 表示 CPU 核数，默认读取 ENDING_WORKERS"
+    )
+    
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="忽略已是最新的输出，全部重新处理"
+    )
+    
+    parser.add_argument(
+        "--results-log",
+        type=str,
+        default=None,
+        help="JSONL 结果日志路径，默认为输出目录下的 ending_results.jsonl"
+    )
+    
+    parser.add_argument(
+        "--reencode",
+        action="store_true",
+        help="不使用缓存的片尾直接复制流拼接，用 moviepy 整体重新编码"
+    )
+    
+    parser.add_argument(
+        "--profile",
+        type=str,
+        default=None,
+        choices=["draft", "standard", "archive"],
+        help="渲染档位（决定帧率、x264 preset 和 CRF），默认读取 RENDER_PROFILE"
+    )
+    
     args = parser.parse_args()
     
     # 验证输入目录是否存在
@@ -293,11 +645,15 @@ def main():
         return 1
     
     # 确定输出目录
-    output_dir = args.output_dir if args.output_dir else "./output/videos"
+    output_dir = args.output_dir if args.output_dir else OUTPUT_VIDEOS_DIR
     
     try:
         # 创建工具实例
-        appender = VideoEndingAppender(output_dir=output_dir)
+        appender = VideoEndingAppender(
+            output_dir=output_dir,
+            profile=get_encoding_profile(args.profile),
+            stream_copy=ENDING_STREAM_COPY and not args.reencode
+        )
         
         # 处理视频
         print(f"\n开始处理目录: {args.video_dir}")
@@ -310,21 +666,25 @@ def main():
             video_dir=args.video_dir,
             ending_path=args.ending_path,
             output_dir=output_dir,
-            prefix=args.prefix
+            prefix=args.prefix,
+            workers=args.workers,
+            force=args.force,
+            results_log=args.results_log
         )
         
         # 输出结果
         print("\n" + "=" * 60)
         success_count = sum(1 for r in results if r["success"])
         fail_count = len(results) - success_count
+        skipped_count = sum(1 for r in results if r.get("skipped"))
         
-        print(f"处理完成: 成功 {success_count}/{len(results)}, 失败 {fail_count}/{len(results)}")
+        print(f"处理完成: 成功 {success_count}/{len(results)}（跳过已是最新的 {skipped_count} 个）, 失败 {fail_count}/{len(results)}")
         print("=" * 60)
         
-        if success_count > 0:
+        if success_count > skipped_count:
             print("\n成功处理的视频:")
             for result in results:
-                if result["success"]:
+                if result["success"] and not result.get("skipped"):
                     print(f"  ✓ {os.path.basename(result['input_path'])}")
                     print(f"    → {result['output_path']}")
         
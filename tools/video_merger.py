@@ -1,11 +1,19 @@
 """视频音频合并工具（冻结帧、平滑过渡）"""
 import os
 import asyncio
+import threading
 import warnings
 from typing import Optional
 from moviepy import VideoFileClip, AudioFileClip, concatenate_videoclips, ImageClip
+from proglog import ProgressBarLogger
 from models.script_model import Script
 from utils.file_utils import ensure_dir, sanitize_filename
+from utils.ffmpeg_utils import mux_video_audio
+from utils.encoding import EncodingProfile, get_encoding_profile
+from tools.chunked_encoder import ChunkedEncoder
+from utils.cpu_budget import get_cpu_budget
+from utils.deadline import check_deadline
+from config import CHUNKED_ENCODE, STATIC_SPAN_VFR, PROGRESSIVE_OUTPUT, OUTPUT_VIDEOS_DIR
 from utils.logger import get_logger
 
 # 抑制 moviepy 的 "Proc not detected" 警告
@@ -14,15 +22,36 @@ warnings.filterwarnings('ignore', message='.*Proc not detected.*', category=User
 logger = get_logger(__name__)
 
 
+class _AbortableWriteLogger(ProgressBarLogger):
+    """
+    moviepy 写出进度回调：每处理一帧（或一块音频）检查中止标记和任务截止时间
+
+    需要中止时抛出异常，moviepy 随之关闭 ffmpeg 的输入管道并等待其退出
+    """
+
+    def __init__(self, stop_event: threading.Event):
+        super().__init__()
+        self.stop_event = stop_event
+
+    def bars_callback(self, bar, attr, value, old_value=None):
+        if self.stop_event.is_set():
+            raise RuntimeError("视频合并已中止")
+        check_deadline("合并视频")
+
+
 class VideoMerger:
     """视频合并器"""
     
     def __init__(
         self, 
-        output_dir: str = "./output/videos",
-        task_id: Optional[str] = None
+        output_dir: str = OUTPUT_VIDEOS_DIR,
+        task_id: Optional[str] = None,
+        profile: Optional[EncodingProfile] = None,
+        chunked: bool = CHUNKED_ENCODE
     ):
         self.task_id = task_id
+        self.profile = profile or get_encoding_profile()
+        self.chunked = chunked
         # 最终输出始终保存到 output/videos 目录（不变）
         self.output_dir = output_dir
         ensure_dir(output_dir)
@@ -32,31 +61,86 @@ class VideoMerger:
         video_segments: list[tuple[int, str, float]],
         audio_segments: list[tuple[int, str, float]],
         script: Script,
-        output_filename: str = None
+        output_filename: str = None,
+        ending_path: Optional[str] = None
     ) -> str:
-        """合并视频和音频，使用冻结帧填充（异步）"""
+        """
+        合并视频和音频，使用冻结帧填充（异步）
+        
+        Args:
+            ending_path: 可选的片尾视频，与各片段在同一次最终编码中拼接到末尾
+        """
         if output_filename is None:
             output_filename = sanitize_filename(script.title) + ".mp4"
+        if ending_path and not os.path.exists(ending_path):
+            raise FileNotFoundError(f"片尾视频文件不存在: {ending_path}")
         
         output_path = os.path.join(self.output_dir, output_filename)
         
-        # 使用异步线程执行视频处理操作
-        return await asyncio.to_thread(
-            self._merge_with_freeze_frame_sync,
-            video_segments,
-            audio_segments,
-            script,
-            output_path
-        )
+        # 分块并行编码：编码耗时随 CPU 核数缩短
+        # 静止画面可变帧率编码和渐进式预览输出都依赖分块编码器
+        if self.chunked or STATIC_SPAN_VFR or PROGRESSIVE_OUTPUT:
+            encoder = ChunkedEncoder(profile=self.profile)
+            return await encoder.encode(video_segments, audio_segments, script, output_path, ending_path=ending_path)
+        
+        # AAC 旁白音轨：只编码视频，随后直接复制音频流封装，避免再次转码
+        # （带片尾时片尾音频要接在旁白之后，音轨必须重新编码，走下面的常规路径）
+        if script.narration_path and script.narration_path.endswith(".m4a") and not ending_path:
+            video_only_path = os.path.splitext(output_path)[0] + ".video_only.mp4"
+            try:
+                await self._run_merge(video_segments, audio_segments, script, video_only_path, False, None)
+                logger.info(f"复制 AAC 旁白音轨封装: {script.narration_path}")
+                await mux_video_audio(video_only_path, script.narration_path, output_path)
+            finally:
+                if os.path.exists(video_only_path):
+                    os.remove(video_only_path)
+            logger.info(f"视频合并完成: {output_path}")
+            return output_path
+        
+        return await self._run_merge(video_segments, audio_segments, script, output_path, True, ending_path)
+    
+    async def _run_merge(self, *args) -> str:
+        """
+        在后台线程中执行 _merge_with_freeze_frame_sync（编码线程数从 CPU 预算领取）
+        
+        后台线程无法被取消：任务超时或被取消时通知线程在下一帧中止写出，等线程结束、ffmpeg 进程退出后
+        再继续抛出，调用方删除未完成的输出文件时不会仍有进程在写入，CPU 预算也在编码真正停止后才归还
+        """
+        stop_event = threading.Event()
+        with get_cpu_budget().lease("合并视频") as lease:
+            merge = asyncio.ensure_future(asyncio.to_thread(
+                lease.run, self._merge_with_freeze_frame_sync, *args, lease.threads, stop_event
+            ))
+            try:
+                return await asyncio.shield(merge)
+            except asyncio.CancelledError:
+                stop_event.set()
+                logger.warning("视频合并被中止，等待后台写出停止")
+                await asyncio.wait([merge])
+                if not merge.cancelled():
+                    merge.exception()  # 标记异常已读取
+                raise
     
     def _merge_with_freeze_frame_sync(
         self,
         video_segments: list[tuple[int, str, float]],
         audio_segments: list[tuple[int, str, float]],
         script: Script,
-        output_path: str
+        output_path: str,
+        attach_narration: bool = True,
+        ending_path: Optional[str] = None,
+        threads: int = 0,
+        stop_event: Optional[threading.Event] = None
     ) -> str:
-        """同步的视频合并实现（在后台线程中执行）"""
+        """
+        同步的视频合并实现（在后台线程中执行）
+        
+        attach_narration 为 False 时不挂载旁白音轨，只输出视频流（由调用方复制音频流封装）；
+        ending_path 不为空时片尾（连同其音频）接在所有片段之后，与片段一起编码；
+        threads 为 CPU 预算分配的编码线程数；stop_event 被设置或超过任务截止时间时，
+        在片段之间或写出的下一帧中止
+        """
+        stop_event = stop_event or threading.Event()
         # 1. 按 segment_id 排序
         video_segments = sorted(video_segments, key=lambda x: x[0])
         audio_segments = sorted(audio_segments, key=lambda x: x[0])
@@ -64,6 +148,13 @@ class VideoMerger:
         if len(video_segments) != len(audio_segments):
             raise ValueError(f"视频片段数 ({len(video_segments)}) 与音频片段数 ({len(audio_segments)}) 不匹配")
         
+        # 单音轨模式：整段视频只挂载一条连续旁白音轨，不再逐片段处理音频
+        narration_path = script.narration_path
+        if narration_path and not os.path.exists(narration_path):
+            raise FileNotFoundError(f"旁白音轨不存在: {narration_path}")
+        # 单音轨模式下片段时长误差会累计成音画漂移，容差收紧到一帧
+        duration_tolerance = 1 / self.profile.fps if narration_path else 0.1
+        
         # 2. 处理每个片段
         final_clips = []
         for (vid_id, vid_path, vid_duration), (aud_id, aud_path, aud_duration) in zip(
@@ -71,20 +162,22 @@ class VideoMerger:
         ):
             if vid_id != aud_id:
                 raise ValueError(f"片段 ID 不匹配: 视频 {vid_id} vs 音频 {aud_id}")
+            if stop_event.is_set():
+                raise RuntimeError("视频合并已中止")
+            check_deadline("合并视频")
             
             if not os.path.exists(vid_path):
                 raise FileNotFoundError(f"视频文件不存在: {vid_path}")
-            if not os.path.exists(aud_path):
+            if not narration_path and not os.path.exists(aud_path):
                 raise FileNotFoundError(f"音频文件不存在: {aud_path}")
             
-            video_clip = VideoFileClip(vid_path)
-            audio_clip = AudioFileClip(aud_path)
+            video_clip = VideoFileClip(vid_path, audio=False)
             
             logger.info(f"处理片段 {vid_id}: 视频 {vid_duration:.2f}s, 音频 {aud_duration:.2f}s")
             
             # 3. 时长匹配（视频应该已经对齐，这里做验证和调整）
             duration_diff = abs(vid_duration - aud_duration)
-            if duration_diff > 0.1:
+            if duration_diff > duration_tolerance:
                 # 如果视频比音频长，截取视频
                 if vid_duration > aud_duration:
                     logger.warning(f"片段 {vid_id}: 视频比音频长 {duration_diff:.2f}s，截取视频")
@@ -105,28 +198,45 @@ class VideoMerger:
                     freeze_clip = last_frame.with_duration(freeze_duration)
                     video_clip = concatenate_videoclips([video_clip, freeze_clip])
             
-            # 4. 合并音频
-            # MoviePy 2.1.2+ 使用 with_audio() 替代 set_audio()
-            final_clip = video_clip.with_audio(audio_clip)
-            final_clips.append(final_clip)
+            # 4. 合并音频（单音轨模式在拼接后统一挂载）
+            if narration_path:
+                final_clips.append(video_clip)
+            else:
+                # MoviePy 2.1.2+ 使用 with_audio() 替代 set_audio()
+                final_clips.append(video_clip.with_audio(AudioFileClip(aud_path)))
         
         # 5. 拼接所有片段
         logger.info(f"开始合并 {len(final_clips)} 个片段...")
         final_video = concatenate_videoclips(final_clips, method="compose")
+        if narration_path and attach_narration:
+            logger.info(f"挂载连续旁白音轨: {narration_path}")
+            final_video = final_video.with_audio(AudioFileClip(narration_path))
         
-        logger.info(f"正在写入最终视频: {output_path}")
-        final_video.write_videofile(
-            output_path, 
-            codec='libx264', 
-            audio_codec='aac',
-            fps=30,
-            logger=None  # 禁用 moviepy 的日志输出
-        )
+        ending_clip = None
+        if ending_path:
+            ending_clip = VideoFileClip(ending_path)
+            if tuple(ending_clip.size) != self.profile.size:
+                logger.info(f"调整片尾尺寸: {tuple(ending_clip.size)} -> {self.profile.size}")
+                ending_clip = ending_clip.resized(self.profile.size)
+            logger.info(f"拼接片尾: {ending_path} ({ending_clip.duration:.2f}s)")
+            final_video = concatenate_videoclips([final_video, ending_clip], method="compose")
         
-        # 清理资源
-        for clip in final_clips:
-            clip.close()
-        final_video.close()
+        logger.info(f"正在写入最终视频: {output_path}")
+        try:
+            final_video.write_videofile(
+                output_path, 
+                audio_codec='aac',
+                audio_bitrate=self.profile.audio_bitrate,
+                logger=_AbortableWriteLogger(stop_event),  # 不输出进度，只用于中止检查
+                **self.profile.with_threads(threads).moviepy_kwargs()
+            )
+        finally:
+            # 清理资源
+            for clip in final_clips:
+                clip.close()
+            if ending_clip is not None:
+                ending_clip.close()
+            final_video.close()
         
         logger.info(f"视频合并完成: {output_path}")
         return output_path
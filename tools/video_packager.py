@@ -0,0 +1,249 @@
+"""多码率打包工具（一次解码输出多档分辨率，可选 HLS/DASH）"""
+import os
+import json
+from dataclasses import dataclass, asdict
+from typing import Optional, List, Dict, Any
+from config import OUTPUT_PACKAGES_DIR, PACKAGE_RENDITIONS, PACKAGE_SEGMENT_SECONDS
+from utils.encoding import EncodingProfile, get_encoding_profile
+from utils.ffmpeg_utils import run_ffmpeg, probe_media
+from utils.cpu_budget import get_cpu_budget
+from utils.file_utils import ensure_dir, cleanup_directory
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+PACKAGE_FORMATS = ("mp4", "hls", "dash")
+
+
+@dataclass(frozen=True)
+class Rendition:
+    """一档输出版本"""
+    name: str
+    height: int
+    video_bitrate: str
+    max_bitrate: str
+    buffer_size: str
+
+
+RENDITION_LADDER: Dict[str, Rendition] = {
+    "1080p": Rendition("1080p", 1080, "5000k", "5350k", "7500k"),
+    "720p": Rendition("720p", 720, "2800k", "2996k", "4200k"),
+    "480p": Rendition("480p", 480, "1400k", "1498k", "2100k"),
+    "360p": Rendition("360p", 360, "800k", "856k", "1200k"),
+}
+
+
+class VideoPackager:
+    """
+    多码率打包器
+
+    最终视频只解码一次，通过共享的 split 滤镜图缩放出各档分辨率并同时编码，
+    可直接输出多个 MP4，或输出分片的 HLS/DASH 及对应的播放清单。
+    """
+
+    def __init__(
+        self,
+        output_dir: str = OUTPUT_PACKAGES_DIR,
+        renditions: Optional[List[str]] = None,
+        segment_seconds: float = PACKAGE_SEGMENT_SECONDS,
+        profile: Optional[EncodingProfile] = None
+    ):
+        self.output_dir = output_dir
+        names = renditions or [name.strip() for name in PACKAGE_RENDITIONS.split(",") if name.strip()]
+        unknown = [name for name in names if name not in RENDITION_LADDER]
+        if unknown:
+            raise ValueError(f"未知的输出版本: {unknown}，可选: {', '.join(RENDITION_LADDER)}")
+        self.renditions = [RENDITION_LADDER[name] for name in names]
+        self.segment_seconds = segment_seconds
+        self.profile = profile or get_encoding_profile()
+        ensure_dir(output_dir)
+
+    async def package(self, input_path: str, package_format: str = "mp4") -> Dict[str, Any]:
+        """
+        打包视频
+
+        Args:
+            input_path: 最终视频路径
+            package_format: mp4 / hls / dash
+
+        Returns:
+            打包清单（同时写入输出目录下的 manifest.json）
+        """
+        if package_format not in PACKAGE_FORMATS:
+            raise ValueError(f"不支持的打包格式: {package_format}，可选: {', '.join(PACKAGE_FORMATS)}")
+        if not os.path.exists(input_path):
+            raise FileNotFoundError(f"视频文件不存在: {input_path}")
+
+        info = await probe_media(input_path)
+        source_height = info["height"]
+        # 不放大：高于源视频分辨率的版本直接跳过
+        renditions = [r for r in self.renditions if source_height is None or r.height <= source_height]
+        skipped = [r.name for r in self.renditions if r not in renditions]
+        if skipped:
+            logger.info(f"源视频高度 {source_height}p，跳过更高分辨率的版本: {skipped}")
+        if not renditions:
+            raise ValueError(f"没有可输出的版本（源视频高度 {source_height}p）")
+
+        package_name = os.path.splitext(os.path.basename(input_path))[0]
+        package_dir = os.path.join(self.output_dir, package_name)
+        # 清理上一次的打包结果，避免残留旧分片
+        cleanup_directory(package_dir, force=True)
+        ensure_dir(package_dir)
+
+        has_audio = info["has_audio"]
+        with get_cpu_budget().lease("多码率打包") as lease:
+            args = ["-i", input_path, "-filter_complex", self._build_filtergraph(renditions)]
+            if package_format == "mp4":
+                outputs = self._mp4_outputs(renditions, package_dir, has_audio, args, lease.threads)
+            elif package_format == "hls":
+                outputs = self._hls_outputs(renditions, package_dir, has_audio, args, lease.threads)
+            else:
+                outputs = self._dash_outputs(renditions, package_dir, has_audio, args, lease.threads)
+
+            logger.info(f"打包 {len(renditions)} 个版本（{package_format}）: {[r.name for r in renditions]}")
+            await run_ffmpeg(args, description=f"多码率打包 {package_name}", cpu_lease=lease)
+
+        manifest = {
+            "source": input_path,
+            "format": package_format,
+            "segment_seconds": self.segment_seconds if package_format != "mp4" else None,
+            "renditions": [
+                {**asdict(r), "path": outputs["renditions"].get(r.name)}
+                for r in renditions
+            ],
+            "playlist": outputs.get("playlist"),
+        }
+        manifest_path = os.path.join(package_dir, "manifest.json")
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        manifest["manifest_path"] = manifest_path
+        logger.info(f"打包完成: {package_dir}")
+        return manifest
+
+    def _build_filtergraph(self, renditions: List[Rendition]) -> str:
+        """一次解码，split 后分别缩放到各档分辨率"""
+        labels = "".join(f"[s{i}]" for i in range(len(renditions)))
+        parts = [f"[0:v]split={len(renditions)}{labels}"]
+        for i, rendition in enumerate(renditions):
+            parts.append(f"[s{i}]scale=-2:{rendition.height}[v{i}]")
+        return ";".join(parts)
+
+    def _video_args(self, index: int, rendition: Rendition) -> List[str]:
+        """第 index 个输出流的编码参数（码率受限，关键帧与分片边界对齐）"""
+        return [
+            f"-c:v:{index}", "libx264",
+            f"-b:v:{index}", rendition.video_bitrate,
+            f"-maxrate:v:{index}", rendition.max_bitrate,
+            f"-bufsize:v:{index}", rendition.buffer_size,
+        ]
+
+    def _common_video_args(self, threads: int = 0) -> List[str]:
+        """所有版本共用的编码参数（threads 为 CPU 预算分配的线程数，渲染档位指定了线程数时以档位为准）"""
+        args = [
+            "-preset", self.profile.preset,
+            "-pix_fmt", "yuv420p",
+            "-force_key_frames", f"expr:gte(t,n_forced*{self.segment_seconds})",
+            "-sc_threshold", "0",
+        ]
+        if self.profile.tune:
+            args += ["-tune", self.profile.tune]
+        threads = self.profile.threads or threads
+        if threads:
+            args += ["-threads", str(threads)]
+        return args
+
+    def _mp4_outputs(
+        self,
+        renditions: List[Rendition],
+        package_dir: str,
+        has_audio: bool,
+        args: List[str],
+        threads: int = 0
+    ) -> Dict[str, Any]:
+        """每个版本输出一个 MP4（同一个 ffmpeg 进程的多个输出）"""
+        paths = {}
+        for i, rendition in enumerate(renditions):
+            path = os.path.join(package_dir, f"{rendition.name}.mp4")
+            args += ["-map", f"[v{i}]"]
+            if has_audio:
+                args += ["-map", "0:a:0", "-c:a", "copy"]
+            args += [
+                "-c:v", "libx264",
+                "-b:v", rendition.video_bitrate,
+                "-maxrate", rendition.max_bitrate,
+                "-bufsize", rendition.buffer_size,
+                *self._common_video_args(threads),
+                "-movflags", "+faststart",
+                path,
+            ]
+            paths[rendition.name] = path
+        return {"renditions": paths}
+
+    def _hls_outputs(
+        self,
+        renditions: List[Rendition],
+        package_dir: str,
+        has_audio: bool,
+        args: List[str],
+        threads: int = 0
+    ) -> Dict[str, Any]:
+        """HLS（fMP4 分片）+ 主播放列表"""
+        stream_map = []
+        for i, rendition in enumerate(renditions):
+            args += ["-map", f"[v{i}]"]
+            args += self._video_args(i, rendition)
+            stream_map.append(f"v:{i},a:{i},name:{rendition.name}" if has_audio else f"v:{i},name:{rendition.name}")
+        if has_audio:
+            for _ in renditions:
+                args += ["-map", "0:a:0"]
+            args += ["-c:a", "copy"]
+        args += [
+            *self._common_video_args(threads),
+            "-f", "hls",
+            "-hls_time", str(self.segment_seconds),
+            "-hls_playlist_type", "vod",
+            "-hls_segment_type", "fmp4",
+            # 所有文件平铺在打包目录下，播放列表和分片使用相对路径
+            "-hls_segment_filename", os.path.join(package_dir, "%v_%05d.m4s"),
+            "-hls_fmp4_init_filename", "%v_init.mp4",
+            "-master_pl_name", "master.m3u8",
+            "-var_stream_map", " ".join(stream_map),
+            os.path.join(package_dir, "%v.m3u8"),
+        ]
+        return {
+            "renditions": {
+                r.name: os.path.join(package_dir, f"{r.name}.m3u8") for r in renditions
+            },
+            "playlist": os.path.join(package_dir, "master.m3u8"),
+        }
+
+    def _dash_outputs(
+        self,
+        renditions: List[Rendition],
+        package_dir: str,
+        has_audio: bool,
+        args: List[str],
+        threads: int = 0
+    ) -> Dict[str, Any]:
+        """DASH（视频各版本一个自适应集，音频一个自适应集）"""
+        for i, rendition in enumerate(renditions):
+            args += ["-map", f"[v{i}]"]
+            args += self._video_args(i, rendition)
+        adaptation_sets = "id=0,streams=v"
+        if has_audio:
+            args += ["-map", "0:a:0", "-c:a", "copy"]
+            adaptation_sets += " id=1,streams=a"
+        playlist = os.path.join(package_dir, "manifest.mpd")
+        args += [
+            *self._common_video_args(threads),
+            "-f", "dash",
+            "-seg_duration", str(self.segment_seconds),
+            "-use_template", "1",
+            "-use_timeline", "1",
+            "-adaptation_sets", adaptation_sets,
+            playlist,
+        ]
+        return {
+            "renditions": {r.name: playlist for r in renditions},
+            "playlist": playlist,
+        }
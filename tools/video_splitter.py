@@ -6,8 +6,12 @@ import numpy as np
 from typing import Optional
 from moviepy import VideoFileClip, ImageClip
 from models.script_model import Script
-from config import TEMP_BASE_DIR
+from config import TEMP_BASE_DIR, INTERMEDIATE_MODE, INTERMEDIATE_DIR, OUTPUT_VIDEO_SEGMENTS_DIR
 from utils.file_utils import ensure_dir, cleanup_segment_files, get_task_subdir
+from utils.encoding import EncodingProfile, get_encoding_profile
+from utils.ffmpeg_utils import run_ffmpeg, probe_media
+from utils.deadline import check_deadline
+from utils.cpu_budget import get_cpu_budget
 from utils.logger import get_logger
 
 # 抑制 moviepy 的 "Proc not detected" 警告
@@ -21,12 +25,18 @@ class VideoSplitter:
     
     def __init__(
         self, 
-        output_dir: str = "./output/video_segments",
-        task_id: Optional[str] = None
+        output_dir: str = OUTPUT_VIDEO_SEGMENTS_DIR,
+        task_id: Optional[str] = None,
+        profile: Optional[EncodingProfile] = None,
+        intermediate: bool = INTERMEDIATE_MODE
     ):
         self.task_id = task_id
-        # 如果有 task_id，使用任务专属目录；否则使用默认目录（向后兼容）
-        if task_id:
+        self.profile = profile or get_encoding_profile()
+        self.intermediate = intermediate
+        # 中间片段模式下可放到单独的高速存储；有 task_id 时使用任务专属目录；否则使用默认目录（向后兼容）
+        if intermediate and INTERMEDIATE_DIR:
+            self.output_dir = get_task_subdir(task_id or "default", "video_segments", INTERMEDIATE_DIR)
+        elif task_id:
             self.output_dir = get_task_subdir(task_id, "video_segments", TEMP_BASE_DIR)
         else:
             self.output_dir = output_dir
@@ -56,16 +66,99 @@ class VideoSplitter:
         if not os.path.exists(video_path):
             raise FileNotFoundError(f"视频文件不存在: {video_path}")
         
-        # 使用异步线程执行视频处理操作
-        return await asyncio.to_thread(self._split_by_segments_sync, video_path, script)
+        if self.intermediate:
+            return await self._split_intermediate(video_path, script)
+        
+        # 使用异步线程执行视频处理操作（编码线程数从 CPU 预算领取）
+        with get_cpu_budget().lease("切割视频片段") as lease:
+            return await asyncio.to_thread(lease.run, self._split_by_segments_sync, video_path, script, lease.threads)
+    
+    async def _split_intermediate(
+        self,
+        video_path: str,
+        script: Script
+    ) -> list[tuple[int, str, float]]:
+        """
+        中间片段模式：一次解码，输出无损全帧内编码的片段
+        
+        Manim 输出只解码一遍，通过 segment 复用器在各片段边界处切开。
+        由于每一帧都是关键帧，切点精确到帧；无损编码不引入画质损失，
+        整条流水线只在最终合并时做一次有损编码。
+        """
+        info = await probe_media(video_path)
+        video_duration = info["duration"]
+        if video_duration is None:
+            raise RuntimeError(f"无法读取视频时长: {video_path}")
+        
+        # 按音频时长累加得到各片段在视频中的起止时间
+        boundaries = []
+        current_time = 0.0
+        for segment in script.segments:
+            if segment.audio_duration:
+                boundaries.append((segment, current_time, current_time + segment.audio_duration))
+                current_time += segment.audio_duration
+        
+        in_video = [item for item in boundaries if item[1] < video_duration]
+        beyond_video = [item for item in boundaries if item[1] >= video_duration]
+        
+        segments = []
+        if in_video:
+            # 最后一个片段之后的内容（若有）单独成段，随后丢弃
+            cut_times = [end for _, _, end in in_video[:-1]]
+            last_end = min(in_video[-1][2], video_duration)
+            part_pattern = os.path.join(self.output_dir, "part_%04d.mp4")
+            with get_cpu_budget().lease("无损切割视频片段") as lease:
+                profile = self.profile.with_threads(lease.threads)
+                args = ["-i", video_path, "-an", "-t", f"{last_end:.6f}", *profile.intermediate_video_args()]
+                if cut_times:
+                    args += ["-f", "segment", "-segment_times", ",".join(f"{t:.6f}" for t in cut_times),
+                             "-reset_timestamps", "1", "-segment_format", "mp4", part_pattern]
+                else:
+                    args += [part_pattern % 0]
+                logger.info(f"无损切割 {len(in_video)} 个片段: {video_path}")
+                await run_ffmpeg(args, description="无损切割视频片段", cpu_lease=lease)
+            
+            for index, (segment, start, end) in enumerate(in_video):
+                part_path = part_pattern % index
+                if not os.path.exists(part_path):
+                    raise RuntimeError(f"切割结果缺失: {part_path}")
+                output_path = os.path.join(self.output_dir, f"segment_{segment.segment_id}.mp4")
+                os.replace(part_path, output_path)
+                clip_duration = min(end, video_duration) - start
+                logger.info(f"切割片段 {segment.segment_id}: {start:.2f}s - {start + clip_duration:.2f}s (音频时长: {segment.audio_duration:.2f}s)")
+                segments.append((segment.segment_id, output_path, clip_duration))
+        
+        if beyond_video:
+            logger.info(f"为 {len(beyond_video)} 个片段生成冻结帧视频")
+            last_frame_path = os.path.join(self.output_dir, "last_frame.png")
+            await run_ffmpeg(
+                ["-sseof", "-0.1", "-i", video_path, "-an", "-update", "1", "-frames:v", "1", last_frame_path],
+                description="提取视频最后一帧"
+            )
+            for segment, _, _ in beyond_video:
+                output_path = os.path.join(self.output_dir, f"segment_{segment.segment_id}.mp4")
+                logger.info(f"生成冻结帧片段 {segment.segment_id}: 时长 {segment.audio_duration:.2f}s")
+                await run_ffmpeg(
+                    ["-loop", "1", "-i", last_frame_path, "-t", f"{segment.audio_duration:.6f}",
+                     *self.profile.intermediate_video_args(), output_path],
+                    description=f"生成冻结帧片段 {segment.segment_id}"
+                )
+                segments.append((segment.segment_id, output_path, segment.audio_duration))
+            os.remove(last_frame_path)
+        
+        logger.info(f"视频切割完成，共 {len(segments)} 个片段（其中 {len(beyond_video)} 个为冻结帧）")
+        return segments
     
     def _split_by_segments_sync(
         self, 
         video_path: str, 
-        script: Script
+        script: Script,
+        threads: int = 0
     ) -> list[tuple[int, str, float]]:
-        """同步的视频切割实现（在后台线程中执行）"""
-        video = VideoFileClip(video_path)
+        """同步的视频切割实现（在后台线程中执行），threads 为 CPU 预算分配的编码线程数"""
+        profile = self.profile.with_threads(threads)
+        # Manim 输出的视频没有音轨，切割时只处理视频流，音频由合并阶段统一挂载
+        video = VideoFileClip(video_path, audio=False)
         segments = []
         
         # 提前提取最后一帧，用于生成冻结帧
@@ -85,6 +178,8 @@ class VideoSplitter:
         remaining_segments = []  # 记录需要生成冻结帧的片段
         
         for segment in script.segments:
+            # 后台线程无法被取消，每个片段之前检查任务截止时间，超时后尽快退出
+            check_deadline("切割视频片段")
             if segment.audio_duration:
                 # 严格按照音频时长切割视频，确保音画同步
                 end_time = current_time + segment.audio_duration
@@ -111,9 +206,9 @@ class VideoSplitter:
                 clip_duration = clip.duration
                 clip.write_videofile(
                     output_path, 
-                    codec='libx264', 
-                    audio_codec='aac',
-                    logger=None  # 禁用 moviepy 的日志输出
+                    audio=False,
+                    logger=None,  # 禁用 moviepy 的日志输出
+                    **profile.moviepy_kwargs()
                 )
                 clip.close()
                 
@@ -129,8 +224,8 @@ class VideoSplitter:
                 if video.size:
                     last_frame = np.zeros((int(video.h), int(video.w), 3), dtype=np.uint8)
                 else:
-                    # 如果视频没有尺寸信息，创建一个默认尺寸的画面
-                    last_frame = np.zeros((720, 1280, 3), dtype=np.uint8)
+                    # 如果视频没有尺寸信息，按渲染档位的分辨率创建画面
+                    last_frame = np.zeros((self.profile.height, self.profile.width, 3), dtype=np.uint8)
             
             for segment in remaining_segments:
                 if segment.audio_duration:
@@ -145,9 +240,8 @@ class VideoSplitter:
                     logger.info(f"生成冻结帧片段 {segment.segment_id}: 时长 {segment.audio_duration:.2f}s")
                     freeze_clip.write_videofile(
                         output_path,
-                        codec='libx264',
-                        fps=30,  # 设置帧率
-                        logger=None  # 禁用 moviepy 的日志输出
+                        logger=None,  # 禁用 moviepy 的日志输出
+                        **profile.moviepy_kwargs()
                     )
                     freeze_clip.close()
                     
@@ -0,0 +1,148 @@
+"""进程内全局 CPU 线程预算（在并发的 Manim、ffmpeg、moviepy 环节之间分配线程数，可选绑定 CPU 核）"""
+import os
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import partial
+from typing import Any, Callable, Dict, Iterator, Optional
+from config import CPU_BUDGET_THREADS, CPU_AFFINITY
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 限制 Manim（numpy / scipy 等）数值库线程池大小的环境变量
+THREAD_ENV_VARS = (
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+)
+
+
+@dataclass(frozen=True)
+class CPULease:
+    """
+    一个执行环节分到的 CPU 资源
+
+    threads 为该环节应使用的线程数（ffmpeg -threads、x264 线程数、数值库线程数），
+    cores 为绑定的 CPU 核（未启用绑核时为 None）
+    """
+    stage: str
+    threads: int
+    cores: Optional[tuple[int, ...]] = None
+
+    def env(self) -> Dict[str, str]:
+        """子进程环境变量：当前环境 + 数值库线程数限制"""
+        env = dict(os.environ)
+        env.update({name: str(self.threads) for name in THREAD_ENV_VARS})
+        return env
+
+    def popen_kwargs(self) -> Dict[str, Any]:
+        """创建子进程的额外参数：启用绑核时在子进程 exec 之前设置 CPU 亲和性，其创建的所有线程都继承"""
+        if not self.cores:
+            return {}
+        return {"preexec_fn": partial(os.sched_setaffinity, 0, self.cores)}
+
+    @contextmanager
+    def pinned(self) -> Iterator[None]:
+        """
+        在 with 块内把当前线程绑定到分到的 CPU 核，退出时恢复
+
+        用于后台线程中的 moviepy：它启动的 ffmpeg 子进程继承线程的亲和性
+        """
+        if not self.cores:
+            yield
+            return
+        previous = os.sched_getaffinity(0)
+        os.sched_setaffinity(0, self.cores)
+        try:
+            yield
+        finally:
+            os.sched_setaffinity(0, previous)
+
+    def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        """在绑核状态下执行 func（供 asyncio.to_thread 调用）"""
+        with self.pinned():
+            return func(*args)
+
+
+class CPUBudget:
+    """
+    进程内共享的 CPU 线程预算
+
+    每个执行环节（一次 Manim 渲染、一个 ffmpeg 编码进程、一次 moviepy 写出）开始时领取一份，
+    线程数按同时执行的环节数平分总预算，避免多个并发任务各自按全部核数开线程、互相争抢 CPU。
+    已经启动的进程无法调整线程数、也不会提前归还，因此份额至少按预计并发任务数平分，
+    并且不超过尚未分出的线程数：先开始的环节不会独占全部线程，各环节份额之和保持在预算以内
+    （预算已全部分出时后来的环节仍分到 1 个线程）。
+    启用绑核时，每个环节绑定到当前负载最低的一组 CPU 核上（仅 Linux）。
+    """
+
+    def __init__(self, total_threads: int = CPU_BUDGET_THREADS, pin: bool = CPU_AFFINITY):
+        if hasattr(os, "sched_getaffinity"):
+            self.cores = sorted(os.sched_getaffinity(0))
+        else:
+            self.cores = list(range(os.cpu_count() or 1))
+        self.total_threads = total_threads or len(self.cores)
+        self.pin = pin and hasattr(os, "sched_setaffinity")
+        if pin and not self.pin:
+            logger.warning("当前平台不支持设置 CPU 亲和性，CPU_AFFINITY 将被忽略")
+        self.active = 0
+        self.allocated = 0
+        self.expected_concurrency = 1
+        self._core_load = {core: 0 for core in self.cores}
+        # 同时被事件循环和后台线程使用，用线程锁保护
+        self._lock = threading.Lock()
+
+    def set_concurrency(self, tasks: int) -> None:
+        """设置预计同时执行的任务数（批量处理、流式处理、队列工作进程的最大并发数）"""
+        self.expected_concurrency = max(1, tasks)
+
+    @contextmanager
+    def lease(self, stage: str, max_threads: int = 0) -> Iterator[CPULease]:
+        """
+        领取一份 CPU 资源，with 块结束时归还
+
+        Args:
+            stage: 环节名称（用于日志）
+            max_threads: 该环节能有效利用的线程数上限，0 表示不限制
+        """
+        with self._lock:
+            self.active += 1
+            share = self.total_threads // max(self.active, self.expected_concurrency)
+            threads = max(1, min(share, self.total_threads - self.allocated))
+            if max_threads:
+                threads = min(threads, max_threads)
+            self.allocated += threads
+            cores = None
+            if self.pin:
+                # 负载最低的核优先，负载相同时按编号，尽量使用相邻的核
+                chosen = sorted(self.cores, key=lambda core: (self._core_load[core], core))[:threads]
+                cores = tuple(sorted(chosen))
+                for core in cores:
+                    self._core_load[core] += 1
+        logger.debug(
+            f"CPU 预算: {stage} 分到 {threads} 个线程"
+            + (f"，绑定核 {list(cores)}" if cores else "")
+            + f"（同时执行 {self.active} 个环节）"
+        )
+        try:
+            yield CPULease(stage, threads, cores)
+        finally:
+            with self._lock:
+                self.active -= 1
+                self.allocated -= threads
+                for core in cores or ():
+                    self._core_load[core] -= 1
+
+
+_cpu_budget: Optional[CPUBudget] = None
+
+
+def get_cpu_budget() -> CPUBudget:
+    """获取进程内共享的 CPU 预算"""
+    global _cpu_budget
+    if _cpu_budget is None:
+        _cpu_budget = CPUBudget()
+    return _cpu_budget
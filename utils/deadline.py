@@ -0,0 +1,131 @@
+"""任务截止时间（通过 contextvars 沿调用链传播到 LLM、TTS、Manim 和 ffmpeg）"""
+import os
+import time
+import signal
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Iterator, Optional
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 当前任务的截止时刻（time.monotonic()），None 表示不限制；
+# asyncio 任务和 asyncio.to_thread 会复制创建时的上下文，截止时间随之传播
+_deadline: ContextVar[Optional[float]] = ContextVar("task_deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """
+    任务自身的截止时间已到
+
+    与服务端响应慢导致的单次操作超时区分开：它不代表下游拥塞，不应重试，也不应触发限流器降低并发
+    """
+
+
+@contextmanager
+def deadline_scope(timeout: Optional[float]) -> Iterator[Optional[float]]:
+    """
+    在 with 块内设置截止时间（已有更早的截止时间时保持不变）
+
+    Args:
+        timeout: 从现在起的秒数，None 或 0 表示不限制
+    """
+    current = _deadline.get()
+    deadline = current
+    if timeout:
+        deadline = time.monotonic() + timeout
+        if current is not None:
+            deadline = min(deadline, current)
+    token = _deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_time() -> Optional[float]:
+    """距截止时间的剩余秒数（不小于 0），没有截止时间时返回 None"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+
+def bounded_timeout(timeout: Optional[float]) -> Optional[float]:
+    """把单次操作的超时时间限制在剩余时间以内"""
+    remaining = remaining_time()
+    if remaining is None:
+        return timeout
+    if timeout is None:
+        return remaining
+    return min(timeout, remaining)
+
+
+def check_deadline(description: str = "任务") -> None:
+    """已超过截止时间时抛出 DeadlineExceeded（供同步代码在各步骤之间主动检查）"""
+    if remaining_time() == 0:
+        raise DeadlineExceeded(f"{description}: 已超过任务截止时间")
+
+
+async def wait_with_deadline(awaitable: Awaitable[Any], description: str, timeout: Optional[float] = None) -> Any:
+    """
+    等待 awaitable 并在超时时取消它：超过 timeout 抛出 TimeoutError，
+    先到达任务截止时间则抛出 DeadlineExceeded
+    """
+    remaining = remaining_time()
+    limit = bounded_timeout(timeout)
+    if limit is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, timeout=limit)
+    except asyncio.TimeoutError:
+        if remaining is not None and (timeout is None or remaining <= timeout):
+            raise DeadlineExceeded(f"{description}: 已超过任务截止时间（{limit:.1f}s）") from None
+        raise TimeoutError(f"{description} 超时（{limit:.1f}s）") from None
+
+
+def subprocess_kwargs() -> dict:
+    """
+    创建子进程的额外参数：POSIX 上让子进程自成进程组，
+    超时或取消时可以连同其派生的进程（latex、ffmpeg 等）一起结束
+    """
+    return {"start_new_session": True} if os.name == "posix" else {}
+
+
+def kill_process_tree(process: Any) -> None:
+    """结束子进程及其进程组（进程已退出时忽略）"""
+    if process.returncode is not None:
+        return
+    try:
+        if os.name == "posix":
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+async def communicate_with_deadline(
+    process: asyncio.subprocess.Process,
+    description: str,
+    stdin_data: Optional[bytes] = None
+) -> tuple[bytes, bytes]:
+    """
+    process.communicate() 的截止时间版本
+
+    超过截止时间或所在任务被取消时结束子进程（及其进程组）并等待其退出，
+    不会留下继续占用 CPU 的孤儿进程
+    """
+    try:
+        return await wait_with_deadline(process.communicate(stdin_data), description)
+    except BaseException:
+        if process.returncode is None:
+            logger.warning(f"{description} 被中止，结束子进程 (pid {process.pid})")
+            kill_process_tree(process)
+            # 取消期间也要回收子进程；shield 防止再次取消时跳过等待
+            try:
+                await asyncio.shield(process.wait())
+            except asyncio.CancelledError:
+                pass
+        raise
@@ -0,0 +1,161 @@
+"""编码配置（渲染档位）"""
+from dataclasses import dataclass, replace
+from typing import Any, Dict, List, Optional
+from config import RENDER_PROFILE, RENDER_THREADS, MANIM_QUALITY
+
+
+@dataclass(frozen=True)
+class EncodingProfile:
+    """
+    渲染档位：Manim 渲染与所有 x264 编码环节共用的一组参数
+
+    分辨率和帧率同时传给 Manim，切割、合并、片尾环节按同样的帧率编码，避免帧率不一致
+    """
+    name: str
+    width: int
+    height: int
+    fps: int
+    preset: str                   # x264 preset
+    crf: int                      # x264 CRF，越小质量越高
+    manim_quality: str            # 对应的 Manim 质量档位（low_quality / medium_quality / high_quality）
+    tune: Optional[str] = "animation"
+    threads: int = 0              # 编码线程数，0 表示由 x264 自动决定
+    gop_seconds: float = 2.0      # 关键帧间隔（秒）
+    audio_bitrate: str = "128k"
+
+    @property
+    def gop(self) -> int:
+        """关键帧间隔（帧）"""
+        return max(1, round(self.fps * self.gop_seconds))
+
+    @property
+    def size(self) -> tuple[int, int]:
+        """(宽, 高)"""
+        return self.width, self.height
+
+    @property
+    def manim_quality_flag(self) -> str:
+        """Manim 命令行质量参数"""
+        return {
+            "low_quality": "-ql",
+            "medium_quality": "-qm",
+            "high_quality": "-qh",
+        }.get(self.manim_quality, "-qm")
+
+    @property
+    def manim_dir_name(self) -> str:
+        """Manim 输出目录中的质量子目录名（如 720p30）"""
+        return f"{self.height}p{self.fps}"
+
+    def manim_args(self) -> List[str]:
+        """Manim 命令行参数（质量档位 + 显式分辨率和帧率）"""
+        return [
+            self.manim_quality_flag,
+            "-r", f"{self.width},{self.height}",
+            "--fps", str(self.fps),
+        ]
+
+    def with_threads(self, threads: int) -> "EncodingProfile":
+        """未显式指定线程数（RENDER_THREADS）时，使用 CPU 预算分配的线程数"""
+        if self.threads or not threads:
+            return self
+        return replace(self, threads=threads)
+
+    def x264_params(self) -> List[str]:
+        """x264 参数（preset 和线程数之外的部分）"""
+        params = ["-crf", str(self.crf), "-g", str(self.gop)]
+        if self.tune:
+            params += ["-tune", self.tune]
+        return params
+
+    def moviepy_kwargs(self) -> Dict[str, Any]:
+        """moviepy write_videofile 的视频编码参数"""
+        return {
+            "codec": "libx264",
+            "fps": self.fps,
+            "preset": self.preset,
+            "threads": self.threads or None,
+            "ffmpeg_params": self.x264_params(),
+        }
+
+    def static_span_filter(self, max_hold_seconds: float) -> str:
+        """
+        静止画面去重滤镜（mpdecimate）
+
+        连续相同的帧只保留第一帧并延长其显示时长，max_hold_seconds 限制单帧最长持续时间，
+        保证拖动进度条时仍能及时刷新画面
+        """
+        max_dropped = max(0, round(max_hold_seconds * self.fps) - 1)
+        return f"mpdecimate=max={max_dropped}"
+
+    def intermediate_video_args(self) -> List[str]:
+        """
+        中间文件的视频编码参数：无损（qp 0）+ 全帧内（每帧都是关键帧）
+
+        任意帧都可以直接切割且不损失画质，最终合并时再做唯一一次有损编码
+        """
+        args = [
+            "-c:v", "libx264", "-preset", "ultrafast", "-qp", "0", "-g", "1",
+            "-r", str(self.fps), "-pix_fmt", "yuv420p",
+        ]
+        if self.threads:
+            args += ["-threads", str(self.threads)]
+        return args
+
+    def ffmpeg_video_args(self, vfr: bool = False) -> List[str]:
+        """
+        直接调用 ffmpeg 时的视频编码参数
+
+        Args:
+            vfr: 输出可变帧率（配合 static_span_filter 去掉静止画面的重复帧），不再强制恒定帧率
+        """
+        frame_rate_args = ["-fps_mode", "vfr"] if vfr else ["-r", str(self.fps)]
+        args = [
+            "-c:v", "libx264", "-preset", self.preset, *frame_rate_args,
+            "-pix_fmt", "yuv420p", *self.x264_params(),
+        ]
+        if self.threads:
+            args += ["-threads", str(self.threads)]
+        return args
+
+
+ENCODING_PROFILES: Dict[str, EncodingProfile] = {
+    # 预览：低分辨率、低帧率、最快编码，整片预览比 standard 快数倍
+    "draft": EncodingProfile(
+        name="draft", width=854, height=480, fps=15,
+        preset="ultrafast", crf=30, manim_quality="low_quality",
+    ),
+    "standard": EncodingProfile(
+        name="standard", width=1280, height=720, fps=30,
+        preset="medium", crf=23, manim_quality="medium_quality",
+    ),
+    # 存档：高分辨率、高帧率、慢速高质量编码
+    "archive": EncodingProfile(
+        name="archive", width=1920, height=1080, fps=60,
+        preset="slow", crf=18, manim_quality="high_quality", audio_bitrate="192k",
+    ),
+}
+
+# 未设置 RENDER_PROFILE 时，按 MANIM_QUALITY 选择对应档位（向后兼容）
+_QUALITY_TO_PROFILE = {
+    "low_quality": "draft",
+    "medium_quality": "standard",
+    "high_quality": "archive",
+}
+
+
+def get_encoding_profile(name: Optional[str] = None, quality: Optional[str] = None) -> EncodingProfile:
+    """
+    获取渲染档位
+
+    Args:
+        name: draft / standard / archive；为空时读取 RENDER_PROFILE
+        quality: 未指定档位时按该 Manim 质量档位映射，默认 MANIM_QUALITY
+    """
+    name = (name or RENDER_PROFILE or _QUALITY_TO_PROFILE.get(quality or MANIM_QUALITY, "standard")).lower()
+    if name not in ENCODING_PROFILES:
+        raise ValueError(f"未知的渲染档位: {name}，可选: {', '.join(ENCODING_PROFILES)}")
+    profile = ENCODING_PROFILES[name]
+    if RENDER_THREADS:
+        profile = replace(profile, threads=RENDER_THREADS)
+    return profile
@@ -0,0 +1,228 @@
+"""ffmpeg 调用工具"""
+import re
+import shutil
+import asyncio
+import subprocess
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+from config import FFMPEG_BINARY
+from utils.deadline import DeadlineExceeded, communicate_with_deadline, remaining_time, subprocess_kwargs
+from utils.cpu_budget import CPULease
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+@lru_cache(maxsize=1)
+def get_ffmpeg_exe() -> str:
+    """
+    获取 ffmpeg 可执行文件路径
+
+    优先使用 FFMPEG_BINARY，其次使用 moviepy 依赖的 imageio-ffmpeg 自带的 ffmpeg，最后查找 PATH
+    """
+    if FFMPEG_BINARY:
+        return FFMPEG_BINARY
+    try:
+        import imageio_ffmpeg
+
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception as e:
+        logger.debug(f"imageio-ffmpeg 不可用: {e}")
+    ffmpeg_path = shutil.which("ffmpeg")
+    if ffmpeg_path:
+        return ffmpeg_path
+    raise RuntimeError("未找到 ffmpeg，请安装 ffmpeg 或设置 FFMPEG_BINARY")
+
+
+async def run_ffmpeg(args: List[str], description: str = "ffmpeg", cpu_lease: Optional[CPULease] = None) -> bytes:
+    """
+    异步执行 ffmpeg
+
+    Args:
+        args: ffmpeg 参数（不含可执行文件本身）
+        description: 用于日志和错误信息的操作描述
+        cpu_lease: CPU 预算（启用绑核时 ffmpeg 进程绑定到分到的核上；线程数由调用方写入 args）
+
+    Returns:
+        ffmpeg 的标准输出（输出到管道时即为数据本身）
+
+    超过任务截止时间或被取消时结束 ffmpeg 进程并抛出异常
+    """
+    cmd = [get_ffmpeg_exe(), "-hide_banner", "-nostdin", "-y", *args]
+    logger.debug(f"执行 {description}: {' '.join(cmd)}")
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        **subprocess_kwargs(),
+        **(cpu_lease.popen_kwargs() if cpu_lease else {})
+    )
+    stdout, stderr = await communicate_with_deadline(process, description)
+    if process.returncode != 0:
+        raise RuntimeError(_format_error(description, process.returncode, stderr))
+    return stdout
+
+
+def run_ffmpeg_sync(args: List[str], description: str = "ffmpeg") -> bytes:
+    """同步执行 ffmpeg（供同步调用方和后台线程使用），参数同 run_ffmpeg"""
+    cmd = [get_ffmpeg_exe(), "-hide_banner", "-nostdin", "-y", *args]
+    logger.debug(f"执行 {description}: {' '.join(cmd)}")
+    try:
+        # 后台线程继承了任务的截止时间，超时后 subprocess.run 会结束 ffmpeg 进程
+        process = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=remaining_time())
+    except subprocess.TimeoutExpired:
+        raise DeadlineExceeded(f"{description}: 已超过任务截止时间") from None
+    if process.returncode != 0:
+        raise RuntimeError(_format_error(description, process.returncode, process.stderr))
+    return process.stdout
+
+
+def _format_error(description: str, returncode: int, stderr: bytes) -> str:
+    """格式化 ffmpeg 错误信息"""
+    error_msg = stderr.decode("utf-8", errors="ignore").strip()
+    # 只保留最后几行，ffmpeg 的错误原因通常在末尾
+    error_tail = "\n".join(error_msg.splitlines()[-10:])
+    return f"{description} 失败 (返回码 {returncode}):\n{error_tail}"
+
+
+async def decode_to_pcm(input_path: str, sample_rate: int, channels: int = 1) -> bytes:
+    """将音频文件解码为 16 位小端 PCM 原始数据"""
+    return await run_ffmpeg(
+        [
+            "-i", input_path,
+            "-vn",
+            "-f", "s16le",
+            "-acodec", "pcm_s16le",
+            "-ac", str(channels),
+            "-ar", str(sample_rate),
+            "pipe:1",
+        ],
+        description=f"解码音频 {input_path}"
+    )
+
+
+async def encode_aac(input_path: str, output_path: str, bitrate: str = "128k") -> str:
+    """将音频编码为 AAC（M4A 容器）"""
+    await run_ffmpeg(
+        [
+            "-i", input_path,
+            "-vn",
+            "-c:a", "aac",
+            "-b:a", bitrate,
+            "-movflags", "+faststart",
+            output_path,
+        ],
+        description=f"编码 AAC {output_path}"
+    )
+    return output_path
+
+
+async def mux_video_audio(video_path: str, audio_path: str, output_path: str) -> str:
+    """将视频流和音频流直接复制封装到一个文件中（不重新编码）"""
+    await run_ffmpeg(
+        [
+            "-i", video_path,
+            "-i", audio_path,
+            "-map", "0:v:0",
+            "-map", "1:a:0",
+            "-c", "copy",
+            "-movflags", "+faststart",
+            output_path,
+        ],
+        description=f"封装音视频 {output_path}"
+    )
+    return output_path
+
+
+async def probe_media(input_path: str) -> Dict[str, Any]:
+    """
+    读取媒体文件的基本信息（解析 ffmpeg -i 的输出，不依赖 ffprobe）
+
+    Returns:
+        {"duration": 秒, "width": 宽, "height": 高, "fps": 帧率, "has_audio": 是否有音轨,
+         "video_codec", "video_profile", "pix_fmt", "audio_codec", "sample_rate", "channels"}，
+        无法解析的字段为 None
+    """
+    process = await asyncio.create_subprocess_exec(
+        get_ffmpeg_exe(), "-hide_banner", "-nostdin", "-i", input_path,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE,
+        **subprocess_kwargs()
+    )
+    _, stderr = await communicate_with_deadline(process, f"读取媒体信息 {input_path}")
+    return parse_probe_output(stderr.decode("utf-8", errors="ignore"))
+
+
+def probe_media_sync(input_path: str) -> Dict[str, Any]:
+    """同步读取媒体文件的基本信息，返回值同 probe_media"""
+    process = subprocess.run(
+        [get_ffmpeg_exe(), "-hide_banner", "-nostdin", "-i", input_path],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE
+    )
+    return parse_probe_output(process.stderr.decode("utf-8", errors="ignore"))
+
+
+def read_h264_parameter_sets(input_path: str) -> Optional[List[bytes]]:
+    """
+    读取 H.264 视频流的参数集（SPS / PPS NAL 单元，已排序去重），无法读取时返回 None
+
+    MP4 中的参数集保存在 avcC 中，h264_mp4toannexb 转换第一帧时会把它们插到关键帧之前；
+    SPS 中包含 level、参考帧数等，PPS 中包含熵编码方式（CABAC）、8x8 变换、初始 QP 等
+    """
+    process = subprocess.run(
+        [
+            get_ffmpeg_exe(), "-hide_banner", "-nostdin", "-loglevel", "error", "-i", input_path,
+            "-map", "0:v:0", "-c:v", "copy", "-bsf:v", "h264_mp4toannexb",
+            "-frames:v", "1", "-f", "h264", "-",
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL
+    )
+    if process.returncode != 0 or not process.stdout:
+        return None
+    # 按起始码 00 00 01 切分；四字节起始码多出的 0x00 留在前一个单元末尾，
+    # 参数集以非零的 rbsp 结尾位结束，去掉末尾的 0x00 即可
+    nal_units = {unit.rstrip(b"\x00") for unit in process.stdout.split(b"\x00\x00\x01")}
+    parameter_sets = sorted(unit for unit in nal_units if unit and unit[0] & 0x1F in (7, 8))
+    return parameter_sets or None
+
+
+def parse_probe_output(output: str) -> Dict[str, Any]:
+    """解析 ffmpeg -i 的 stderr 输出"""
+    info: Dict[str, Any] = {
+        "duration": None, "width": None, "height": None, "fps": None, "has_audio": False,
+        "video_codec": None, "video_profile": None, "pix_fmt": None,
+        "audio_codec": None, "sample_rate": None, "channels": None,
+    }
+
+    duration_match = re.search(r"Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)", output)
+    if duration_match:
+        hours, minutes, seconds = duration_match.groups()
+        info["duration"] = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+    video_line = re.search(r"Stream #.*?Video:.*", output)
+    if video_line:
+        size_match = re.search(r"\b(\d{2,5})x(\d{2,5})\b", video_line.group(0))
+        if size_match:
+            info["width"], info["height"] = int(size_match.group(1)), int(size_match.group(2))
+        fps_match = re.search(r"(\d+(?:\.\d+)?)\s*fps", video_line.group(0))
+        if fps_match:
+            info["fps"] = float(fps_match.group(1))
+        # 形如 "Video: h264 (High) (avc1 / 0x31637661), yuv420p(progressive), ..."
+        codec_match = re.search(r"Video:\s*(\w+)(?:\s*\(([^)]*)\))?[^,]*,\s*(\w+)", video_line.group(0))
+        if codec_match:
+            info["video_codec"], info["video_profile"], info["pix_fmt"] = codec_match.groups()
+
+    audio_line = re.search(r"Stream #.*?Audio:.*", output)
+    info["has_audio"] = audio_line is not None
+    if audio_line:
+        # 形如 "Audio: aac (LC) (mp4a / 0x6134706D), 24000 Hz, mono, fltp, 128 kb/s"
+        codec_match = re.search(r"Audio:\s*(\w+)", audio_line.group(0))
+        if codec_match:
+            info["audio_codec"] = codec_match.group(1)
+        rate_match = re.search(r"(\d+)\s*Hz,\s*([\w.()]+)", audio_line.group(0))
+        if rate_match:
+            info["sample_rate"] = int(rate_match.group(1))
+            info["channels"] = rate_match.group(2)
+    return info
@@ -5,7 +5,7 @@ import re
 import hashlib
 import aiofiles
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Callable, Dict, Iterator, List, Optional
 
 
 def ensure_dir(dir_path: str) -> None:
@@ -39,6 +39,47 @@ def load_json(file_path: str) -> Dict[str, Any]:
         return json.load(f)
 
 
+def append_jsonl(record: Dict[str, Any], file_path: str) -> None:
+    """向 JSONL 文件追加一条记录（一行一个 JSON 对象）"""
+    ensure_dir(os.path.dirname(file_path) or ".")
+    with open(file_path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def iter_jsonl(
+    file_path: str,
+    on_invalid: Optional[Callable[[int, str], None]] = None
+) -> Iterator[Any]:
+    """
+    逐行读取 JSONL 文件（惰性读取，内存占用与文件大小无关）
+    
+    Args:
+        file_path: JSONL 文件路径
+        on_invalid: 遇到无法解析的行时的回调 on_invalid(行号, 原始内容)，之后跳过该行；
+            为 None 时抛出 ValueError
+    """
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                if on_invalid is None:
+                    raise ValueError(f"{file_path} 第 {line_number} 行不是有效的 JSON: {e}") from e
+                on_invalid(line_number, line)
+                continue
+            yield record
+
+
+def load_jsonl(file_path: str) -> List[Dict[str, Any]]:
+    """加载 JSONL 文件，跳过空行和写了一半的行（如进程中断时的最后一行）"""
+    if not os.path.exists(file_path):
+        return []
+    return list(iter_jsonl(file_path, on_invalid=lambda line_number, line: None))
+
+
 def load_file_content(file_path: str) -> str:
     """加载文件内容（支持相对路径）"""
     # 如果是相对路径，从项目根目录开始
@@ -125,19 +166,26 @@ def cleanup_directory(directory: str, force: bool = False) -> bool:
         return False
 
 
-def generate_task_id(formula: str) -> str:
+def generate_task_id(formula: str, **params: Any) -> str:
     """
-    基于公式名称生成任务ID（16位MD5哈希值）
+    基于公式和生成参数生成任务ID（16位MD5哈希值）
     
-    相同公式会生成相同的任务ID，便于复用已生成的文件
+    相同的公式和参数会生成相同的任务ID，便于复用已生成的文件；
+    参数不同（如时长、风格）的任务使用不同的任务ID和临时目录，不会互相覆盖中间文件
     
     Args:
         formula: 数学公式或主题名称
+        **params: 其他影响生成结果的参数（duration, style, package, ending 等），值为 None 的参数忽略
     
     Returns:
-        16位十六进制字符串作为任务ID
+        16位十六进制字符串作为任务ID（只传公式时与旧版本的任务ID一致）
     """
-    hash_obj = hashlib.md5(formula.encode('utf-8'))
+    params = {key: value for key, value in params.items() if value is not None}
+    if not params:
+        key = formula
+    else:
+        key = json.dumps({"formula": formula, **params}, ensure_ascii=False, sort_keys=True)
+    hash_obj = hashlib.md5(key.encode('utf-8'))
     return hash_obj.hexdigest()[:16]
 
 
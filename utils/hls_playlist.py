@@ -0,0 +1,72 @@
+"""渐进式 HLS 播放列表（EVENT 类型，随分片完成不断追加）"""
+import os
+import math
+from typing import Dict, List, Tuple
+
+
+class ProgressivePlaylist:
+    """
+    EVENT 类型的 HLS 媒体播放列表
+
+    分片可以乱序完成，但只有从头开始连续就绪的分片才会写入播放列表，
+    保证播放器看到的时间轴始终是连续的。每次更新都先写临时文件再原子替换，
+    播放器不会读到写了一半的播放列表。
+    """
+
+    def __init__(self, playlist_path: str, target_duration: float):
+        self.playlist_path = playlist_path
+        # EXT-X-TARGETDURATION 必须不小于任何分片时长（取整后）
+        self.target_duration = max(1, math.ceil(target_duration))
+        self._ready: Dict[int, Tuple[str, float]] = {}
+        self._published: List[Tuple[str, float]] = []
+        self._finished = False
+        self._write()
+
+    @property
+    def published_count(self) -> int:
+        """已写入播放列表的分片数"""
+        return len(self._published)
+
+    def add_segment(self, index: int, segment_path: str, duration: float) -> int:
+        """
+        登记第 index 个分片已就绪
+
+        Returns:
+            本次新写入播放列表的分片数
+        """
+        self._ready[index] = (os.path.basename(segment_path), duration)
+        new_count = 0
+        while len(self._published) in self._ready:
+            self._published.append(self._ready.pop(len(self._published)))
+            new_count += 1
+        if new_count:
+            self._write()
+        return new_count
+
+    def finish(self) -> None:
+        """所有分片就绪，写入结束标记（仅在全部分片都已写入播放列表时调用）"""
+        self._finished = True
+        self._write()
+
+    def render(self) -> str:
+        """生成播放列表文本"""
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:3",
+            "#EXT-X-PLAYLIST-TYPE:EVENT",
+            f"#EXT-X-TARGETDURATION:{self.target_duration}",
+            "#EXT-X-MEDIA-SEQUENCE:0",
+        ]
+        for name, duration in self._published:
+            lines.append(f"#EXTINF:{duration:.6f},")
+            lines.append(name)
+        if self._finished:
+            lines.append("#EXT-X-ENDLIST")
+        return "\n".join(lines) + "\n"
+
+    def _write(self) -> None:
+        """原子写入播放列表"""
+        temp_path = self.playlist_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(temp_path, self.playlist_path)
@@ -0,0 +1,265 @@
+"""持久化任务队列（SQLite，支持租约、重试和断点续跑）"""
+import os
+import json
+import time
+import sqlite3
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+from config import JOB_QUEUE_URL, JOB_QUEUE_PATH, JOB_QUEUE_SQLITE_WAL, JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS
+from utils.file_utils import ensure_dir
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 任务状态：pending（等待）→ running（执行中，stage 记录当前步骤）→ done / failed
+JOB_STATES = ("pending", "running", "done", "failed")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    task_id TEXT NOT NULL UNIQUE,
+    params TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    stage INTEGER,
+    stage_name TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker_id TEXT,
+    lease_expires REAL,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs (state, id);
+"""
+
+
+class JobQueue:
+    """
+    基于 SQLite 的本地任务队列
+
+    任务在领取时获得一个租约，执行期间由工作进程定期续约（心跳）；
+    进程崩溃后租约到期，任务会被其他工作进程重新领取，超过最大尝试次数后标记为 failed。
+    每次操作使用独立的连接，可以在多个线程和多个进程中同时使用，运行中也可以随时查看队列状态。
+    放在共享文件系统上供多台机器使用时需关闭 WAL（WAL 依赖共享内存，不支持网络文件系统）。
+    """
+
+    def __init__(
+        self,
+        db_path: str = JOB_QUEUE_PATH,
+        lease_seconds: float = JOB_LEASE_SECONDS,
+        max_attempts: int = JOB_MAX_ATTEMPTS,
+        wal: bool = JOB_QUEUE_SQLITE_WAL
+    ):
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        ensure_dir(os.path.dirname(os.path.abspath(db_path)))
+        with self._connect() as conn:
+            # WAL 模式下读写互不阻塞，查看状态不会卡住工作进程
+            conn.execute(f"PRAGMA journal_mode={'WAL' if wal else 'DELETE'}")
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """创建连接，用完即关闭（自动提交模式，多语句事务由调用方显式 BEGIN）"""
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def enqueue(self, task_id: str, params: Dict[str, Any]) -> bool:
+        """
+        加入一个任务
+
+        Args:
+            task_id: 任务ID（队列内唯一）
+            params: 任务参数（formula, duration, style 等）
+
+        Returns:
+            是否新加入；相同 task_id 的任务已存在时返回 False
+        """
+        return self.enqueue_many([(task_id, params)]) == 1
+
+    def enqueue_many(self, tasks: List[tuple[str, Dict[str, Any]]]) -> int:
+        """批量加入任务（单个事务），已存在的 task_id 会被忽略，返回新加入的数量"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                added = 0
+                for task_id, params in tasks:
+                    cursor = conn.execute(
+                        "INSERT OR IGNORE INTO jobs (task_id, params, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                        (task_id, json.dumps(params, ensure_ascii=False), now, now)
+                    )
+                    added += cursor.rowcount
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return added
+
+    def claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """
+        领取一个任务：优先领取等待中的任务，其次领取租约已过期的执行中任务
+
+        Returns:
+            任务字典（含 params），没有可领取的任务时返回 None
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # 租约过期且已用完尝试次数的任务直接标记为失败
+                conn.execute(
+                    "UPDATE jobs SET state = 'failed', error = '租约过期（工作进程可能已崩溃），已达最大尝试次数', "
+                    "worker_id = NULL, lease_expires = NULL, updated_at = ? "
+                    "WHERE state = 'running' AND lease_expires < ? AND attempts >= ?",
+                    (now, now, self.max_attempts)
+                )
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE state = 'pending' "
+                    "OR (state = 'running' AND lease_expires < ?) ORDER BY id LIMIT 1",
+                    (now,)
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                if row["state"] == "running":
+                    logger.warning(f"任务 {row['task_id']} 的租约已过期（原工作进程: {row['worker_id']}），重新领取")
+                conn.execute(
+                    "UPDATE jobs SET state = 'running', stage = NULL, stage_name = NULL, attempts = attempts + 1, "
+                    "worker_id = ?, lease_expires = ?, updated_at = ? WHERE id = ?",
+                    (worker_id, now + self.lease_seconds, now, row["id"])
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        job = self._row_to_dict(row)
+        job.update(state="running", attempts=row["attempts"] + 1, worker_id=worker_id)
+        return job
+
+    def heartbeat(
+        self,
+        task_id: str,
+        worker_id: str,
+        stage: Optional[int] = None,
+        stage_name: Optional[str] = None
+    ) -> bool:
+        """
+        续约，并可同时更新当前步骤
+
+        Returns:
+            是否仍持有租约；租约已被其他工作进程接管时返回 False
+        """
+        now = time.time()
+        with self._connect() as conn:
+            if stage is None:
+                cursor = conn.execute(
+                    "UPDATE jobs SET lease_expires = ?, updated_at = ? "
+                    "WHERE task_id = ? AND worker_id = ? AND state = 'running'",
+                    (now + self.lease_seconds, now, task_id, worker_id)
+                )
+            else:
+                cursor = conn.execute(
+                    "UPDATE jobs SET lease_expires = ?, stage = ?, stage_name = ?, updated_at = ? "
+                    "WHERE task_id = ? AND worker_id = ? AND state = 'running'",
+                    (now + self.lease_seconds, stage, stage_name, now, task_id, worker_id)
+                )
+        return cursor.rowcount == 1
+
+    def complete(self, task_id: str, worker_id: str, result: Dict[str, Any]) -> bool:
+        """标记任务完成并保存结果"""
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET state = 'done', result = ?, error = NULL, lease_expires = NULL, updated_at = ? "
+                "WHERE task_id = ? AND worker_id = ? AND state = 'running'",
+                (json.dumps(result, ensure_ascii=False), now, task_id, worker_id)
+            )
+        return cursor.rowcount == 1
+
+    def fail(self, task_id: str, worker_id: str, error: str) -> Optional[str]:
+        """
+        记录一次失败：未达最大尝试次数时放回等待队列，否则标记为 failed
+
+        Returns:
+            任务的新状态（pending / failed），租约已被接管时返回 None
+        """
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "error = ?, worker_id = NULL, lease_expires = NULL, updated_at = ? "
+                "WHERE task_id = ? AND worker_id = ? AND state = 'running'",
+                (self.max_attempts, error, now, task_id, worker_id)
+            )
+            if cursor.rowcount != 1:
+                return None
+            row = conn.execute("SELECT state FROM jobs WHERE task_id = ?", (task_id,)).fetchone()
+        return row["state"]
+
+    def retry_failed(self) -> int:
+        """把所有 failed 任务放回等待队列并清零尝试次数，返回数量"""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET state = 'pending', attempts = 0, updated_at = ? WHERE state = 'failed'",
+                (time.time(),)
+            )
+        return cursor.rowcount
+
+    def stats(self) -> Dict[str, int]:
+        """各状态的任务数"""
+        counts = {state: 0 for state in JOB_STATES}
+        with self._connect() as conn:
+            for row in conn.execute("SELECT state, COUNT(*) AS n FROM jobs GROUP BY state"):
+                counts[row["state"]] = row["n"]
+        return counts
+
+    def has_active_jobs(self) -> bool:
+        """是否还有等待中或执行中的任务"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT 1 FROM jobs WHERE state IN ('pending', 'running') LIMIT 1"
+            ).fetchone()
+        return row is not None
+
+    def list_jobs(self, state: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """列出任务（按加入顺序），state 为空时列出全部"""
+        with self._connect() as conn:
+            if state:
+                rows = conn.execute(
+                    "SELECT * FROM jobs WHERE state = ? ORDER BY id LIMIT ?", (state, limit)
+                ).fetchall()
+            else:
+                rows = conn.execute("SELECT * FROM jobs ORDER BY id LIMIT ?", (limit,)).fetchall()
+        return [self._row_to_dict(row) for row in rows]
+
+    @staticmethod
+    def _row_to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        """数据库行转为字典，解析 JSON 字段"""
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+
+def open_job_queue(url: Optional[str] = None):
+    """
+    按地址打开任务队列
+
+    Args:
+        url: redis://（或 rediss://）开头时使用 RedisJobQueue，sqlite:/// 开头或普通路径时使用 SQLite；
+            为空时读取 JOB_QUEUE_URL，仍为空则使用 JOB_QUEUE_PATH
+    """
+    url = url or JOB_QUEUE_URL or JOB_QUEUE_PATH
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        from utils.redis_job_queue import RedisJobQueue
+        return RedisJobQueue(url)
+    if url.startswith("sqlite:///"):
+        url = url[len("sqlite:///"):]
+    return JobQueue(url)
@@ -0,0 +1,97 @@
+"""流式 JSON 增量解析工具"""
+import json
+from typing import Any, Dict, List, Optional
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class IncrementalJSONArrayParser:
+    """
+    增量解析流式 JSON 文本中指定键对应数组里的对象元素
+
+    LLM 流式输出剧本时，每当 "segments" 数组中的一个对象完整到达，就立即解析并返回，
+    无需等待整个 JSON 结束。可以容忍 markdown 代码块等前后缀文本。
+    """
+
+    def __init__(self, key: str = "segments"):
+        self.key = key
+        self.text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start: Optional[int] = None
+        self._last_string: Optional[str] = None
+        self._awaiting_colon = False
+        self._awaiting_array = False
+        self._array_depth: Optional[int] = None
+        self._item_start: Optional[int] = None
+        self.finished = False
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """
+        喂入新的文本分块
+
+        Returns:
+            本次新完整到达的数组元素（已解析为 dict）
+        """
+        self.text += chunk
+        items = []
+        text = self.text
+
+        while self._pos < len(text) and not self.finished:
+            ch = text[self._pos]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._item_start is None:
+                        self._last_string = text[self._string_start + 1:self._pos]
+                        self._awaiting_colon = True
+                self._pos += 1
+                continue
+
+            if ch.isspace():
+                self._pos += 1
+                continue
+
+            if self._awaiting_colon:
+                self._awaiting_colon = False
+                if ch == ':' and self._last_string == self.key and self._array_depth is None:
+                    self._awaiting_array = True
+                    self._pos += 1
+                    continue
+            elif self._awaiting_array:
+                self._awaiting_array = False
+                if ch == '[':
+                    self._depth += 1
+                    self._array_depth = self._depth
+                    self._pos += 1
+                    continue
+
+            if ch == '"':
+                self._in_string = True
+                self._string_start = self._pos
+            elif ch in '{[':
+                self._depth += 1
+                if ch == '{' and self._array_depth is not None and self._depth == self._array_depth + 1:
+                    self._item_start = self._pos
+            elif ch in '}]':
+                if ch == '}' and self._item_start is not None and self._depth == self._array_depth + 1:
+                    item_text = text[self._item_start:self._pos + 1]
+                    self._item_start = None
+                    try:
+                        items.append(json.loads(item_text))
+                    except json.JSONDecodeError as e:
+                        logger.warning(f"流式 JSON 元素解析失败，跳过: {e}")
+                elif ch == ']' and self._array_depth is not None and self._depth == self._array_depth:
+                    self.finished = True
+                self._depth -= 1
+            self._pos += 1
+
+        return items
@@ -0,0 +1,406 @@
+"""LaTeX 公式转中文口语（基于规则，无需调用 LLM）"""
+import re
+from typing import List, Optional, Tuple
+
+# Token 类型
+CMD = "cmd"          # \frac、\alpha 等命令
+SYMBOL = "symbol"    # 单个字母、运算符、括号等
+NUMBER = "number"    # 数字（含小数）
+LBRACE = "{"
+RBRACE = "}"
+SUP = "^"
+SUB = "_"
+
+# 希腊字母读法
+GREEK_LETTERS = {
+    "alpha": "阿尔法", "beta": "贝塔", "gamma": "伽马", "delta": "德尔塔", "Delta": "德尔塔",
+    "epsilon": "艾普西隆", "varepsilon": "艾普西隆", "theta": "西塔", "lambda": "兰姆达",
+    "mu": "缪", "pi": "派", "rho": "柔", "sigma": "西格玛", "Sigma": "西格玛",
+    "tau": "陶", "phi": "斐", "varphi": "斐", "omega": "欧米伽", "Omega": "欧米伽",
+}
+
+# 运算符与关系符读法（命令形式）
+OPERATOR_COMMANDS = {
+    "times": "乘", "cdot": "乘", "div": "除以", "pm": "正负", "mp": "负正",
+    "le": "小于等于", "leq": "小于等于", "ge": "大于等于", "geq": "大于等于",
+    "neq": "不等于", "ne": "不等于", "approx": "约等于", "equiv": "恒等于",
+    "perp": "垂直于", "parallel": "平行于",
+    # 空白命令
+    "quad": "", "qquad": "", ",": "", ";": "", "!": "", " ": "",
+}
+
+# 可单独成项的命令读法
+ATOM_COMMANDS = {
+    "infty": "无穷大", "angle": "角", "triangle": "三角形", "circ": "度",
+    "cdots": "点点点", "ldots": "点点点", "dots": "点点点",
+    "sin": "正弦", "cos": "余弦", "tan": "正切",
+}
+
+# 函数名（乘方写在函数名上时，读作作用对象的乘方）
+FUNCTION_COMMANDS = {"sin", "cos", "tan"}
+
+# 单字符运算符与关系符读法
+OPERATOR_SYMBOLS = {
+    "+": "加", "-": "减", "=": "等于", "<": "小于", ">": "大于", "×": "乘", "÷": "除以",
+    "·": "乘", "±": "正负", "≤": "小于等于", "≥": "大于等于", "≠": "不等于", "≈": "约等于",
+    "/": "除以", "*": "乘", "⊥": "垂直于", "∥": "平行于", ",": "，",
+}
+
+# 可单独成项的单字符读法
+ATOM_SYMBOLS = {
+    "π": "派", "θ": "西塔", "α": "阿尔法", "β": "贝塔", "∞": "无穷大",
+    "∠": "角", "△": "三角形", "'": "撇",
+}
+
+# 只取内容、忽略样式的命令
+TEXT_COMMANDS = {"text", "mathrm", "mathbf", "mathit", "boldsymbol", "textbf", "operatorname"}
+# 直接忽略的命令（\big( 等只改变括号大小，括号本身仍按普通括号解析）
+IGNORED_COMMANDS = {"displaystyle", "limits", "big", "Big", "bigg", "Bigg"}
+
+# \left / \right 定界符转换成的 token：圆括号和方括号按普通括号分组，
+# 绝对值转换为内部命令 left| 加花括号分组，\left. 等空定界符不产生 token，其余定界符交给 LLM
+ABS_COMMAND = "left|"
+SIZED_DELIMITERS = {
+    ("left", "("): [(SYMBOL, "(")], ("right", ")"): [(SYMBOL, ")")],
+    ("left", "["): [(SYMBOL, "(")], ("right", "]"): [(SYMBOL, ")")],
+    ("left", "|"): [(CMD, ABS_COMMAND), (LBRACE, "{")], ("right", "|"): [(RBRACE, "}")],
+    ("left", "."): [], ("right", "."): [],
+}
+
+UNICODE_SUPERSCRIPTS = {"²": "2", "³": "3"}
+
+# 数学区域：$$...$$、$...$、\(...\)
+MATH_REGION_PATTERN = re.compile(r'\$\$(.+?)\$\$|\$(.+?)\$|\\\((.+?)\\\)', re.DOTALL)
+# 纯文本中的 Unicode 数学片段（必须包含至少一个明确的数学符号）
+PLAIN_MATH_PATTERN = re.compile(
+    r'[A-Za-z0-9()πθαβ²³√]*[²³√×÷=≤≥≠≈±][A-Za-z0-9()πθαβ²³√+\-×÷=≤≥≠≈±]*'
+)
+# 转换后仍残留的 LaTeX 痕迹
+RESIDUE_PATTERN = re.compile(r'[$\\^_{}]')
+
+
+class LowConfidence(Exception):
+    """遇到规则无法可靠处理的结构"""
+
+
+class LaTeXSpeechConverter:
+    """
+    基于规则的 LaTeX 公式转中文口语转换器
+
+    由一个小型 LaTeX 分词器和符号表组成，覆盖分数、根号、乘方、下标、希腊字母和常见运算符。
+    遇到无法可靠处理的结构（未知命令、积分/求和/极限、环境、括号不匹配等）时标记为低置信度，
+    由调用方交给 LLM 处理。
+    """
+
+    def convert(self, text: str) -> Tuple[str, bool]:
+        """
+        转换一段讲解文案
+
+        Returns:
+            (转换后的文本, 是否高置信度)
+        """
+        confident = True
+        parts = []
+        last_end = 0
+
+        for match in MATH_REGION_PATTERN.finditer(text):
+            plain, plain_ok = self._convert_plain(text[last_end:match.start()])
+            parts.append(plain)
+            confident = confident and plain_ok
+            latex = next(group for group in match.groups() if group is not None)
+            try:
+                parts.append(self.convert_latex(latex))
+            except LowConfidence:
+                confident = False
+                parts.append(latex)
+            last_end = match.end()
+        plain, plain_ok = self._convert_plain(text[last_end:])
+        parts.append(plain)
+        confident = confident and plain_ok
+
+        result = "".join(parts)
+        if RESIDUE_PATTERN.search(result):
+            confident = False
+        return result, confident
+
+    def convert_latex(self, latex: str) -> str:
+        """转换单个 LaTeX 公式，无法可靠转换时抛出 LowConfidence"""
+        tokens = self._tokenize(latex)
+        parser = _Parser(tokens)
+        spoken = parser.parse_sequence()
+        if parser.pos != len(tokens):
+            raise LowConfidence("存在多余的闭合花括号")
+        return spoken
+
+    def _convert_plain(self, text: str) -> Tuple[str, bool]:
+        """
+        转换纯文本中的 Unicode 数学片段（如 a²+b²=c²）
+
+        Returns:
+            (转换后的文本, 是否全部转换成功)
+        """
+        failed = []
+
+        def replace(match: re.Match) -> str:
+            try:
+                return self.convert_latex(match.group(0))
+            except LowConfidence:
+                failed.append(match.group(0))
+                return match.group(0)
+
+        return PLAIN_MATH_PATTERN.sub(replace, text), not failed
+
+    @staticmethod
+    def _tokenize(latex: str) -> List[Tuple[str, str]]:
+        """将 LaTeX 公式切分为 token 列表"""
+        tokens = []
+        i = 0
+        while i < len(latex):
+            ch = latex[i]
+            if ch == '\\':
+                match = re.match(r'\\([A-Za-z]+|.)', latex[i:])
+                if not match:
+                    raise LowConfidence("公式以反斜杠结尾")
+                name = match.group(1)
+                i += match.end()
+                if name in ("left", "right"):
+                    delimiter = re.match(r'\s*(\\[A-Za-z]+|\\.|.)', latex[i:])
+                    if not delimiter or (name, delimiter.group(1)) not in SIZED_DELIMITERS:
+                        raise LowConfidence(f"未支持的定界符: \\{name}")
+                    tokens.extend(SIZED_DELIMITERS[(name, delimiter.group(1))])
+                    i += delimiter.end()
+                    continue
+                tokens.append((CMD, name))
+            elif ch in UNICODE_SUPERSCRIPTS:
+                tokens.append((SUP, ch))
+                tokens.append((NUMBER, UNICODE_SUPERSCRIPTS[ch]))
+                i += 1
+            elif '0' <= ch <= '9':
+                match = re.match(r'[0-9]+(?:\.[0-9]+)?', latex[i:])
+                tokens.append((NUMBER, match.group(0)))
+                i += match.end()
+            elif ch == '√':
+                tokens.append((CMD, "sqrt"))
+                i += 1
+            elif ch in (LBRACE, RBRACE, SUP, SUB):
+                tokens.append((ch, ch))
+                i += 1
+            elif ch.isspace():
+                i += 1
+            else:
+                tokens.append((SYMBOL, ch))
+                i += 1
+        return tokens
+
+
+class _Parser:
+    """LaTeX token 的递归下降解析器，直接产出中文读法"""
+
+    def __init__(self, tokens: List[Tuple[str, str]]):
+        self.tokens = tokens
+        self.pos = 0
+
+    def _peek(self) -> Optional[Tuple[str, str]]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def _next(self) -> Tuple[str, str]:
+        token = self._peek()
+        if token is None:
+            raise LowConfidence("公式不完整")
+        self.pos += 1
+        return token
+
+    def parse_sequence(self, closing: Optional[str] = None) -> str:
+        """解析到花括号闭合、指定的闭合符号（不消费）或结尾"""
+        pieces: List[str] = []
+        expect_operand = True
+        while True:
+            token = self._peek()
+            if token is None:
+                if closing is not None:
+                    raise LowConfidence("括号不匹配")
+                break
+            if token[0] == RBRACE or token == (SYMBOL, closing):
+                break
+            kind, value = token
+            if kind == SYMBOL and value in OPERATOR_SYMBOLS:
+                self.pos += 1
+                # 开头或运算符之后的减号读作「负」
+                pieces.append("负" if value == "-" and expect_operand else OPERATOR_SYMBOLS[value])
+                expect_operand = True
+                continue
+            if kind == CMD and value in OPERATOR_COMMANDS:
+                self.pos += 1
+                word = OPERATOR_COMMANDS[value]
+                pieces.append(word)
+                expect_operand = expect_operand or bool(word)
+                continue
+            pieces.append(self._parse_postfix())
+            expect_operand = False
+        return _join(pieces)
+
+    def _parse_postfix(self) -> str:
+        """解析一个原子及其上下标"""
+        start = self.pos
+        base, group_op = self._parse_atom()
+        kind, value = self.tokens[start]
+        if kind == SYMBOL and value.isascii() and value.isalpha() and self._peek() == (SYMBOL, "("):
+            # 字母紧跟括号按函数调用读，f(x) 读作「f括号x」
+            self.pos += 1
+            argument, inner_ops = self._parse_parenthesized()
+            if inner_ops:
+                raise LowConfidence("函数参数中含加减运算")
+            base = _join([base, "括号", argument])
+        while True:
+            token = self._peek()
+            if token is None or token[0] not in (SUP, SUB):
+                return base
+            self.pos += 1
+            if token[0] == SUB:
+                base = _join([base, self._parse_argument()])
+                continue
+            exponent = self._parse_argument()
+            if group_op == "func":
+                # sin^2 x 读作「正弦x的平方」
+                base = _join([base, self._parse_postfix()])
+                group_op = None
+            if exponent == "度":
+                base = _join([base, "度"])
+            elif exponent == "2":
+                base = f"{base}的{'和的' if group_op == '+' else '差的' if group_op == '-' else ''}平方"
+            elif exponent == "3":
+                base = f"{base}的{'和的' if group_op == '+' else '差的' if group_op == '-' else ''}立方"
+            else:
+                base = f"{base}的{exponent}次方"
+
+    def _parse_argument(self) -> str:
+        """解析命令参数或上下标：{...} 或单个 token"""
+        token = self._peek()
+        if token is None:
+            raise LowConfidence("缺少参数")
+        if token[0] == LBRACE:
+            return self._parse_group()
+        atom, _ = self._parse_atom()
+        return atom
+
+    def _parse_group(self) -> str:
+        """解析 {...}"""
+        self._next()
+        content = self.parse_sequence()
+        if self._next()[0] != RBRACE:
+            raise LowConfidence("花括号不匹配")
+        return content
+
+    def _parse_atom(self) -> Tuple[str, Optional[str]]:
+        """
+        解析一个原子
+
+        Returns:
+            (读法, 标记：括号组内的主运算符 '+'/'-'，三角函数为 'func'，其余为 None)
+        """
+        kind, value = self._next()
+
+        if kind == NUMBER:
+            return value, None
+        if kind == LBRACE:
+            self.pos -= 1
+            return self._parse_group(), None
+        if kind == SYMBOL:
+            if value == "(":
+                start = self.pos
+                content, inner_ops = self._parse_parenthesized()
+                op = "+" if inner_ops == {"+"} else "-" if inner_ops == {"-"} else None
+                # 括号后面紧跟乘方时可以读作「和/差的平方」，否则无法可靠表达分组
+                if self._peek() is None or self._peek()[0] != SUP:
+                    if inner_ops:
+                        raise LowConfidence("括号分组无法可靠读出")
+                elif inner_ops and op is None:
+                    raise LowConfidence("括号内运算复杂")
+                elif not inner_ops and not _is_single_atom(self.tokens[start:self.pos - 1]):
+                    # (ab)^2 读作「a b的平方」会被理解为只有 b 平方
+                    raise LowConfidence("括号内乘积的乘方无法可靠读出")
+                return content, op
+            if value.isalpha() and value.isascii():
+                return value, None
+            if value in ATOM_SYMBOLS:
+                return ATOM_SYMBOLS[value], None
+            if '\u4e00' <= value <= '\u9fff':
+                # 公式中夹杂的中文（如「底 × 高」）原样读出
+                return value, None
+            raise LowConfidence(f"未知符号: {value}")
+        if kind == CMD:
+            return self._parse_command(value), "func" if value in FUNCTION_COMMANDS else None
+        raise LowConfidence(f"意外的 {value}")
+
+    def _parse_parenthesized(self) -> Tuple[str, set]:
+        """解析左括号之后直到右括号（含）的内容，返回 (读法, 括号内出现的加减号)"""
+        start = self.pos
+        content = self.parse_sequence(")")
+        inner_ops = {v for k, v in self.tokens[start:self.pos] if k == SYMBOL and v in "+-"}
+        self._next()
+        return content, inner_ops
+
+    def _parse_command(self, name: str) -> str:
+        """解析命令"""
+        if name in ("frac", "dfrac", "tfrac"):
+            numerator = self._parse_argument()
+            denominator = self._parse_argument()
+            return f"{denominator}分之{numerator}"
+        if name == "sqrt":
+            index = None
+            if self._peek() == (SYMBOL, "["):
+                self.pos += 1
+                index = self.parse_sequence("]")
+                self._next()
+            radicand = self._parse_argument()
+            if index is None or index == "2":
+                return f"根号{radicand}"
+            if index == "3":
+                return f"三次根号{radicand}"
+            return f"{index}次根号{radicand}"
+        if name in TEXT_COMMANDS:
+            if self._peek() is None or self._peek()[0] != LBRACE:
+                raise LowConfidence(f"\\{name} 缺少参数")
+            return self._parse_group()
+        if name == ABS_COMMAND:
+            start = self.pos
+            content = self._parse_group()
+            # |x+1| 读作「x加1的绝对值」无法表达分组
+            if any(
+                (kind == SYMBOL and value in OPERATOR_SYMBOLS) or (kind == CMD and value in OPERATOR_COMMANDS)
+                for kind, value in self.tokens[start:self.pos]
+            ):
+                raise LowConfidence("绝对值内含运算")
+            return f"{content}的绝对值"
+        if name in IGNORED_COMMANDS:
+            return ""
+        if name in GREEK_LETTERS:
+            return GREEK_LETTERS[name]
+        if name in ATOM_COMMANDS:
+            return ATOM_COMMANDS[name]
+        if name == "%":
+            raise LowConfidence("百分号需要调整语序")
+        # \int、\sum、\lim、\log、\begin 等结构交给 LLM
+        raise LowConfidence(f"未支持的命令: \\{name}")
+
+
+def _is_single_atom(tokens: List[Tuple[str, str]]) -> bool:
+    """tokens 是否恰好构成一个原子（可带上下标），如 x、x^2、\\sqrt{a}"""
+    parser = _Parser(tokens)
+    try:
+        parser._parse_postfix()
+    except LowConfidence:
+        return False
+    return parser.pos == len(tokens)
+
+
+def _join(pieces: List[str]) -> str:
+    """拼接读法片段，相邻的英文字母之间保留空格以免连读"""
+    result = ""
+    for piece in pieces:
+        if not piece:
+            continue
+        if result and result[-1].isascii() and result[-1].isalpha() and piece[0].isascii() and piece[0].isalpha():
+            result += " "
+        result += piece
+    return result
@@ -0,0 +1,289 @@
+"""LLM 全局限流器（令牌桶 + AIMD 自适应并发 + 抖动重试）"""
+import asyncio
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Optional
+from config import (
+    LLM_RPM_LIMIT,
+    LLM_TPM_LIMIT,
+    LLM_MAX_CONCURRENCY,
+    LLM_MIN_CONCURRENCY,
+    LLM_INITIAL_CONCURRENCY,
+    LLM_LATENCY_TARGET,
+    LLM_MAX_RETRIES,
+    LLM_RETRY_BASE_DELAY,
+    LLM_RETRY_MAX_DELAY,
+    LLM_ESTIMATED_OUTPUT_TOKENS,
+)
+from utils.deadline import DeadlineExceeded, remaining_time, wait_with_deadline
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算文本 token 数（中文按 1 字 1 token，其余按 4 字符 1 token）"""
+    cjk_count = sum(1 for ch in text if '一' <= ch <= '鿿')
+    return max(1, cjk_count + (len(text) - cjk_count) // 4)
+
+
+def estimate_messages_tokens(messages: list) -> int:
+    """估算消息列表的输入 token 数"""
+    total = 0
+    for message in messages:
+        content = getattr(message, "content", message)
+        total += estimate_tokens(content if isinstance(content, str) else str(content))
+    return total
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """判断是否为限流错误（HTTP 429）"""
+    if getattr(error, "status_code", None) == 429:
+        return True
+    return type(error).__name__ == "RateLimitError"
+
+
+def is_retryable_error(error: BaseException) -> bool:
+    """判断是否为可重试错误（限流、超时、连接错误、5xx；任务自身截止时间已到不重试）"""
+    if isinstance(error, DeadlineExceeded):
+        return False
+    if is_rate_limit_error(error):
+        return True
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    if type(error).__name__ in ("APITimeoutError", "APIConnectionError", "InternalServerError"):
+        return True
+    status_code = getattr(error, "status_code", None)
+    return isinstance(status_code, int) and status_code >= 500
+
+
+def get_retry_after(error: BaseException) -> Optional[float]:
+    """从错误响应头中读取 Retry-After（秒）"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        value = headers.get("retry-after")
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """令牌桶（按分钟配额匀速补充，允许短暂透支以便事后按实际用量修正）"""
+
+    def __init__(self, per_minute: int):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self, amount: float) -> None:
+        """获取指定数量的令牌，不足时等待"""
+        # 单次请求超过桶容量时按容量计，避免永久等待
+        amount = min(float(amount), self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def adjust(self, delta: float) -> None:
+        """按实际用量修正（delta > 0 表示补扣，< 0 表示退还）"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - delta)
+
+
+class LLMRateLimiter:
+    """
+    所有 Agent 共享的 LLM 调用限流器
+
+    - 令牌桶：同时限制每分钟请求数（RPM）和每分钟 token 数（TPM），0 表示不限制
+    - AIMD 并发控制：成功且延迟正常时并发上限加性增长，遇到 429/超时时乘性减半
+    - 抖动重试：可重试错误按指数退避 + 全抖动重试，优先遵循 Retry-After
+    """
+
+    def __init__(
+        self,
+        rpm: int = LLM_RPM_LIMIT,
+        tpm: int = LLM_TPM_LIMIT,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        min_concurrency: int = LLM_MIN_CONCURRENCY,
+        initial_concurrency: int = LLM_INITIAL_CONCURRENCY,
+        latency_target: float = LLM_LATENCY_TARGET,
+        max_retries: int = LLM_MAX_RETRIES,
+        base_delay: float = LLM_RETRY_BASE_DELAY,
+        max_delay: float = LLM_RETRY_MAX_DELAY
+    ):
+        self.request_bucket = TokenBucket(rpm) if rpm > 0 else None
+        self.token_bucket = TokenBucket(tpm) if tpm > 0 else None
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.concurrency_limit = float(
+            min(self.max_concurrency, max(self.min_concurrency, initial_concurrency))
+        )
+        self.latency_target = latency_target
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.in_flight = 0
+        self._condition = asyncio.Condition()
+        # 同一波拥塞只减一次，避免并发请求同时失败时把上限压到最低
+        self._last_decrease_at = -1.0
+
+    @property
+    def current_limit(self) -> int:
+        """当前生效的并发上限"""
+        return max(self.min_concurrency, int(self.concurrency_limit))
+
+    def _on_success(self, latency: float) -> None:
+        """加性增长：每完成约 limit 个正常请求，上限 +1"""
+        if self.latency_target > 0 and latency > self.latency_target:
+            logger.debug(f"LLM 延迟 {latency:.1f}s 超过目标 {self.latency_target:.1f}s，保持并发上限")
+            return
+        self.concurrency_limit = min(
+            float(self.max_concurrency),
+            self.concurrency_limit + 1.0 / self.concurrency_limit
+        )
+
+    def _on_congestion(self, reason: str, started_at: float) -> None:
+        """乘性减小：并发上限减半（上次减小之前发出的请求不再重复触发）"""
+        if started_at <= self._last_decrease_at:
+            return
+        self._last_decrease_at = time.monotonic()
+        old_limit = self.current_limit
+        self.concurrency_limit = max(float(self.min_concurrency), self.concurrency_limit / 2)
+        logger.warning(f"LLM 拥塞（{reason}），并发上限 {old_limit} -> {self.current_limit}")
+
+    @asynccontextmanager
+    async def slot(self, estimated_tokens: int):
+        """
+        占用一个调用名额（并发 + RPM + TPM），退出时根据结果调整并发上限
+
+        Yields:
+            dict: 调用方可写入 "actual_tokens" 以修正 TPM 用量
+        """
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < self.current_limit)
+            self.in_flight += 1
+
+        usage: dict = {"actual_tokens": None}
+        started_at = time.monotonic()
+        try:
+            if self.request_bucket:
+                await self.request_bucket.acquire(1)
+            if self.token_bucket:
+                await self.token_bucket.acquire(estimated_tokens)
+            started_at = time.monotonic()
+            yield usage
+        except BaseException as e:
+            # 任务自身的截止时间到了不代表服务端拥塞，不降低所有任务共享的并发上限
+            if isinstance(e, DeadlineExceeded):
+                pass
+            elif is_rate_limit_error(e):
+                self._on_congestion("429", started_at)
+            elif isinstance(e, Exception) and is_retryable_error(e):
+                self._on_congestion(type(e).__name__, started_at)
+            raise
+        else:
+            self._on_success(time.monotonic() - started_at)
+            if self.token_bucket and usage["actual_tokens"] is not None:
+                self.token_bucket.adjust(usage["actual_tokens"] - estimated_tokens)
+        finally:
+            async with self._condition:
+                self.in_flight -= 1
+                self._condition.notify_all()
+
+    def _backoff_delay(self, attempt: int, error: BaseException) -> float:
+        """计算重试等待时间（指数退避 + 全抖动，Retry-After 优先）"""
+        retry_after = get_retry_after(error)
+        if retry_after is not None:
+            return min(self.max_delay, retry_after) + random.uniform(0, self.base_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    @staticmethod
+    def _can_retry_within_deadline(delay: float) -> bool:
+        """等待 delay 秒后是否还在任务截止时间之内"""
+        remaining = remaining_time()
+        return remaining is None or remaining > delay
+
+    async def ainvoke(self, llm: Any, messages: list, estimated_output_tokens: int = LLM_ESTIMATED_OUTPUT_TOKENS):
+        """通过限流器调用 llm.ainvoke，可重试错误自动重试"""
+        estimated_tokens = estimate_messages_tokens(messages) + estimated_output_tokens
+        attempt = 0
+        while True:
+            try:
+                async with self.slot(estimated_tokens) as usage:
+                    response = await wait_with_deadline(llm.ainvoke(messages), "LLM 调用")
+                    usage_metadata = getattr(response, "usage_metadata", None)
+                    if usage_metadata and usage_metadata.get("total_tokens"):
+                        usage["actual_tokens"] = usage_metadata["total_tokens"]
+                    return response
+            except Exception as e:
+                if not is_retryable_error(e) or attempt >= self.max_retries:
+                    raise
+                delay = self._backoff_delay(attempt, e)
+                if not self._can_retry_within_deadline(delay):
+                    raise
+                attempt += 1
+                logger.warning(
+                    f"LLM 调用失败（{type(e).__name__}），{delay:.1f}s 后重试 "
+                    f"(第 {attempt}/{self.max_retries} 次)"
+                )
+                await asyncio.sleep(delay)
+
+    async def astream(self, llm: Any, messages: list, estimated_output_tokens: int = LLM_ESTIMATED_OUTPUT_TOKENS):
+        """
+        通过限流器调用 llm.astream，逐块产出
+
+        只有在收到第一个分块之前发生的可重试错误才会自动重试，
+        已经开始输出后出错则直接抛出（调用方已消费了部分内容）。
+        """
+        input_tokens = estimate_messages_tokens(messages)
+        estimated_tokens = input_tokens + estimated_output_tokens
+        attempt = 0
+        while True:
+            received = False
+            try:
+                async with self.slot(estimated_tokens) as usage:
+                    output_text = []
+                    async for chunk in llm.astream(messages):
+                        received = True
+                        if isinstance(chunk.content, str):
+                            output_text.append(chunk.content)
+                        yield chunk
+                    usage["actual_tokens"] = input_tokens + estimate_tokens("".join(output_text))
+                    return
+            except Exception as e:
+                if received or not is_retryable_error(e) or attempt >= self.max_retries:
+                    raise
+                delay = self._backoff_delay(attempt, e)
+                if not self._can_retry_within_deadline(delay):
+                    raise
+                attempt += 1
+                logger.warning(
+                    f"LLM 流式调用失败（{type(e).__name__}），{delay:.1f}s 后重试 "
+                    f"(第 {attempt}/{self.max_retries} 次)"
+                )
+                await asyncio.sleep(delay)
+
+
+_rate_limiter: Optional[LLMRateLimiter] = None
+
+
+def get_rate_limiter() -> LLMRateLimiter:
+    """获取进程内共享的 LLM 限流器"""
+    global _rate_limiter
+    if _rate_limiter is None:
+        _rate_limiter = LLMRateLimiter()
+    return _rate_limiter
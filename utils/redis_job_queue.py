@@ -0,0 +1,289 @@
+"""Redis 任务队列（多机共享，接口与 JobQueue 一致）"""
+import json
+import time
+from typing import Any, Dict, List, Optional
+from config import JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS
+from utils.job_queue import JOB_STATES
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 键布局（prefix 默认为 formula2video:jobs）：
+#   {prefix}:job:{task_id}   任务哈希（params、state、stage、attempts、worker_id、lease_expires 等）
+#   {prefix}:pending         等待领取的任务ID列表
+#   {prefix}:leases          执行中任务的租约到期时间（有序集合）
+#   {prefix}:state:{state}   各状态的任务ID集合（用于统计）
+#   {prefix}:all             全部任务ID，按加入顺序排序（有序集合）
+#   {prefix}:seq             加入顺序计数器
+# 所有状态变更都在 Lua 脚本中原子执行，多个工作进程同时领取也不会重复
+
+_LUA_HELPERS = """
+local prefix = ARGV[1]
+local function job_key(task_id) return prefix .. ':job:' .. task_id end
+local function move_state(task_id, old, new)
+    redis.call('SMOVE', prefix .. ':state:' .. old, prefix .. ':state:' .. new, task_id)
+end
+local function owns(task_id, worker_id)
+    local key = job_key(task_id)
+    return redis.call('HGET', key, 'state') == 'running' and redis.call('HGET', key, 'worker_id') == worker_id
+end
+"""
+
+# ARGV: prefix, now, task_id1, params1, task_id2, params2, ...
+_ENQUEUE = _LUA_HELPERS + """
+local now = ARGV[2]
+local added = 0
+for i = 3, #ARGV, 2 do
+    local task_id, params = ARGV[i], ARGV[i + 1]
+    local key = job_key(task_id)
+    if redis.call('EXISTS', key) == 0 then
+        local seq = redis.call('INCR', prefix .. ':seq')
+        redis.call('HSET', key, 'id', seq, 'task_id', task_id, 'params', params, 'state', 'pending',
+            'attempts', 0, 'created_at', now, 'updated_at', now)
+        redis.call('ZADD', prefix .. ':all', seq, task_id)
+        redis.call('RPUSH', prefix .. ':pending', task_id)
+        redis.call('SADD', prefix .. ':state:pending', task_id)
+        added = added + 1
+    end
+end
+return added
+"""
+
+# ARGV: prefix, worker_id, now, lease_seconds, max_attempts, expired_error
+_CLAIM = _LUA_HELPERS + """
+local worker_id, now = ARGV[2], tonumber(ARGV[3])
+local lease_seconds, max_attempts = tonumber(ARGV[4]), tonumber(ARGV[5])
+-- 租约过期的任务：未用完尝试次数的放回队首优先重试，否则标记为失败
+local expired = redis.call('ZRANGEBYSCORE', prefix .. ':leases', '-inf', now)
+for _, task_id in ipairs(expired) do
+    local key = job_key(task_id)
+    redis.call('ZREM', prefix .. ':leases', task_id)
+    redis.call('HDEL', key, 'worker_id', 'lease_expires')
+    if tonumber(redis.call('HGET', key, 'attempts')) >= max_attempts then
+        redis.call('HSET', key, 'state', 'failed', 'error', ARGV[6], 'updated_at', now)
+        move_state(task_id, 'running', 'failed')
+    else
+        redis.call('HSET', key, 'state', 'pending', 'updated_at', now)
+        move_state(task_id, 'running', 'pending')
+        redis.call('LPUSH', prefix .. ':pending', task_id)
+    end
+end
+local task_id = redis.call('LPOP', prefix .. ':pending')
+if not task_id then
+    return false
+end
+local key = job_key(task_id)
+redis.call('HINCRBY', key, 'attempts', 1)
+redis.call('HDEL', key, 'stage', 'stage_name')
+redis.call('HSET', key, 'state', 'running', 'worker_id', worker_id,
+    'lease_expires', now + lease_seconds, 'updated_at', now)
+redis.call('ZADD', prefix .. ':leases', now + lease_seconds, task_id)
+move_state(task_id, 'pending', 'running')
+return redis.call('HGETALL', key)
+"""
+
+# ARGV: prefix, task_id, worker_id, now, lease_seconds, stage, stage_name
+_HEARTBEAT = _LUA_HELPERS + """
+local task_id, worker_id, now = ARGV[2], ARGV[3], tonumber(ARGV[4])
+if not owns(task_id, worker_id) then
+    return 0
+end
+local key = job_key(task_id)
+local lease_expires = now + tonumber(ARGV[5])
+redis.call('HSET', key, 'lease_expires', lease_expires, 'updated_at', now)
+if ARGV[6] ~= '' then
+    redis.call('HSET', key, 'stage', ARGV[6], 'stage_name', ARGV[7])
+end
+redis.call('ZADD', prefix .. ':leases', lease_expires, task_id)
+return 1
+"""
+
+# ARGV: prefix, task_id, worker_id, now, result
+_COMPLETE = _LUA_HELPERS + """
+local task_id, worker_id = ARGV[2], ARGV[3]
+if not owns(task_id, worker_id) then
+    return 0
+end
+local key = job_key(task_id)
+redis.call('HSET', key, 'state', 'done', 'result', ARGV[5], 'updated_at', ARGV[4])
+redis.call('HDEL', key, 'error', 'lease_expires')
+redis.call('ZREM', prefix .. ':leases', task_id)
+move_state(task_id, 'running', 'done')
+return 1
+"""
+
+# ARGV: prefix, task_id, worker_id, now, error, max_attempts
+_FAIL = _LUA_HELPERS + """
+local task_id, worker_id = ARGV[2], ARGV[3]
+if not owns(task_id, worker_id) then
+    return false
+end
+local key = job_key(task_id)
+local state = 'pending'
+if tonumber(redis.call('HGET', key, 'attempts')) >= tonumber(ARGV[6]) then
+    state = 'failed'
+end
+redis.call('HSET', key, 'state', state, 'error', ARGV[5], 'updated_at', ARGV[4])
+redis.call('HDEL', key, 'worker_id', 'lease_expires')
+redis.call('ZREM', prefix .. ':leases', task_id)
+move_state(task_id, 'running', state)
+if state == 'pending' then
+    redis.call('RPUSH', prefix .. ':pending', task_id)
+end
+return state
+"""
+
+# ARGV: prefix, now
+_RETRY_FAILED = _LUA_HELPERS + """
+local failed = redis.call('SMEMBERS', prefix .. ':state:failed')
+for _, task_id in ipairs(failed) do
+    redis.call('HSET', job_key(task_id), 'state', 'pending', 'attempts', 0, 'updated_at', ARGV[2])
+    move_state(task_id, 'failed', 'pending')
+    redis.call('RPUSH', prefix .. ':pending', task_id)
+end
+return #failed
+"""
+
+
+class RedisJobQueue:
+    """
+    基于 Redis 的共享任务队列
+
+    语义与 JobQueue（SQLite）完全一致：领取时获得租约，执行期间心跳续约，
+    租约到期的任务被重新领取，超过最大尝试次数后标记为 failed。
+    适合多台机器共用一个队列；任何支持 Lua 脚本的 Redis 兼容服务都可以使用。
+    """
+
+    def __init__(
+        self,
+        url: str,
+        lease_seconds: float = JOB_LEASE_SECONDS,
+        max_attempts: int = JOB_MAX_ATTEMPTS,
+        prefix: str = "formula2video:jobs"
+    ):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("使用 Redis 任务队列需要安装 redis 包: uv pip install redis") from e
+        self.url = url
+        # 与 JobQueue.db_path 对应，用于日志和状态输出
+        self.db_path = url
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url, decode_responses=True)
+        self._scripts = {
+            name: self._client.register_script(source)
+            for name, source in (
+                ("enqueue", _ENQUEUE),
+                ("claim", _CLAIM),
+                ("heartbeat", _HEARTBEAT),
+                ("complete", _COMPLETE),
+                ("fail", _FAIL),
+                ("retry_failed", _RETRY_FAILED),
+            )
+        }
+
+    def _run(self, name: str, *args: Any) -> Any:
+        """执行 Lua 脚本（第一个参数固定为键前缀）"""
+        return self._scripts[name](args=[self.prefix, *args])
+
+    def enqueue(self, task_id: str, params: Dict[str, Any]) -> bool:
+        """加入一个任务，相同 task_id 的任务已存在时返回 False"""
+        return self.enqueue_many([(task_id, params)]) == 1
+
+    def enqueue_many(self, tasks: List[tuple[str, Dict[str, Any]]], batch_size: int = 500) -> int:
+        """批量加入任务，已存在的 task_id 会被忽略，返回新加入的数量"""
+        added = 0
+        for start in range(0, len(tasks), batch_size):
+            args: List[Any] = [time.time()]
+            for task_id, params in tasks[start:start + batch_size]:
+                args += [task_id, json.dumps(params, ensure_ascii=False)]
+            added += int(self._run("enqueue", *args))
+        return added
+
+    def claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """领取一个任务（租约过期的任务会先被放回队列），没有可领取的任务时返回 None"""
+        fields = self._run(
+            "claim", worker_id, time.time(), self.lease_seconds, self.max_attempts,
+            "租约过期（工作进程可能已崩溃），已达最大尝试次数"
+        )
+        if not fields:
+            return None
+        return self._to_job(dict(zip(fields[::2], fields[1::2])))
+
+    def heartbeat(
+        self,
+        task_id: str,
+        worker_id: str,
+        stage: Optional[int] = None,
+        stage_name: Optional[str] = None
+    ) -> bool:
+        """续约，并可同时更新当前步骤；租约已被其他工作进程接管时返回 False"""
+        stage_arg = "" if stage is None else stage
+        return bool(self._run(
+            "heartbeat", task_id, worker_id, time.time(), self.lease_seconds, stage_arg, stage_name or ""
+        ))
+
+    def complete(self, task_id: str, worker_id: str, result: Dict[str, Any]) -> bool:
+        """标记任务完成并保存结果"""
+        return bool(self._run("complete", task_id, worker_id, time.time(), json.dumps(result, ensure_ascii=False)))
+
+    def fail(self, task_id: str, worker_id: str, error: str) -> Optional[str]:
+        """记录一次失败，返回任务的新状态（pending / failed），租约已被接管时返回 None"""
+        return self._run("fail", task_id, worker_id, time.time(), error, self.max_attempts) or None
+
+    def retry_failed(self) -> int:
+        """把所有 failed 任务放回等待队列并清零尝试次数，返回数量"""
+        return int(self._run("retry_failed", time.time()))
+
+    def stats(self) -> Dict[str, int]:
+        """各状态的任务数"""
+        pipe = self._client.pipeline()
+        for state in JOB_STATES:
+            pipe.scard(f"{self.prefix}:state:{state}")
+        return dict(zip(JOB_STATES, pipe.execute()))
+
+    def has_active_jobs(self) -> bool:
+        """是否还有等待中或执行中的任务"""
+        stats = self.stats()
+        return stats["pending"] + stats["running"] > 0
+
+    def list_jobs(self, state: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """列出任务（按加入顺序），state 为空时列出全部"""
+        if state:
+            task_ids = list(self._client.smembers(f"{self.prefix}:state:{state}"))
+            pipe = self._client.pipeline()
+            for task_id in task_ids:
+                pipe.zscore(f"{self.prefix}:all", task_id)
+            order = dict(zip(task_ids, pipe.execute()))
+            task_ids = sorted(task_ids, key=lambda task_id: order[task_id] or 0)[:limit]
+        else:
+            task_ids = self._client.zrange(f"{self.prefix}:all", 0, limit - 1)
+        pipe = self._client.pipeline()
+        for task_id in task_ids:
+            pipe.hgetall(f"{self.prefix}:job:{task_id}")
+        return [self._to_job(fields) for fields in pipe.execute() if fields]
+
+    @staticmethod
+    def _to_job(fields: Dict[str, str]) -> Dict[str, Any]:
+        """Redis 哈希转为与 JobQueue 相同结构的任务字典"""
+        def optional(name: str, cast):
+            value = fields.get(name)
+            return cast(value) if value not in (None, "") else None
+
+        return {
+            "id": optional("id", int),
+            "task_id": fields["task_id"],
+            "params": json.loads(fields["params"]),
+            "state": fields["state"],
+            "stage": optional("stage", int),
+            "stage_name": fields.get("stage_name"),
+            "attempts": int(fields.get("attempts", 0)),
+            "worker_id": fields.get("worker_id"),
+            "lease_expires": optional("lease_expires", float),
+            "result": optional("result", json.loads),
+            "error": fields.get("error"),
+            "created_at": optional("created_at", float),
+            "updated_at": optional("updated_at", float),
+        }
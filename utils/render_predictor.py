@@ -0,0 +1,285 @@
+"""渲染耗时预测（基于历史记录的最小二乘回归）与批量任务调度（最短作业优先 / 截止时间感知）"""
+import os
+import ast
+import heapq
+import math
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+from config import RENDER_HISTORY_PATH, RENDER_PREDICTOR_MIN_SAMPLES, MANIM_QUALITY
+from utils.file_utils import append_jsonl, load_jsonl
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+SCHEDULING_POLICIES = ("fifo", "sjf", "deadline")
+
+# 预测目标：Manim 渲染（含修复重试）、切割合并打包、整个任务
+PREDICTION_TARGETS = ("render_seconds", "encode_seconds", "total_seconds")
+
+# 各画质相对 medium_quality（720p30）的像素吞吐量
+_MEDIUM_PIXEL_RATE = 1280 * 720 * 30
+QUALITY_WEIGHTS = {
+    "low_quality": 854 * 480 * 15 / _MEDIUM_PIXEL_RATE,
+    "medium_quality": 1.0,
+    "high_quality": 1920 * 1080 * 60 / _MEDIUM_PIXEL_RATE,
+    "production_quality": 2560 * 1440 * 60 / _MEDIUM_PIXEL_RATE,
+    "fourk_quality": 3840 * 2160 * 60 / _MEDIUM_PIXEL_RATE,
+}
+
+# 历史记录不足时的经验系数，与 _design_row 的各列一一对应：
+# [常数, 音频时长×画质, play 调用数×画质, MathTex 数, 片段数, 音频时长×多码率, 片尾]
+_FALLBACK_COEFFICIENTS = {
+    "render_seconds": [10.0, 1.5, 0.5, 0.2, 0.0, 0.0, 0.0],
+    "encode_seconds": [5.0, 0.3, 0.0, 0.0, 0.5, 0.3, 5.0],
+    "total_seconds": [60.0, 1.8, 0.5, 0.2, 3.5, 0.3, 5.0],
+}
+
+# 历史记录不足时补全特征使用的比例（每秒音频的片段数、play 调用数、MathTex 数）
+_FALLBACK_RATIOS = {
+    "audio_per_target": 1.0,
+    "segments": 1 / 12,
+    "play_calls": 1 / 3,
+    "mathtex_count": 1 / 6,
+}
+
+# 岭回归正则系数，避免样本少或特征共线时系数发散
+_RIDGE = 1e-3
+
+
+def extract_code_features(code: str) -> Dict[str, int]:
+    """
+    统计 Manim 代码中影响渲染耗时的结构
+
+    Returns:
+        {"play_calls": self.play 调用数, "mathtex_count": MathTex / Tex 对象数}，代码无法解析时均为 0
+    """
+    counts = {"play_calls": 0, "mathtex_count": 0}
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return counts
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Call):
+            continue
+        func = node.func
+        if (
+            isinstance(func, ast.Attribute) and func.attr == "play"
+            and isinstance(func.value, ast.Name) and func.value.id == "self"
+        ):
+            counts["play_calls"] += 1
+        name = func.attr if isinstance(func, ast.Attribute) else getattr(func, "id", None)
+        if name in ("MathTex", "Tex"):
+            counts["mathtex_count"] += 1
+    return counts
+
+
+def _design_row(features: Dict[str, Any]) -> List[float]:
+    """特征字典转换为回归的自变量（渲染量按画质的像素吞吐量加权）"""
+    weight = QUALITY_WEIGHTS.get(features.get("quality") or MANIM_QUALITY, 1.0)
+    audio = float(features["audio_duration"])
+    return [
+        1.0,
+        audio * weight,
+        float(features["play_calls"]) * weight,
+        float(features["mathtex_count"]),
+        float(features["segments"]),
+        audio if features.get("package") else 0.0,
+        1.0 if features.get("ending") else 0.0,
+    ]
+
+
+def _solve_least_squares(rows: List[List[float]], targets: List[float]) -> List[float]:
+    """岭回归最小二乘：求解 (XᵀX + λI)β = Xᵀy（高斯消元，特征数很少，无需 numpy）"""
+    size = len(rows[0])
+    matrix = [[0.0] * size for _ in range(size)]
+    vector = [0.0] * size
+    for row, target in zip(rows, targets):
+        for i in range(size):
+            vector[i] += row[i] * target
+            for j in range(size):
+                matrix[i][j] += row[i] * row[j]
+    for i in range(size):
+        matrix[i][i] += _RIDGE * max(matrix[i][i], 1.0)
+
+    for col in range(size):
+        pivot = max(range(col, size), key=lambda r: abs(matrix[r][col]))
+        matrix[col], matrix[pivot] = matrix[pivot], matrix[col]
+        vector[col], vector[pivot] = vector[pivot], vector[col]
+        for r in range(col + 1, size):
+            factor = matrix[r][col] / matrix[col][col]
+            for c in range(col, size):
+                matrix[r][c] -= factor * matrix[col][c]
+            vector[r] -= factor * vector[col]
+    solution = [0.0] * size
+    for i in reversed(range(size)):
+        solution[i] = (vector[i] - sum(matrix[i][j] * solution[j] for j in range(i + 1, size))) / matrix[i][i]
+    return solution
+
+
+class RenderTimePredictor:
+    """
+    渲染和编码耗时预测器
+
+    每个任务完成后记录一条历史（特征 + 各阶段实际耗时），预测时用历史数据做线性回归；
+    历史记录不足 min_samples 条时使用经验系数。执行前只知道目标时长等参数时，
+    片段数、音频时长、play 调用数等特征按历史中的平均比例补全。
+    """
+
+    def __init__(
+        self,
+        history_path: str = RENDER_HISTORY_PATH,
+        min_samples: int = RENDER_PREDICTOR_MIN_SAMPLES
+    ):
+        self.history_path = history_path
+        self.min_samples = min_samples
+        self.sample_count = 0
+        self._models: Dict[str, List[float]] = dict(_FALLBACK_COEFFICIENTS)
+        self._ratios: Dict[str, float] = dict(_FALLBACK_RATIOS)
+        self._loaded_mtime: Optional[float] = None
+
+    def record(self, features: Dict[str, Any], timings: Dict[str, float]) -> None:
+        """追加一条历史记录（写入失败只记录警告，不影响任务）"""
+        try:
+            append_jsonl({**features, **timings, "recorded_at": time.time()}, self.history_path)
+        except OSError as e:
+            logger.warning(f"写入渲染耗时历史失败: {e}")
+
+    def _refresh(self) -> None:
+        """历史文件有变化时重新拟合"""
+        try:
+            mtime = os.path.getmtime(self.history_path)
+        except OSError:
+            return
+        if mtime == self._loaded_mtime:
+            return
+        self._loaded_mtime = mtime
+
+        samples = [
+            record for record in load_jsonl(self.history_path)
+            if all(isinstance(record.get(key), (int, float)) for key in (
+                "audio_duration", "segments", "play_calls", "mathtex_count", *PREDICTION_TARGETS
+            ))
+        ]
+        self.sample_count = len(samples)
+        if self.sample_count < self.min_samples:
+            return
+
+        rows = [_design_row(sample) for sample in samples]
+        self._models = {
+            target: _solve_least_squares(rows, [float(sample[target]) for sample in samples])
+            for target in PREDICTION_TARGETS
+        }
+        total_audio = sum(sample["audio_duration"] for sample in samples) or 1.0
+        total_target = sum(sample.get("target_duration") or sample["audio_duration"] for sample in samples) or 1.0
+        self._ratios = {
+            "audio_per_target": total_audio / total_target,
+            "segments": sum(sample["segments"] for sample in samples) / total_audio,
+            "play_calls": sum(sample["play_calls"] for sample in samples) / total_audio,
+            "mathtex_count": sum(sample["mathtex_count"] for sample in samples) / total_audio,
+        }
+        logger.info(f"渲染耗时预测器已根据 {self.sample_count} 条历史记录重新拟合")
+
+    def complete_features(self, features: Dict[str, Any]) -> Dict[str, Any]:
+        """补全缺失的特征（执行前只有目标时长时，按历史平均比例估算音频时长、片段数等）"""
+        self._refresh()
+        completed = dict(features)
+        completed.setdefault("quality", MANIM_QUALITY)
+        if completed.get("audio_duration") is None:
+            completed["audio_duration"] = float(completed.get("target_duration") or 60) * self._ratios["audio_per_target"]
+        for key in ("segments", "play_calls", "mathtex_count"):
+            if completed.get(key) is None:
+                completed[key] = completed["audio_duration"] * self._ratios[key]
+        return completed
+
+    def predict(self, features: Dict[str, Any]) -> Dict[str, float]:
+        """
+        预测各阶段耗时（秒）
+
+        Args:
+            features: 至少包含 target_duration 或 audio_duration，其余特征缺失时自动补全
+
+        Returns:
+            {"render_seconds": ..., "encode_seconds": ..., "total_seconds": ...}
+        """
+        row = _design_row(self.complete_features(features))
+        prediction = {
+            target: max(1.0, sum(c * x for c, x in zip(self._models[target], row)))
+            for target in PREDICTION_TARGETS
+        }
+        # 线性模型的各目标分别拟合，保证总耗时不小于渲染与编码之和
+        prediction["total_seconds"] = max(
+            prediction["total_seconds"], prediction["render_seconds"] + prediction["encode_seconds"]
+        )
+        return prediction
+
+
+def parse_deadline(value: Any) -> Optional[float]:
+    """
+    解析任务截止时间
+
+    Args:
+        value: Unix 时间戳（数字）或 ISO 8601 字符串（如 "2025-06-01T18:00:00"），None 表示没有截止时间
+
+    Returns:
+        Unix 时间戳
+    """
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value).timestamp()
+        except ValueError:
+            pass
+    raise ValueError(f"无效的截止时间: {value!r}（应为 Unix 时间戳或 ISO 8601 字符串）")
+
+
+def plan_schedule(
+    estimates: Sequence[float],
+    deadlines: Sequence[Optional[float]],
+    policy: str = "fifo",
+    max_concurrent: int = 1,
+    now: Optional[float] = None
+) -> List[Dict[str, Any]]:
+    """
+    确定执行顺序，并按 max_concurrent 个并发槽位模拟执行，估算每个任务的完成时间
+
+    Args:
+        estimates: 各任务的预计耗时（秒）
+        deadlines: 各任务的截止时间（Unix 时间戳，None 表示没有）
+        policy: fifo（提交顺序）, sjf（预计耗时短的优先）, deadline（截止时间余量小的优先，没有截止时间的按耗时排在最后）
+
+    Returns:
+        按执行顺序排列的计划：[{"index", "estimate", "start", "eta", "deadline", "late"}, ...]
+    """
+    if policy not in SCHEDULING_POLICIES:
+        raise ValueError(f"不支持的调度策略: {policy}，可选: {', '.join(SCHEDULING_POLICIES)}")
+    now = time.time() if now is None else now
+    order = list(range(len(estimates)))
+    if policy == "sjf":
+        order.sort(key=lambda i: estimates[i])
+    elif policy == "deadline":
+        order.sort(key=lambda i: (
+            deadlines[i] - estimates[i] if deadlines[i] is not None else math.inf,
+            estimates[i]
+        ))
+
+    # 各槽位空闲的时刻；任务依次占用最早空闲的槽位（与信号量按顺序放行一致）
+    slots = [now] * max(1, max_concurrent)
+    plan = []
+    for index in order:
+        start = heapq.heappop(slots)
+        eta = start + estimates[index]
+        heapq.heappush(slots, eta)
+        deadline = deadlines[index]
+        plan.append({
+            "index": index,
+            "estimate": estimates[index],
+            "start": start,
+            "eta": eta,
+            "deadline": deadline,
+            "late": deadline is not None and eta > deadline,
+        })
+    return plan
@@ -0,0 +1,89 @@
+"""执行中任务合并（相同请求只计算一次，结果分发给所有请求方）与按键互斥锁"""
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class TaskCoalescer:
+    """
+    合并执行中的相同任务
+
+    同一个键的任务正在执行时，后来的请求不再重复计算，而是等待同一个结果；
+    任务结束后键即释放，之后的相同请求会重新执行（可复用磁盘上已生成的文件）。
+    执行的请求方被取消时，取消只影响它自己，仍在等待的请求方由其中一个重新执行。
+    另外为每个锁键提供互斥锁：参数不同但共用同一个锁键（如相同任务ID、相同临时目录）的任务依次执行，
+    不会互相覆盖中间文件。
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._lock_users: Dict[str, int] = {}
+
+    @asynccontextmanager
+    async def lock(self, key: str) -> AsyncIterator[None]:
+        """按键互斥；没有使用者时自动清理锁对象"""
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._lock_users[key] = self._lock_users.get(key, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._lock_users[key] -= 1
+            if self._lock_users[key] == 0:
+                del self._lock_users[key]
+                del self._locks[key]
+
+    def is_inflight(self, key: str) -> bool:
+        """该键的任务是否正在执行"""
+        return key in self._inflight
+
+    async def run(
+        self,
+        key: str,
+        factory: Callable[[], Awaitable[Any]],
+        lock_key: Optional[str] = None
+    ) -> Any:
+        """
+        执行任务，相同键的任务正在执行时直接等待其结果
+
+        Args:
+            key: 合并键（应包含所有影响结果的参数）
+            factory: 创建任务协程的函数，只有第一个请求方会调用
+            lock_key: 互斥锁键，默认与 key 相同
+
+        Returns:
+            任务结果（所有请求方拿到同一个对象，修改前请先复制）
+        """
+        while (future := self._inflight.get(key)) is not None:
+            logger.info(f"相同任务正在执行，等待其结果: {key}")
+            try:
+                # shield：某个等待方被取消时不影响共享的计算
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # 自己被取消时照常抛出；执行方被取消时（共享结果被取消）重新执行或等待新的执行方
+                if not future.cancelled() or asyncio.current_task().cancelling():
+                    raise
+                logger.info(f"相同任务的执行方已被取消，重新执行: {key}")
+
+        future = asyncio.get_running_loop().create_future()
+        # 没有其他等待方时也标记异常已读取，避免 "exception was never retrieved" 警告
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = future
+        try:
+            async with self.lock(lock_key or key):
+                result = await factory()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._inflight[key]
@@ -1,7 +1,10 @@
 """数据验证工具（含 LaTeX 验证）"""
 import re
 import ast
-from typing import List, Tuple
+import codeop
+import warnings
+from typing import List, Optional, Tuple
+from utils.latex_speech import MATH_REGION_PATTERN
 
 
 class LaTeXValidator:
@@ -82,3 +85,167 @@ class LaTeXValidator:
                 errors.append(f"公式 {key}: {error_msg}")
         
         return len(errors) == 0, errors
+
+
+class StreamingCodeValidator:
+    """
+    流式 Manim 代码增量校验器
+
+    随 LLM 输出逐块喂入文本，提取 ```python 代码块中已到达的部分，
+    并尽早发现明显跑偏的输出（错误的导入、多个 Scene 类、缺少 AUDIO_DURATIONS、语法错误），
+    以便调用方提前中止并重试，而不是等完整响应结束后才发现。
+    """
+    
+    # 3B1B 原版 manimgl/manimlib 的导入
+    FORBIDDEN_IMPORT_PATTERN = re.compile(
+        r'^\s*(?:from|import)\s+(manimlib|manimgl|manim_imports_ext|big_ol_pile_of_manim_imports)\b',
+        re.MULTILINE
+    )
+    SCENE_CLASS_PATTERN = re.compile(r'^class\s+(\w+)\s*\(([^)]*Scene[^)]*)\)\s*:', re.MULTILINE)
+    AUDIO_DURATIONS_PATTERN = re.compile(r'^AUDIO_DURATIONS\s*=', re.MULTILINE)
+    
+    def __init__(self, syntax_check_interval: int = 20):
+        """
+        Args:
+            syntax_check_interval: 每新增多少行完整代码做一次增量语法检查
+        """
+        self.text = ""
+        self.syntax_check_interval = syntax_check_interval
+        self._code_start: Optional[int] = None
+        self._code_end: Optional[int] = None
+        self._emitted = 0
+        self._checked_line_count = 0
+        self._syntax_line_count = 0
+    
+    @property
+    def code(self) -> str:
+        """当前已到达的代码（不含 markdown 标记）"""
+        if self._code_start is None:
+            return ""
+        end = self._code_end if self._code_end is not None else len(self.text)
+        return self.text[self._code_start:end]
+    
+    @property
+    def finished(self) -> bool:
+        """代码块是否已经结束（遇到闭合的 ```）"""
+        return self._code_end is not None
+    
+    def feed(self, chunk: str) -> str:
+        """
+        喂入新的文本分块
+        
+        Returns:
+            自上次调用以来新增的代码文本（可直接追加写入文件）
+        """
+        self.text += chunk
+        
+        if self._code_start is None:
+            fence = re.search(r'```[^\n]*\n', self.text)
+            if fence:
+                self._code_start = fence.end()
+            elif re.match(r'\s*(from |import |#)', self.text) and '\n' in self.text:
+                # 没有 markdown 代码块，直接输出代码
+                self._code_start = len(self.text) - len(self.text.lstrip())
+            else:
+                return ""
+        
+        if self._code_end is None:
+            closing = re.search(r'^```', self.text[self._code_start:], re.MULTILINE)
+            if closing:
+                self._code_end = self._code_start + closing.start()
+        
+        code = self.code
+        new_code = code[self._emitted:]
+        self._emitted = len(code)
+        return new_code
+    
+    def _complete_lines(self) -> str:
+        """已完整到达的代码行（截到最后一个换行）"""
+        code = self.code
+        if self.finished:
+            return code
+        return code[:code.rfind('\n') + 1]
+    
+    def check(self, final: bool = False) -> List[str]:
+        """
+        检查当前已到达的代码
+        
+        Args:
+            final: 是否为输出结束后的最终检查（要求代码完整可编译）
+        
+        Returns:
+            错误列表，空列表表示目前没有发现问题
+        """
+        code = self.code if final else self._complete_lines()
+        line_count = code.count('\n')
+        if not final and line_count == self._checked_line_count:
+            return []
+        self._checked_line_count = line_count
+        
+        errors = []
+        
+        forbidden = self.FORBIDDEN_IMPORT_PATTERN.search(code)
+        if forbidden:
+            errors.append(f"使用了错误的导入: {forbidden.group(1)}（必须使用 from manim import *）")
+        
+        scene_classes = self.SCENE_CLASS_PATTERN.findall(code)
+        if len(scene_classes) > 1:
+            names = ", ".join(name for name, _ in scene_classes)
+            errors.append(f"出现多个 Scene 类: {names}（只允许一个）")
+        
+        # AUDIO_DURATIONS 必须在类定义之前定义
+        first_class = re.search(r'^class\s', code, re.MULTILINE)
+        audio_durations = self.AUDIO_DURATIONS_PATTERN.search(code)
+        if first_class and (audio_durations is None or audio_durations.start() > first_class.start()):
+            errors.append("类定义之前没有定义 AUDIO_DURATIONS 字典")
+        
+        if final:
+            if not code.strip():
+                errors.append("没有生成任何代码")
+            elif not scene_classes:
+                errors.append("没有找到 Scene 类")
+            try:
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore")
+                    compile(code, '<string>', 'exec')
+            except SyntaxError as e:
+                errors.append(f"Python 语法错误: {e}")
+        elif line_count - self._syntax_line_count >= self.syntax_check_interval:
+            self._syntax_line_count = line_count
+            # compile_command 对「尚未写完」的输入返回 None，只有真正的语法错误才会抛出
+            try:
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore")
+                    codeop.compile_command(code, symbol="exec")
+            except SyntaxError as e:
+                errors.append(f"Python 语法错误（第 {e.lineno} 行附近）: {e.msg}")
+        
+        return errors
+
+
+class TTSTextValidator:
+    """TTS 文案验证器"""
+    
+    # 未转换干净的 LaTeX 标记
+    LATEX_RESIDUE_PATTERN = re.compile(r'[$\\^_{}]')
+    
+    @staticmethod
+    def validate(tts_text: Optional[str], narration: str = "") -> Tuple[bool, str]:
+        """
+        验证 TTS 文案是否可直接用于语音合成
+        返回 (是否有效, 错误信息)
+        """
+        if not isinstance(tts_text, str) or not tts_text.strip():
+            return False, "tts_text 缺失或为空"
+        
+        residue = TTSTextValidator.LATEX_RESIDUE_PATTERN.search(tts_text)
+        if residue:
+            return False, f"tts_text 中残留 LaTeX 标记: {residue.group(0)}"
+        
+        # 与去掉公式后的文字部分比较：公式读出来可能比 LaTeX 源码短得多（如 $\frac{\sqrt{a}}{b}$），
+        # 文字部分只会因口语化转写而变长，明显变短说明内容被截断或删减
+        prose = MATH_REGION_PATTERN.sub("", narration).strip() if narration else ""
+        if prose and len(tts_text.strip()) < len(prose) * 0.5:
+            return False, "tts_text 明显短于 narration，内容可能不完整"
+        
+        return True, ""
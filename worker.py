@@ -0,0 +1,112 @@
+"""公式教学视频生成系统 - 工作进程入口（多机共享任务队列）"""
+import os
+import signal
+import socket
+import asyncio
+import argparse
+from config import JOB_POLL_INTERVAL, OUTPUT_BASE_DIR, TEMP_BASE_DIR
+from main import run_queue_worker, print_queue_status
+from utils.job_queue import open_job_queue
+from utils.logger import get_logger
+from tools.tts_engine import get_tts_engine
+
+logger = get_logger(__name__)
+
+
+async def main() -> int:
+    """命令行入口"""
+    parser = argparse.ArgumentParser(
+        description="从共享任务队列领取并执行视频生成任务（每台机器启动一个或多个）",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+示例:
+  # 所有机器共用一个 Redis 队列，产物写到共享存储
+  JOB_QUEUE_URL=redis://queue-host:6379/0 OUTPUT_BASE_DIR=/mnt/shared/output TEMP_BASE_DIR=/mnt/shared/temp \\
+      uv run worker.py --max-concurrent 4 --follow
+
+  # 共享文件系统上的 SQLite 队列（需设置 JOB_QUEUE_SQLITE_WAL=false）
+  uv run worker.py --queue /mnt/shared/output/jobs.db --follow
+        """
+    )
+    parser.add_argument(
+        "--queue",
+        type=str,
+        metavar="URL",
+        default=None,
+        help="任务队列：SQLite 文件路径（或 sqlite:///路径）或 redis://host:6379/0，默认读取 JOB_QUEUE_URL / JOB_QUEUE_PATH"
+    )
+    parser.add_argument(
+        "--max-concurrent",
+        type=int,
+        default=3,
+        help="本进程同时执行的任务数，默认 3"
+    )
+    parser.add_argument(
+        "--follow",
+        action="store_true",
+        help="队列为空时不退出，持续等待新任务"
+    )
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=JOB_POLL_INTERVAL,
+        help=f"队列为空时的轮询间隔（秒），默认 {JOB_POLL_INTERVAL}"
+    )
+    parser.add_argument(
+        "--worker-id",
+        type=str,
+        default=None,
+        help="工作进程标识，默认为 \"主机名-进程号\""
+    )
+    args = parser.parse_args()
+
+    queue = open_job_queue(args.queue)
+    worker_id = args.worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    logger.info(f"工作进程 {worker_id}: 队列 {queue.db_path}，输出目录 {OUTPUT_BASE_DIR}，临时目录 {TEMP_BASE_DIR}")
+
+    # 收到 SIGTERM / SIGINT 后不再领取新任务，等待执行中的任务完成再退出；
+    # 再次收到信号则立即退出，未完成任务的租约到期后由其他工作进程重新领取
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+
+    def request_stop() -> None:
+        if stop_event.is_set():
+            logger.warning("再次收到退出信号，立即退出")
+            os._exit(1)
+        logger.info("收到退出信号，等待执行中的任务完成后退出（再次发送信号立即退出）")
+        stop_event.set()
+
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, request_stop)
+        except NotImplementedError:
+            # Windows 不支持 add_signal_handler，退回默认的 KeyboardInterrupt 行为
+            pass
+
+    counts = await run_queue_worker(
+        queue,
+        max_concurrent=args.max_concurrent,
+        worker_id=worker_id,
+        follow=args.follow,
+        poll_interval=args.poll_interval,
+        stop_event=stop_event
+    )
+    print(
+        f"\n工作进程结束: 完成 {counts['done']}，放回重试 {counts['retry']}，失败 {counts['failed']}，"
+        f"租约被接管 {counts['lost']}"
+    )
+    print_queue_status(queue)
+    return 1 if counts["failed"] else 0
+
+
+async def _run() -> int:
+    """运行工作进程，结束时释放共享资源"""
+    try:
+        return await main()
+    finally:
+        await get_tts_engine().close()
+
+
+if __name__ == "__main__":
+    exit_code = asyncio.run(_run())
+    exit(exit_code)